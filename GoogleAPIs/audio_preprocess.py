@@ -0,0 +1,171 @@
+import json
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+from instrumentation import stage
+
+TARGET_SAMPLE_RATE = 16000
+BLOCK_SECONDS = 10
+# Low-pass filter length used when downsampling
+RESAMPLE_TAPS = 63
+
+
+class AudioInfo:
+    """Format of a local audio file as found by probe_audio()."""
+
+    def __init__(self, path, codec, sample_rate, channels, duration, sample_width=2):
+        self.path = path
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.duration = duration
+        self.sample_width = sample_width
+
+    def __repr__(self):
+        return (f"AudioInfo({self.path!r}, codec={self.codec}, sample_rate={self.sample_rate}, "
+                f"channels={self.channels}, duration={self.duration:.2f}s)")
+
+
+class NormalizedAudio:
+    """16-bit mono PCM audio ready to be sent as LINEAR16 content."""
+
+    encoding = "LINEAR16"
+    channels = 1
+
+    def __init__(self, content, sample_rate_hertz, source):
+        self.content = content
+        self.sample_rate_hertz = sample_rate_hertz
+        self.source = source
+
+    @property
+    def duration(self):
+        return len(self.content) / 2 / self.sample_rate_hertz
+
+
+# Find the real format of the file instead of assuming 16000 / 44100 Hz
+def probe_audio(path):
+    """Returns an AudioInfo for path; WAV is read directly, anything else via ffprobe."""
+    try:
+        with wave.open(path, "rb") as wav_file:
+            return AudioInfo(path, "wav", wav_file.getframerate(), wav_file.getnchannels(),
+                             wav_file.getnframes() / wav_file.getframerate(), wav_file.getsampwidth())
+    except (wave.Error, EOFError):
+        pass
+
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries",
+         "stream=codec_name,sample_rate,channels:format=duration", "-of", "json", path],
+        check=True, capture_output=True,
+    ).stdout
+    probe = json.loads(output)
+    stream = probe["streams"][0]
+    return AudioInfo(path, stream.get("codec_name"), int(stream["sample_rate"]), int(stream["channels"]),
+                     float(probe.get("format", {}).get("duration", 0.0)))
+
+
+def iter_pcm_blocks(info, block_seconds=BLOCK_SECONDS):
+    """Yields float32 blocks of shape (frames, channels) in [-1, 1] at the native sample rate."""
+    block_frames = int(info.sample_rate * block_seconds)
+
+    if info.codec == "wav":
+        with wave.open(info.path, "rb") as wav_file:
+            while True:
+                data = wav_file.readframes(block_frames)
+                if not data:
+                    break
+                yield _pcm_to_float(data, wav_file.getsampwidth(), info.channels)
+        return
+
+    # Compressed formats are decoded by ffmpeg, keeping the native rate and channels
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", info.path, "-f", "s16le", "-"],
+        stdout=subprocess.PIPE,
+    )
+    try:
+        block_bytes = block_frames * info.channels * 2
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield _pcm_to_float(data[:len(data) - len(data) % (info.channels * 2)], 2, info.channels)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+def _pcm_to_float(data, sample_width, channels):
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8)
+                   | (raw[:, 2].astype(np.int8).astype(np.int32) << 16)).astype(np.float32) / 8388608
+    else:
+        dtype = np.int16 if sample_width == 2 else np.int32
+        samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / float(np.iinfo(dtype).max + 1)
+    return samples.reshape(-1, channels)
+
+
+class StreamingResampler:
+    """Block-wise resampler (low-pass FIR + linear interpolation) that keeps state between blocks."""
+
+    def __init__(self, source_rate, target_rate, taps=RESAMPLE_TAPS):
+        self.step = source_rate / target_rate
+        self.filter = None
+        if target_rate < source_rate:
+            # Windowed-sinc low-pass at the target Nyquist frequency to avoid aliasing
+            cutoff = 0.5 * target_rate / source_rate
+            n = np.arange(taps) - (taps - 1) / 2
+            self.filter = (2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)).astype(np.float32)
+            self.filter /= self.filter.sum()
+            self.history = np.zeros(taps - 1, dtype=np.float32)
+        self.tail = np.zeros(0, dtype=np.float32)
+        self.tail_start = 0      # index of tail[0] in the filtered signal
+        self.next_position = 0.0  # position of the next output sample in the filtered signal
+
+    def process(self, samples):
+        if self.step == 1.0:
+            return samples
+        if self.filter is not None:
+            padded = np.concatenate([self.history, samples])
+            samples = np.convolve(padded, self.filter, mode="valid").astype(np.float32)
+            self.history = padded[len(padded) - len(self.history):]
+
+        buffer = np.concatenate([self.tail, samples])
+        last = self.tail_start + len(buffer) - 1  # interpolation needs the sample after each position
+        count = max(0, int(np.ceil((last - self.next_position) / self.step)))
+        positions = self.next_position + self.step * np.arange(count)
+        index = np.floor(positions).astype(np.int64) - self.tail_start
+        fraction = (positions - np.floor(positions)).astype(np.float32)
+        output = buffer[index] * (1 - fraction) + buffer[index + 1] * fraction
+
+        self.next_position += self.step * count
+        keep_from = min(int(np.floor(self.next_position)) - self.tail_start, len(buffer))
+        self.tail = buffer[keep_from:]
+        self.tail_start += keep_from
+        return output
+
+
+def iter_linear16_blocks(info, target_rate=TARGET_SAMPLE_RATE, block_seconds=BLOCK_SECONDS):
+    """Yields the audio as 16-bit mono PCM bytes at target_rate, one block at a time."""
+    resampler = StreamingResampler(info.sample_rate, target_rate)
+    for block in iter_pcm_blocks(info, block_seconds):
+        mono = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+        resampled = resampler.process(mono)
+        yield (np.clip(resampled, -1.0, 1.0) * 32767).round().astype("<i2").tobytes()
+
+
+# Decode, downmix, resample and convert to LINEAR16 in memory, one block at a time
+def normalize_audio(path, target_rate=TARGET_SAMPLE_RATE, block_seconds=BLOCK_SECONDS):
+    """Returns NormalizedAudio with 16-bit mono PCM at target_rate, without temp files."""
+    with stage("convert", file=os.path.basename(path)) as record:
+        info = probe_audio(path)
+        content = bytearray()
+        for block in iter_linear16_blocks(info, target_rate, block_seconds):
+            content += block
+        record.add_bytes(len(content))
+
+    return NormalizedAudio(bytes(content), target_rate, info)
@@ -0,0 +1,187 @@
+import hashlib
+import mmap
+import os
+import struct
+
+from audio_preprocess import TARGET_SAMPLE_RATE, iter_linear16_blocks, probe_audio
+from gcs_cleanup import STAGING_PREFIX, cleanup
+from gcs_upload import upload_file, upload_stream
+from instrumentation import stage
+from transcript_cache import fingerprint_audio
+
+# RecognitionAudio.content is limited to 10 MB per request; larger audio goes by gs:// URI
+INLINE_MAX_BYTES = 10 * 1024 * 1024
+INLINE = "inline"
+URI = "uri"
+# Where audio over the inline limit is uploaded
+DEFAULT_BUCKET = os.environ.get("SPEECH2TEXT_BUCKET", "bangla_audio_files")
+UPLOAD_PREFIX = f"{STAGING_PREFIX}normalized/"
+
+
+class AudioSource:
+    """A byte range of a local file, memory-mapped for zero-copy reads.
+
+    view() and views() return memoryviews of the mapping, so hashing, numpy arrays and
+    chunked senders read the page cache directly instead of private copies. For
+    LINEAR16 sources sample_rate_hertz is set. With buffer (e.g. decoded audio) the
+    source reads that instead of the file.
+    """
+
+    def __init__(self, path, offset=0, length=None, sample_rate_hertz=None, buffer=None):
+        self.path = path
+        self.sample_rate_hertz = sample_rate_hertz
+        self._file = None
+        self._map = None
+        if buffer is not None:
+            view = memoryview(buffer)
+        else:
+            self._file = open(path, "rb")
+            view = memoryview(b"")
+            if os.fstat(self._file.fileno()).st_size:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(self._map)
+        self._view = view[offset:offset + length if length is not None else None]
+        self.size = len(self._view)
+
+    @property
+    def duration(self):
+        if self.sample_rate_hertz:
+            return self.size / 2 / self.sample_rate_hertz
+        return probe_audio(self.path).duration
+
+    def view(self, start=0, end=None):
+        """Returns a memoryview of bytes [start, end) without copying."""
+        return self._view[start:end]
+
+    def views(self, chunk_bytes):
+        """Yields consecutive memoryviews of at most chunk_bytes."""
+        for start in range(0, self.size, chunk_bytes):
+            yield self._view[start:start + chunk_bytes]
+
+    def sha256(self):
+        return hashlib.sha256(self._view).hexdigest()
+
+    def close(self):
+        try:
+            self._view.release()
+            if self._map is not None:
+                self._map.close()
+        except BufferError:
+            pass  # a caller still holds a view; the mapping goes away with it
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _wav_data_range(path):
+    """Returns (offset, length) of the sample data in a RIFF/WAVE file."""
+    with open(path, "rb") as wav_file:
+        riff, _, wave_id = struct.unpack("<4sI4s", wav_file.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        while True:
+            header = wav_file.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"data":
+                return wav_file.tell(), chunk_size
+            wav_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def linear16_size(info, target_rate=TARGET_SAMPLE_RATE):
+    """Bytes of 16-bit mono PCM at target_rate for audio described by an AudioInfo."""
+    return int(info.duration * target_rate) * 2
+
+
+# Decide before decoding anything whether the audio can be sent inline
+def choose_submission(info, target_rate=TARGET_SAMPLE_RATE, limit=INLINE_MAX_BYTES):
+    """Returns INLINE if the normalized audio fits in one request, URI otherwise."""
+    return INLINE if linear16_size(info, target_rate) <= limit else URI
+
+
+def _is_linear16_wav(info, target_rate):
+    return info.codec == "wav" and info.channels == 1 and info.sample_width == 2 and info.sample_rate == target_rate
+
+
+def open_linear16(path, target_rate=TARGET_SAMPLE_RATE, info=None):
+    """Returns an AudioSource of 16-bit mono PCM at target_rate for path.
+
+    WAV files that are already 16-bit mono at target_rate are mapped as they are (just
+    the data chunk). Anything else is decoded into memory, which suits inline requests
+    and the short recordings of silence_chunking; audio sent by URI goes through
+    upload_linear16 instead, which never holds the whole recording.
+    """
+    info = info or probe_audio(path)
+    if _is_linear16_wav(info, target_rate):
+        offset, length = _wav_data_range(path)
+        return AudioSource(path, offset, length, target_rate)
+
+    with stage("convert", file=os.path.basename(path)) as record:
+        content = bytearray()
+        for block in iter_linear16_blocks(info, target_rate):
+            content += block
+        record.add_bytes(len(content))
+    return AudioSource(path, sample_rate_hertz=target_rate, buffer=content)
+
+
+# Identify the request before anything is decoded or uploaded, so the journal can be checked first
+def linear16_key(path, target_rate=TARGET_SAMPLE_RATE):
+    """Returns the job journal key of path's audio sent as LINEAR16 at target_rate."""
+    return f"sha256:{fingerprint_audio(path)}@{target_rate}"
+
+
+def upload_name(path, target_rate=TARGET_SAMPLE_RATE, info=None):
+    """Returns the blob name upload_linear16 uses for path; the same recording always gets the same name."""
+    info = info or probe_audio(path)
+    # A mapped WAV is uploaded whole; its header matches the LINEAR16 config
+    extension = ".wav" if _is_linear16_wav(info, target_rate) else ".pcm"
+    return f"{UPLOAD_PREFIX}{fingerprint_audio(path)[:32]}-{target_rate}{extension}"
+
+
+def upload_linear16(path, bucket_name=DEFAULT_BUCKET, target_rate=TARGET_SAMPLE_RATE, info=None):
+    """Uploads path as 16-bit mono PCM at target_rate; returns the blob name.
+
+    Anything but a matching WAV is piped from the decoder straight into the upload, one
+    block at a time, so nothing is written to local disk.
+    """
+    info = info or probe_audio(path)
+    blob_name = upload_name(path, target_rate, info)
+    if _is_linear16_wav(info, target_rate):
+        upload_file(bucket_name, path, blob_name)
+        size = os.path.getsize(path)
+    else:
+        size = upload_stream(bucket_name, lambda: iter_linear16_blocks(info, target_rate), blob_name,
+                             content_type="audio/l16")
+    print(f"Uploaded {size / 1e6:.1f} MB of audio to gs://{bucket_name}/{blob_name} for URI submission")
+    return blob_name
+
+
+# Build RecognitionAudio for the v1 / v1p1beta1 APIs, inline or by URI
+def recognition_audio(speech, path, submission=None, bucket_name=DEFAULT_BUCKET, target_rate=TARGET_SAMPLE_RATE,
+                      info=None):
+    """Returns (RecognitionAudio, uploaded blob name or None) for path as LINEAR16 at target_rate.
+
+    Inline audio costs one copy of the bytes (the request needs its own); audio over
+    INLINE_MAX_BYTES is uploaded with upload_linear16 and referenced by its gs:// URI.
+    """
+    info = info or probe_audio(path)
+    submission = submission or choose_submission(info, target_rate)
+    if submission == INLINE:
+        with open_linear16(path, target_rate, info) as source:
+            if source.size <= INLINE_MAX_BYTES:
+                return speech.RecognitionAudio(content=bytes(source.view())), None
+
+    blob_name = upload_linear16(path, bucket_name, target_rate, info)
+    return speech.RecognitionAudio(uri=f"gs://{bucket_name}/{blob_name}"), blob_name
+
+
+def remove_uploaded(blob_name, bucket_name=DEFAULT_BUCKET):
+    """Deletes audio uploaded by recognition_audio, if any."""
+    if blob_name:
+        cleanup(bucket_name, [blob_name])
@@ -1,199 +1,382 @@
-from google.cloud import speech_v2 as speech
 from google.cloud.speech_v2.types import cloud_speech
-from google.cloud import storage
-import json
+from google_clients import get_speech_client, get_storage_client
+from gcs_results import extract_words, fetch_results_from_uri, job_output_dir, read_response_results, result_uri
+from gcs_cleanup import cleanup
+from gcs_upload import upload_file
+from inline_recognition import INLINE, SYNC, choose_result_path_for_file, inline_output_config, recognize_file
+from instrumentation import metrics, stage
+from job_tracker import get_tracker
+from recognizers import recognizer_manager
+from transcript_cache import fingerprint_audio, get_default_cache
 import os
+import re
+import sys
+import time
 from urllib.parse import urlparse
 
+# BatchRecognizeRequest accepts at most 15 files per request
+MAX_FILES_PER_BATCH = 15
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a", ".amr")
+
+# Chirp_2 recognizer settings (use "eu" as the location for European Union)
+PROJECT_ID = "woven-century-448009-r7"
+LOCATION = "us-central1"
+RECOGNIZER_ID = "bangla-recognizer-2"
+PARENT = f"projects/{PROJECT_ID}/locations/{LOCATION}"
+BACKEND = "chirp-2"
+
 
 # upload audio file to Google Storage
 def upload_to_gcs(bucket_name, source_file_name, destination_blob_name):
     """Uploads a file to Google Cloud Storage."""
-    storage_client = storage.Client.from_service_account_json('service-account.json')
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
+    # Large files are uploaded as parallel, resumable parts
+    upload_file(bucket_name, source_file_name, destination_blob_name)
     print(f"File {source_file_name} uploaded to GCS as {destination_blob_name}.")
 
 
 # Exitiong file delete from Google Storage
-def delete_files_from_gcs(bucket_name, folder_path):
-    """Deletes all files in a folder from Google Cloud Storage."""
-    storage_client = storage.Client.from_service_account_json('service-account.json')
-    bucket = storage_client.bucket(bucket_name)
-    
-    # List all files in the folder
-    blobs = bucket.list_blobs(prefix=folder_path)
-    
-    # Delete each file
-    for blob in blobs:
-        blob.delete()
-        print(f"Deleted file from GCS: gs://{bucket_name}/{blob.name}")
-
-
-# Download specific JSON file from GCS and save clean transcript to TXT locally
-def download_transcription_and_save_to_txt(bucket_name, gcs_json_dir, output_txt_filename):
-    """Downloads specific JSON result from GCS and saves clean transcript to TXT"""
-    storage_client = storage.Client.from_service_account_json('service-account.json')
-    bucket = storage_client.bucket(bucket_name)
-    
-    # Ensure the GCS directory path ends with a slash
-    if not gcs_json_dir.endswith("/"):
-        gcs_json_dir += "/"
-    
-    # List all JSON files in the GCS directory
-    blobs = list(bucket.list_blobs(prefix=gcs_json_dir))
-    if not blobs:
-        print(f"No JSON files found in gs://{bucket_name}/{gcs_json_dir}")
-        return
-
-    # Find the first JSON file in the directory
-    json_blob = None
-    for blob in blobs:
-        if blob.name.endswith(".json"):
-            json_blob = blob
-            break
-    
-    if not json_blob:
-        print(f"No JSON files found in gs://{bucket_name}/{gcs_json_dir}")
-        return
-
-    # Download the JSON file locally
-    local_json_path = os.path.basename(json_blob.name)
-    json_blob.download_to_filename(local_json_path)
-    print(f"Downloaded JSON file: {local_json_path}")
+def delete_files_from_gcs(bucket_name, paths, mode=None):
+    """Deletes files from Google Cloud Storage.
+
+    paths is a folder prefix, or a list of object names and folder prefixes (ending
+    in "/"). Deletes are batched and, by default, done by a background sweeper.
+    """
+    if isinstance(paths, str):
+        names, prefixes = [], [paths]
+    else:
+        names = [path for path in paths if not path.endswith("/")]
+        prefixes = [path for path in paths if path.endswith("/")]
+    cleanup(bucket_name, names, prefixes, mode)
 
+
+# Build a clean transcript from a batch_recognize JSON result and save it to TXT
+@stage("postprocess", backend=BACKEND)
+def save_clean_transcript(results, output_txt_filename):
+    """Joins the transcripts of the result entries and saves the cleaned text."""
     full_transcript = []   # final transcriptions
-    
+
+    for result in results:
+        for alternative in result.get("alternatives", []):
+            transcript = alternative.get("transcript", "").strip()
+            if transcript:
+                full_transcript.append(transcript)
+
+    # Join transcripts while maintaining order
+    final_transcript = " ".join(full_transcript)
+
+    # Clean up punctuation using regex
+    final_transcript = re.sub(r'\s+([.,!?])', r'\1', final_transcript)
+    final_transcript = re.sub(r'\s+', ' ', final_transcript)
+
+    # Capitalize first letter and add final punctuation; silence or no speech saves an
+    # empty transcript, as in chirpModel.py and google_speech_api_v2.py
+    if final_transcript:
+        final_transcript = final_transcript[0].upper() + final_transcript[1:]
+        if final_transcript[-1] not in {'.', '!', '?'}:
+            final_transcript += '.'
+
+    # Save to text file
+    with open(output_txt_filename, "w", encoding="utf-8") as txt_file:
+        txt_file.write(final_transcript)
+
+    print(f"Clean transcription saved to {output_txt_filename}")
+    return final_transcript
+
+
+# Download the JSON results that batch_recognize reported for some input files
+def download_results(response, gcs_uris):
+    """Reads the results of gcs_uris from a BatchRecognizeResponse and returns their
+    result entries in the order of gcs_uris. Nothing is listed.
+
+    Inline results come from the response itself; result objects in GCS are read in
+    parallel, streamed and parsed while downloading, and never written to disk.
+    """
+    if isinstance(gcs_uris, str):
+        gcs_uris = [gcs_uris]
+    shards = read_response_results(response, gcs_uris)
+    print(f"Read results for {len(gcs_uris)} file(s)")
+    return [result for shard in shards for result in shard]
+
+
+# Download the JSON results from GCS and save clean transcript to TXT locally
+def download_transcription_and_save_to_txt(response, gcs_uri, output_txt_filename):
+    """Downloads the JSON result reported for gcs_uri and saves clean transcript to TXT"""
     try:
-        with open(local_json_path, "r", encoding="utf-8") as json_file:
-            data = json.load(json_file)
-            
-            for result in data.get("results", []):
-                for alternative in result.get("alternatives", []):
-                    transcript = alternative.get("transcript", "").strip()
-                    if transcript:
-                        full_transcript.append(transcript)
-        
-        # Join transcripts while maintaining order
-        final_transcript = " ".join(full_transcript)
-        
-        # Clean up punctuation using regex
-        import re
-        final_transcript = re.sub(r'\s+([.,!?])', r'\1', final_transcript)
-        final_transcript = re.sub(r'\s+', ' ', final_transcript)
-        
-        # Capitalize first letter and add final punctuation
-        if final_transcript:
-            final_transcript = final_transcript[0].upper() + final_transcript[1:]
-            if final_transcript[-1] not in {'.', '!', '?'}:
-                final_transcript += '.'
-        else:
-            final_transcript = "No transcription found."
-        
-        # Save to text file
-        with open(output_txt_filename, "w", encoding="utf-8") as txt_file:
-            txt_file.write(final_transcript)
-            
-        print(f"Clean transcription saved to {output_txt_filename}")
+        return save_clean_transcript(download_results(response, gcs_uri), output_txt_filename)
 
     except Exception as e:
         print(f"Error processing JSON file: {e}")
 
-    finally:
-        # Clean up: Delete the downloaded JSON file
-        if os.path.exists(local_json_path):
-            os.remove(local_json_path)
-            print(f"Deleted local JSON file: {local_json_path}")
 
-# Transcribe long audio file using Chirp model
-def transcribe_long_audio(gcs_uri, bucket_name):
-    # Set the correct region for Chirp_2 (e.g., "us" or "eu")
-    location = "us-central1"  # Use "eu" for European Union
-
-    # Initialize the client with the REGIONAL ENDPOINT
-    client = speech.SpeechClient.from_service_account_file(
-        'service-account.json',
-        client_options={"api_endpoint": f"{location}-speech.googleapis.com"}
+# Chirp_2 recognition settings, shared by the batch and synchronous requests
+def build_recognition_config():
+    return cloud_speech.RecognitionConfig(
+        auto_decoding_config={},
+        language_codes=["bn-BD"],
+        model="chirp_2",
+        features=cloud_speech.RecognitionFeatures(
+            enable_automatic_punctuation=True,
+            enable_word_time_offsets=True,
+            # enable_spoken_punctuation=True
+        )
     )
-    
-    project_id = "woven-century-448009-r7"
-    recognizer_id = "bangla-recognizer-2"
-    parent = f"projects/{project_id}/locations/{location}"
-    recognizer_name = f"{parent}/recognizers/{recognizer_id}"
-    
-    try:
-        # Create/Get recognizer with Chirp model
-        try:
-            recognizer = client.get_recognizer(name=recognizer_name)
-        except:
-            recognizer = client.create_recognizer(
-                parent=parent,
-                recognizer_id=recognizer_id,
-                recognizer={
-                    "language_codes": ["bn-BD"],
-                    "model": "chirp_2",
-                    "default_recognition_config": {
-                        "auto_decoding_config": {},
-                        "features": {
-                            "enable_automatic_punctuation": True,
-                            "enable_word_time_offsets": True
-                        }
-                    }
-                }
-            )
 
-        output_dir = "transcription_results/"
-        # Output configuration
+
+# Configure the request for Chirp model over one or more GCS files
+def build_batch_request(recognizer_name, gcs_uris, output_uri):
+    """Builds a BatchRecognizeRequest that writes its results under output_uri, or
+    returns them inline in the operation response if output_uri is None."""
+    if output_uri is None:
+        output_config = inline_output_config()
+    else:
         output_config = cloud_speech.RecognitionOutputConfig(
-            gcs_output_config=cloud_speech.GcsOutputConfig(
-                uri=f"gs://{bucket_name}/{output_dir}"
-            )
+            gcs_output_config=cloud_speech.GcsOutputConfig(uri=output_uri)
         )
+    return cloud_speech.BatchRecognizeRequest(
+        recognizer=recognizer_name,
+        config=build_recognition_config(),
+        files=[{"uri": gcs_uri} for gcs_uri in gcs_uris],
+        recognition_output_config=output_config
+    )
 
-        # Configure the request for Chirp model and transcribe
-        request = cloud_speech.BatchRecognizeRequest(
-            recognizer=recognizer_name,
-            config=cloud_speech.RecognitionConfig(
-                auto_decoding_config={},
-                language_codes=["bn-BD"],
-                model="chirp_2",
-                features=cloud_speech.RecognitionFeatures(
-                    enable_automatic_punctuation=True,
-                    enable_word_time_offsets=True,
-                    # enable_spoken_punctuation=True
-                )
-            ),
-            files=[{"uri": gcs_uri}],
-            recognition_output_config=output_config
-        )
 
-        print("Processing audio with Chirp model...")
-        operation = client.batch_recognize(request=request)
-        operation.result(timeout=3600)
+# Run batch_recognize for one GCS file and wait for its JSON results
+def recognize_to_gcs(gcs_uri, bucket_name, output_dir=None, inline=False):
+    """Transcribes gcs_uri with Chirp_2 and writes the JSON result under output_dir
+    (a new folder for this job by default).
+
+    With inline=True nothing is written to GCS and the results are returned in the
+    operation response instead. Returns the finished TrackedOperation; its result()
+    is the BatchRecognizeResponse for download_results(). Pass it to
+    get_tracker().mark_collected() once the results are read.
+    """
+    # Shared client on the REGIONAL ENDPOINT
+    client = get_speech_client(location=LOCATION)
+    output_uri = None
+    if not inline:
+        if output_dir is None:
+            output_dir = job_output_dir(gcs_uri)
+        output_uri = f"gs://{bucket_name}/{output_dir}"
+
+    print("Processing audio with Chirp model...")
+    # The operation is journaled, so after a crash the same request resumes it instead of resubmitting
+    tracked = get_tracker().submit(
+        BACKEND, gcs_uri,
+        # The recognizer is resolved once and cached; it is only looked up again if missing
+        lambda: recognizer_manager.run(
+            client, PARENT, RECOGNIZER_ID, "chirp_2",
+            lambda recognizer_name: client.batch_recognize(
+                request=build_batch_request(recognizer_name, [gcs_uri], output_uri)
+            )
+        ),
+        output_prefix=output_uri, location=LOCATION, client=client,
+    )
+    tracked.result(timeout=3600)
+    return tracked
+
+
+# Transcribe long audio file using Chirp model
+def transcribe_long_audio(gcs_uri, bucket_name, inline=False):
+    """Transcribes gcs_uri and returns (transcript, word timings), or None on error."""
+    try:
+        tracked = recognize_to_gcs(gcs_uri, bucket_name, inline=inline)
+        response = tracked.result()
 
         parsed_uri = urlparse(gcs_uri)
         base_name = os.path.splitext(os.path.basename(parsed_uri.path))[0]
         output_txt_filename = f"{base_name}_chirp2_transcript.txt"
 
         # Download and save the transcription
-        download_transcription_and_save_to_txt(bucket_name, output_dir, output_txt_filename)
+        results = download_results(response, gcs_uri)
+        transcript = save_clean_transcript(results, output_txt_filename)
+        get_tracker().mark_collected(tracked)
+
+        # Delete the audio file and this job's output folder (if any), off the request path
+        paths = [parsed_uri.path.lstrip("/")]  # Remove leading slash
+        if tracked.job["output_prefix"]:
+            paths.append(urlparse(tracked.job["output_prefix"]).path.lstrip("/"))
+        delete_files_from_gcs(bucket_name, paths)
+
+        return transcript, extract_words(results)
 
-        # Delete the audio file and all JSON files in the transcription_results folder
-        audio_file_path = parsed_uri.path.lstrip("/")  # Remove leading slash
-        delete_files_from_gcs(bucket_name, [audio_file_path])  # Delete audio file
-        delete_files_from_gcs(bucket_name, [output_dir])  # Delete all JSON files in the folder
+    except Exception as e:
+        print(f"Transcription error: {str(e)}")
+
+
+# Transcribe a local recording, skipping GCS for short audio
+def transcribe_audio_file(input_file, bucket_name, destination_blob_name):
+    """Transcribes input_file and returns (transcript, word timings), or None on error.
+
+    Clips short enough for recognize() are sent inline and nothing touches GCS. Longer
+    files are uploaded; up to INLINE_MAX_SECONDS their results come back in the
+    operation response, beyond that they are written to and read from GCS.
+    """
+    result_path = choose_result_path_for_file(input_file)
+    if result_path != SYNC:
+        upload_to_gcs(bucket_name, input_file, destination_blob_name)
+        return transcribe_long_audio(f"gs://{bucket_name}/{destination_blob_name}", bucket_name,
+                                     inline=result_path == INLINE)
+
+    try:
+        client = get_speech_client(location=LOCATION)
+        print("Processing short audio inline with Chirp model...")
+        results = recognizer_manager.run(
+            client, PARENT, RECOGNIZER_ID, "chirp_2",
+            lambda recognizer_name: recognize_file(client, recognizer_name, build_recognition_config(),
+                                                   input_file, BACKEND)
+        )
+        base_name = os.path.splitext(os.path.basename(destination_blob_name))[0]
+        transcript = save_clean_transcript(results, f"{base_name}_chirp2_transcript.txt")
+        return transcript, extract_words(results)
 
     except Exception as e:
         print(f"Transcription error: {str(e)}")
 
 
+# Transcribe a local recording, reusing the stored result for identical audio
+def transcribe_local_file(input_file, bucket_name, destination_blob_name, cache=None):
+    """Uploads and transcribes input_file unless the same audio was already transcribed
+    with the same settings; returns the cache entry {"transcript", "words", ...}."""
+    if cache is None:
+        cache = get_default_cache()
+    key = cache.key_for_file(input_file, "google-v2", "chirp_2", "bn-BD",
+                             automatic_punctuation=True, word_time_offsets=True)
+
+    entry = cache.get(key)
+    if entry is not None:
+        base_name = os.path.splitext(os.path.basename(destination_blob_name))[0]
+        output_txt_filename = f"{base_name}_chirp2_transcript.txt"
+        with open(output_txt_filename, "w", encoding="utf-8") as txt_file:
+            txt_file.write(entry["transcript"])
+        print(f"Cached transcription of {input_file} saved to {output_txt_filename}")
+        return entry
+
+    outcome = transcribe_audio_file(input_file, bucket_name, destination_blob_name)
+    if outcome is not None:
+        return cache.put(key, *outcome)
+
+
+# Collect local recordings from a list of paths and/or directories
+def list_recordings(paths):
+    """Expands directories into the audio files they contain, keeping the order stable."""
+    if isinstance(paths, str):
+        paths = [paths]
+
+    recordings = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    recordings.append(os.path.join(path, name))
+        else:
+            recordings.append(path)
+    return recordings
+
+
+# Upload many local recordings to GCS
+def upload_recordings(bucket_name, recordings, destination_prefix, storage_client=None):
+    """Uploads recordings under destination_prefix and returns {gcs_uri: local_path}.
+
+    Blob names start with a hash of the content, so recordings with the same file name
+    from different folders do not overwrite each other, while a rerun reuses the same
+    URIs (and so resumes their journaled operations).
+    """
+    if storage_client is None:
+        storage_client = get_storage_client()
+
+    uploaded = {}
+    for source_file_name in recordings:
+        content_hash = fingerprint_audio(source_file_name)[:16]
+        destination_blob_name = (f"{destination_prefix.rstrip('/')}/{content_hash}-"
+                                 f"{os.path.basename(source_file_name)}")
+        upload_file(bucket_name, source_file_name, destination_blob_name, storage_client)
+        print(f"File {source_file_name} uploaded to GCS as {destination_blob_name}.")
+        uploaded[f"gs://{bucket_name}/{destination_blob_name}"] = source_file_name
+    return uploaded
+
+
+# Download one per-file JSON result (reported by batch_recognize) and save it to TXT
+def download_result_and_save_to_txt(result_uri, output_txt_filename, storage_client=None):
+    """Reads the result object at result_uri directly, without listing the bucket."""
+    if storage_client is None:
+        storage_client = get_storage_client()
+    return save_clean_transcript(fetch_results_from_uri(result_uri, storage_client), output_txt_filename)
+
+
+# Transcribe many GCS files with as few batch_recognize operations as possible
+def transcribe_batch(gcs_uris, bucket_name, client=None, storage_client=None, timeout=3600):
+    """Transcribes gcs_uris in groups of MAX_FILES_PER_BATCH.
+
+    All operations are submitted before any of them is awaited, so the groups run
+    concurrently on the service side. Returns {gcs_uri: output_txt_filename} for the
+    files that succeeded and {gcs_uri: error message} for the ones that failed.
+    """
+    if client is None:
+        client = get_speech_client(location=LOCATION)
+    if storage_client is None:
+        storage_client = get_storage_client()
+
+    tracker = get_tracker()
+    operations = []
+    for start in range(0, len(gcs_uris), MAX_FILES_PER_BATCH):
+        group = gcs_uris[start:start + MAX_FILES_PER_BATCH]
+        # Each batch writes to its own folder; results are found through the response
+        output_uri = f"gs://{bucket_name}/{job_output_dir(group[0])}"
+        # One tracker loop polls every group; a rerun after a crash resumes the journaled groups
+        tracked = tracker.submit(
+            BACKEND, "\n".join(group),
+            lambda: recognizer_manager.run(
+                client, PARENT, RECOGNIZER_ID, "chirp_2",
+                lambda recognizer_name: client.batch_recognize(
+                    request=build_batch_request(recognizer_name, group, output_uri)
+                )
+            ),
+            output_prefix=output_uri, location=LOCATION, client=client,
+        )
+        operations.append((group, tracked))
+    print(f"Submitted {len(gcs_uris)} files in {len(operations)} Chirp batch operations...")
+
+    transcripts = {}
+    errors = {}
+    deadline = time.monotonic() + timeout
+    for group, tracked in operations:
+        try:
+            response = tracked.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            for gcs_uri in group:
+                errors[gcs_uri] = str(e)
+            continue
+
+        # Map each per-file result back to its source recording
+        for gcs_uri in group:
+            base_name = os.path.splitext(os.path.basename(urlparse(gcs_uri).path))[0]
+            output_txt_filename = f"{base_name}_chirp2_transcript.txt"
+            try:
+                download_result_and_save_to_txt(result_uri(response, gcs_uri), output_txt_filename, storage_client)
+                transcripts[gcs_uri] = output_txt_filename
+            except Exception as e:
+                errors[gcs_uri] = str(e)
+        if not any(gcs_uri in errors for gcs_uri in group):
+            tracker.mark_collected(tracked)
+
+    for gcs_uri, error in errors.items():
+        print(f"Transcription error for {gcs_uri}: {error}")
+    return transcripts, errors
+
+
 # main function
 if __name__ == "__main__":
-    input_file = "butter4.mp3"
     bucket_name = "bangla_audio_files"
-    destination_blob_name = "call_files/call_recordings/transcripted_output.mp3"
-    
-    upload_to_gcs(bucket_name, input_file, destination_blob_name)
-    gcs_uri = f"gs://{bucket_name}/{destination_blob_name}"
-    transcribe_long_audio(gcs_uri, bucket_name)
+
+    if len(sys.argv) > 1:
+        # Batch mode: python chirp2model.py <file-or-directory> [...]
+        recordings = list_recordings(sys.argv[1:])
+        uploaded = upload_recordings(bucket_name, recordings, "call_files/call_recordings/")
+        transcribe_batch(list(uploaded), bucket_name)
+    else:
+        input_file = "butter4.mp3"
+        destination_blob_name = "call_files/call_recordings/transcripted_output.mp3"
+
+        transcribe_local_file(input_file, bucket_name, destination_blob_name)
+
+    metrics.print_summary()
@@ -0,0 +1,166 @@
+import atexit
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gcs_results import RESULTS_ROOT
+from google_clients import get_storage_client
+from instrumentation import stage
+from quota_scheduler import get_scheduler
+
+# GCS accepts up to 100 calls in one batch request
+DELETE_BATCH_SIZE = 100
+CLEANUP_WORKERS = 8
+# "now" deletes on the request path, "background" hands deletes to the sweeper thread,
+# "lifecycle" leaves objects under LIFECYCLE_PREFIXES to a bucket lifecycle rule (see ensure_lifecycle_rule)
+CLEANUP_MODE = os.environ.get("SPEECH2TEXT_CLEANUP_MODE", "background")
+LIFECYCLE_AGE_DAYS = 1
+# Folders only this tool writes to; audio it uploads for its own use is staged under STAGING_PREFIX
+STAGING_PREFIX = "speech2text_staging/"
+LIFECYCLE_PREFIXES = (RESULTS_ROOT, STAGING_PREFIX)
+
+
+def _delete_batch(storage_client, bucket, names):
+    # Missing objects are not an error: they may have been cleaned up already
+    def send():
+        with storage_client.batch(raise_exception=False):
+            for name in names:
+                bucket.blob(name).delete()
+    get_scheduler().call("storage", send)
+
+
+def delete_objects(bucket_name, names=(), prefixes=(), storage_client=None, workers=CLEANUP_WORKERS):
+    """Deletes exact object names and everything under prefixes; returns the number of objects.
+
+    Deletes are sent as batch requests of up to DELETE_BATCH_SIZE calls, several batches
+    at a time.
+    """
+    if storage_client is None:
+        storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+
+    with stage("cleanup", bucket=bucket_name):
+        targets = list(dict.fromkeys(names))
+        for prefix in prefixes:
+            listed = get_scheduler().call("storage", lambda: [blob.name for blob in bucket.list_blobs(prefix=prefix)])
+            targets.extend(listed)
+        targets = list(dict.fromkeys(targets))
+
+        batches = [targets[start:start + DELETE_BATCH_SIZE] for start in range(0, len(targets), DELETE_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as executor:
+            list(executor.map(lambda batch: _delete_batch(storage_client, bucket, batch), batches))
+    return len(targets)
+
+
+class CleanupSweeper:
+    """Background thread that performs deferred deletes off the request path.
+
+    Requests queued while a sweep is running are merged per bucket into the next one.
+    Anything still queued is deleted when the interpreter exits.
+    """
+
+    def __init__(self, workers=CLEANUP_WORKERS):
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def defer(self, bucket_name, names=(), prefixes=()):
+        """Queues objects and prefixes for deletion and returns immediately."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        self._queue.put((bucket_name, list(names), list(prefixes)))
+
+    def flush(self):
+        """Blocks until every queued delete has been performed."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            merged = {}
+            for bucket_name, names, prefixes in pending:
+                entry = merged.setdefault(bucket_name, ([], []))
+                entry[0].extend(names)
+                entry[1].extend(prefixes)
+            for bucket_name, (names, prefixes) in merged.items():
+                try:
+                    count = delete_objects(bucket_name, names, prefixes, workers=self.workers)
+                    print(f"Cleaned up {count} object(s) from gs://{bucket_name}")
+                except Exception as e:
+                    print(f"Cleanup error for gs://{bucket_name}: {e}")
+            for _ in pending:
+                self._queue.task_done()
+
+
+_sweeper = CleanupSweeper()
+_lifecycle_covered = {}
+_lifecycle_lock = threading.Lock()
+
+
+def ensure_lifecycle_rule(bucket_name, prefixes, age_days=LIFECYCLE_AGE_DAYS, storage_client=None):
+    """Adds a rule deleting objects under prefixes after age_days, for the prefixes that no
+    existing Delete rule covers yet. Returns the prefixes that were added."""
+    if storage_client is None:
+        storage_client = get_storage_client()
+    scheduler = get_scheduler()
+    bucket = scheduler.call("storage", lambda: storage_client.get_bucket(bucket_name))
+    covered = set()
+    for rule in bucket.lifecycle_rules:
+        if rule.get("action", {}).get("type") == "Delete":
+            covered.update(rule.get("condition", {}).get("matchesPrefix", []))
+    missing = sorted(set(prefixes) - covered)
+    if missing:
+        bucket.add_lifecycle_delete_rule(age=age_days, matches_prefix=missing)
+        scheduler.call("storage", bucket.patch)
+        print(f"Added lifecycle rule to gs://{bucket_name}: delete {', '.join(missing)} after {age_days} day(s)")
+    return missing
+
+
+def _lifecycle_prefix(path):
+    return next((prefix for prefix in LIFECYCLE_PREFIXES if path.startswith(prefix)), None)
+
+
+# Remove a job's audio and results without making the caller wait
+def cleanup(bucket_name, names=(), prefixes=(), mode=None):
+    """Deletes objects according to mode ("now", "background" or "lifecycle").
+
+    In "lifecycle" mode objects under LIFECYCLE_PREFIXES are left to a lifecycle rule,
+    set up once per prefix, e.g. the per-job result folders are covered by one rule on
+    "transcription_results/". Rules are never added for other folders, which may hold
+    objects that are not ours; source audio there is deleted in the background instead.
+    """
+    mode = mode or CLEANUP_MODE
+    if mode == "now":
+        delete_objects(bucket_name, names, prefixes)
+    elif mode == "background":
+        _sweeper.defer(bucket_name, names, prefixes)
+    elif mode == "lifecycle":
+        other_names = [name for name in names if _lifecycle_prefix(name) is None]
+        other_prefixes = [prefix for prefix in prefixes if _lifecycle_prefix(prefix) is None]
+        if other_names or other_prefixes:
+            _sweeper.defer(bucket_name, other_names, other_prefixes)
+        folders = {_lifecycle_prefix(path) for path in list(names) + list(prefixes)} - {None}
+        with _lifecycle_lock:
+            covered = _lifecycle_covered.setdefault(bucket_name, set())
+            if folders <= covered:
+                return
+            ensure_lifecycle_rule(bucket_name, folders)
+            covered.update(folders)
+    else:
+        raise ValueError(f"Unknown cleanup mode {mode!r}")
+
+
+def flush_cleanup():
+    """Waits for deferred deletes to finish."""
+    _sweeper.flush()
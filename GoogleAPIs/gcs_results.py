@@ -0,0 +1,235 @@
+import codecs
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from google_clients import get_storage_client
+from instrumentation import stage
+from quota_scheduler import get_scheduler
+
+DOWNLOAD_WORKERS = 8
+READ_CHUNK_SIZE = 256 * 1024
+# batch_recognize output goes under a fresh folder per job, below this root
+RESULTS_ROOT = "transcription_results/"
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+class _StreamReader:
+    """Incremental reader over a UTF-8 JSON byte stream, refilled on demand."""
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        # Drop what was already consumed so the buffer only holds the current value
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        chunk = self.stream.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer += self.text_decoder.decode(chunk or b"", final=self.eof)
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ("" at the end)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise JSONStreamError(f"Expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value, reading more input until it is available."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow reads with the buffer so a large value is not re-parsed too often
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+
+def iter_results(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yields the entries of the top-level "results" array of a result document one by one.
+
+    Only one result is held in memory at a time, so very large result shards are
+    never parsed as a whole document.
+    """
+    reader = _StreamReader(stream, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "results" and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.peek() == ",":
+                        reader.pos += 1
+                        continue
+                    reader.expect("]")
+                    break
+        else:
+            reader.value()  # other top-level fields (e.g. metadata) are small; skip them
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("}")
+        return
+
+
+# Stream one JSON result object from GCS
+def read_blob_results(blob):
+    """Returns the result entries of a JSON result blob, parsed while it downloads."""
+    return _read_blob(blob)[0]
+
+
+def _read_blob(blob):
+    # Also returns the number of bytes read, for the download stage; a retry reads the whole object again
+    def read():
+        with blob.open("rb", chunk_size=READ_CHUNK_SIZE) as stream:
+            results = list(iter_results(stream))
+            return results, stream.tell()
+    return get_scheduler().call("storage", read, subject=f"gs://{blob.bucket.name}/{blob.name}")
+
+
+def fetch_results(bucket_name, blob_names, storage_client=None, workers=DOWNLOAD_WORKERS):
+    """Downloads and parses result blobs concurrently.
+
+    Returns one list of result entries per blob, in the order of blob_names, so the
+    merged transcript does not depend on which download finished first.
+    """
+    if storage_client is None:
+        storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    return _fetch_blobs([bucket.blob(name) for name in blob_names], workers)
+
+
+def _fetch_blobs(blobs, workers):
+    with stage("download", files=len(blobs)) as record:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            shards = list(executor.map(_read_blob, blobs))
+        record.add_bytes(sum(size for _, size in shards))
+    return [results for results, _ in shards]
+
+
+def fetch_results_from_uris(result_uris, storage_client=None, workers=DOWNLOAD_WORKERS):
+    """Like fetch_results, for gs:// URIs that may be in different buckets."""
+    if storage_client is None:
+        storage_client = get_storage_client()
+    blobs = []
+    for result_uri in result_uris:
+        parsed_uri = urlparse(result_uri)
+        blobs.append(storage_client.bucket(parsed_uri.netloc).blob(parsed_uri.path.lstrip("/")))
+    return _fetch_blobs(blobs, workers)
+
+
+def fetch_results_from_uri(result_uri, storage_client=None):
+    """Returns the result entries of the object at a gs:// URI, without listing the bucket."""
+    return fetch_results_from_uris([result_uri], storage_client)[0]
+
+
+def job_output_dir(gcs_uri, root=RESULTS_ROOT):
+    """Returns a folder no other job writes to, e.g. "transcription_results/call-1a2b3c4d/"."""
+    base_name = os.path.splitext(os.path.basename(urlparse(gcs_uri).path))[0]
+    return f"{root.rstrip('/')}/{base_name}-{uuid.uuid4().hex[:8]}/"
+
+
+def _file_result(response, gcs_uri):
+    file_result = response.results.get(gcs_uri)
+    if file_result is None:
+        raise LookupError(f"No result returned for {gcs_uri}")
+    if file_result.error and file_result.error.code:
+        raise RuntimeError(file_result.error.message)
+    return file_result
+
+
+# Find the result object of one input file in a BatchRecognizeResponse
+def result_uri(response, gcs_uri):
+    """Returns the gs:// URI that batch_recognize reported for gcs_uri's results.
+
+    Raises LookupError if the file is missing from the response and RuntimeError if
+    its recognition failed.
+    """
+    file_result = _file_result(response, gcs_uri)
+    return file_result.cloud_storage_result.uri or file_result.uri
+
+
+def results_as_json(message):
+    """Returns the "results" of a RecognizeResponse or BatchRecognizeTranscript message
+    as entries shaped like the ones in the JSON result files (camelCase keys, "1.5s" offsets)."""
+    return json.loads(type(message).to_json(message)).get("results", [])
+
+
+# Get the result entries of some input files, wherever batch_recognize put them
+def read_response_results(response, gcs_uris, storage_client=None, workers=DOWNLOAD_WORKERS):
+    """Returns one list of result entries per URI in gcs_uris, in the same order.
+
+    Files recognized with inline output are read from the response itself; the
+    others are downloaded from the result objects the response names, in parallel.
+    """
+    file_results = [_file_result(response, gcs_uri) for gcs_uri in gcs_uris]
+    shards = [None] * len(file_results)
+    remote = []
+    for index, file_result in enumerate(file_results):
+        if "inline_result" in file_result:
+            shards[index] = results_as_json(file_result.inline_result.transcript)
+        else:
+            remote.append((index, file_result.cloud_storage_result.uri or file_result.uri))
+    if remote:
+        fetched = fetch_results_from_uris([uri for _, uri in remote], storage_client, workers)
+        for (index, _), results in zip(remote, fetched):
+            shards[index] = results
+    return shards
+
+
+def _seconds(offset):
+    # Durations are serialized as strings like "12.340s"; zero offsets are omitted
+    return float(offset.rstrip("s")) if offset else 0.0
+
+
+def extract_words(results):
+    """Returns the word timings of the top alternative of each result entry.
+
+    Each word is {"word", "start", "end", "confidence"} with times in seconds.
+    """
+    words = []
+    for result in results:
+        alternatives = result.get("alternatives") or []
+        if not alternatives:
+            continue
+        for word in alternatives[0].get("words", []):
+            words.append({
+                "word": word.get("word", ""),
+                "start": _seconds(word.get("startOffset")),
+                "end": _seconds(word.get("endOffset")),
+                "confidence": word.get("confidence", 0.0),
+            })
+    return words
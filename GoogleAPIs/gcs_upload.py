@@ -0,0 +1,214 @@
+import io
+import json
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gcs_cleanup import delete_objects
+from google_clients import get_storage_client
+from instrumentation import stage
+from quota_scheduler import get_scheduler
+
+# Files below this size go up in one request; larger ones are split into parts
+PARALLEL_UPLOAD_THRESHOLD = 64 * 1024 * 1024
+PART_SIZE = 32 * 1024 * 1024
+UPLOAD_WORKERS = 8
+# compose() accepts at most 32 source objects per call
+MAX_COMPOSE_COMPONENTS = 32
+
+
+class FileSlice(io.RawIOBase):
+    """Read-only view of bytes [offset, offset + length) of a file, read from disk on demand."""
+
+    def __init__(self, path, offset, length):
+        self._file = open(path, "rb")
+        self._offset = offset
+        self._length = length
+        self._position = 0
+        self._file.seek(offset)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self._position
+        elif whence == io.SEEK_END:
+            position += self._length
+        self._position = max(0, min(position, self._length))
+        self._file.seek(self._offset + self._position)
+        return self._position
+
+    def readinto(self, buffer):
+        remaining = self._length - self._position
+        if remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:remaining]
+        count = self._file.readinto(view)
+        self._position += count
+        return count
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def _load_state(state_path, source_file_name, destination_blob_name, part_size):
+    """Returns the saved progress for this upload, or a fresh state if the file changed."""
+    stat = os.stat(source_file_name)
+    fresh = {
+        "destination": destination_blob_name,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "part_size": part_size,
+        "parts": {},
+    }
+    if not os.path.exists(state_path):
+        return fresh
+    try:
+        with open(state_path, "r", encoding="utf-8") as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return fresh
+    if any(state.get(key) != fresh[key] for key in ("destination", "size", "mtime", "part_size")):
+        return fresh
+    return state
+
+
+def _save_state(state_path, state):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file)
+    os.replace(tmp_path, state_path)
+
+
+def _compose(bucket, destination_blob_name, part_names, content_type):
+    """Composes part_names into the destination, in several rounds if there are more than 32."""
+    temporary = []
+    level = 0
+    while len(part_names) > MAX_COMPOSE_COMPONENTS:
+        merged = []
+        for start in range(0, len(part_names), MAX_COMPOSE_COMPONENTS):
+            group = part_names[start:start + MAX_COMPOSE_COMPONENTS]
+            name = f"{destination_blob_name}.parts/compose-{level}-{start // MAX_COMPOSE_COMPONENTS:05d}"
+            get_scheduler().call("storage", lambda: bucket.blob(name).compose([bucket.blob(part) for part in group]))
+            merged.append(name)
+        temporary.extend(merged)
+        part_names = merged
+        level += 1
+
+    destination = bucket.blob(destination_blob_name)
+    destination.content_type = content_type
+    get_scheduler().call("storage", lambda: destination.compose([bucket.blob(part) for part in part_names]),
+                         subject=f"gs://{bucket.name}/{destination_blob_name}")
+    return temporary
+
+
+def parallel_upload(bucket_name, source_file_name, destination_blob_name, storage_client=None,
+                    part_size=PART_SIZE, workers=UPLOAD_WORKERS):
+    """Uploads a large file as parallel parts and composes them into one object.
+
+    Progress is kept in "<source>.upload.json"; if the upload is interrupted, calling
+    this again only uploads the parts that are missing. Parts are streamed from disk,
+    so memory use does not depend on the file size.
+    """
+    if storage_client is None:
+        storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+
+    size = os.path.getsize(source_file_name)
+    part_count = max(1, -(-size // part_size))
+    part_names = [f"{destination_blob_name}.parts/{index:05d}" for index in range(part_count)]
+
+    state_path = source_file_name + ".upload.json"
+    state = _load_state(state_path, source_file_name, destination_blob_name, part_size)
+    lock = threading.Lock()
+
+    # Trust recorded parts only if they still exist with the expected size
+    for index, name in enumerate(part_names):
+        if str(index) in state["parts"]:
+            expected = min(part_size, size - index * part_size)
+            blob = get_scheduler().call("storage", lambda: bucket.get_blob(name))
+            if blob is None or blob.size != expected:
+                del state["parts"][str(index)]
+    pending = [index for index in range(part_count) if str(index) not in state["parts"]]
+    if len(pending) < part_count:
+        print(f"Resuming upload of {source_file_name}: {part_count - len(pending)}/{part_count} parts already uploaded.")
+
+    def upload_part(index):
+        offset = index * part_size
+        length = min(part_size, size - offset)
+        started = time.perf_counter()
+        with FileSlice(source_file_name, offset, length) as part:
+            # rewind=True makes a retried attempt send the part from its start again
+            get_scheduler().call("storage", lambda: bucket.blob(part_names[index]).upload_from_file(
+                part, size=length, rewind=True), subject=f"gs://{bucket_name}/{part_names[index]}")
+        elapsed = time.perf_counter() - started
+        print(f"Uploaded part {index + 1}/{part_count} of {source_file_name} "
+              f"({length / 1e6:.1f} MB in {elapsed:.1f}s, {length / 1e6 / max(elapsed, 1e-6):.1f} MB/s)")
+        with lock:
+            state["parts"][str(index)] = {"size": length, "seconds": round(elapsed, 3)}
+            _save_state(state_path, state)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first failed part; finished parts stay recorded for resume
+        list(executor.map(upload_part, pending))
+
+    content_type = mimetypes.guess_type(source_file_name)[0]
+    temporary = _compose(bucket, destination_blob_name, part_names, content_type)
+
+    delete_objects(bucket_name, part_names + temporary, storage_client=storage_client)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+
+# Upload data produced on the fly (e.g. a decoder's output) without writing it to disk first
+def upload_stream(bucket_name, open_blocks, destination_blob_name, storage_client=None, content_type=None):
+    """Uploads the bytes blocks yielded by open_blocks() to gs://bucket_name/destination_blob_name.
+
+    The blocks go out as a resumable upload while they are produced. open_blocks is
+    called again if the upload is retried, so it must start the data from the beginning.
+    Returns the number of bytes uploaded.
+    """
+    if storage_client is None:
+        storage_client = get_storage_client()
+    blob = storage_client.bucket(bucket_name).blob(destination_blob_name)
+
+    def send():
+        size = 0
+        with blob.open("wb", content_type=content_type) as writer:
+            for block in open_blocks():
+                writer.write(block)
+                size += len(block)
+        return size
+
+    with stage("upload", file=os.path.basename(destination_blob_name), streamed=True) as record:
+        size = get_scheduler().call("storage", send, subject=f"gs://{bucket_name}/{destination_blob_name}")
+        record.add_bytes(size)
+    return size
+
+
+# Upload a recording, splitting it into parallel parts when it is large
+def upload_file(bucket_name, source_file_name, destination_blob_name, storage_client=None,
+                threshold=PARALLEL_UPLOAD_THRESHOLD):
+    """Uploads source_file_name to gs://bucket_name/destination_blob_name."""
+    if storage_client is None:
+        storage_client = get_storage_client()
+
+    size = os.path.getsize(source_file_name)
+    with stage("upload", file=os.path.basename(source_file_name), parallel=size >= threshold) as record:
+        if size < threshold:
+            blob = storage_client.bucket(bucket_name).blob(destination_blob_name)
+            get_scheduler().call("storage", lambda: blob.upload_from_filename(source_file_name),
+                                 subject=f"gs://{bucket_name}/{destination_blob_name}")
+        else:
+            parallel_upload(bucket_name, source_file_name, destination_blob_name, storage_client)
+        record.add_bytes(size)
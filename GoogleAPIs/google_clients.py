@@ -0,0 +1,90 @@
+import os
+import threading
+
+from instrumentation import stage
+
+# Default service account key used by the scripts in this folder
+SERVICE_ACCOUNT_FILE = 'service-account.json'
+
+# Speech API versions used in this repo and the modules that provide them
+SPEECH_MODULES = {
+    "v1": "google.cloud.speech",
+    "v1p1beta1": "google.cloud.speech_v1p1beta1",
+    "v2": "google.cloud.speech_v2",
+}
+
+_lock = threading.Lock()
+_credentials = {}
+_clients = {}
+
+
+# Load service account credentials once per key file
+def get_credentials(credentials_path=SERVICE_ACCOUNT_FILE):
+    """Returns the cached credentials for credentials_path, loading them on first use."""
+    key = os.path.abspath(credentials_path)
+    with _lock:
+        credentials = _credentials.get(key)
+        if credentials is None:
+            with stage("credentials"):
+                from google.oauth2 import service_account
+                credentials = service_account.Credentials.from_service_account_file(
+                    key, scopes=["https://www.googleapis.com/auth/cloud-platform"]
+                )
+            _credentials[key] = credentials
+        return credentials
+
+
+def _get_client(service, credentials_path, endpoint, factory):
+    key = (service, os.path.abspath(credentials_path), endpoint)
+    with _lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    credentials = get_credentials(credentials_path)
+    with _lock:
+        # Another thread may have built the same client while we were loading credentials
+        client = _clients.get(key)
+        if client is None:
+            client = factory(credentials)
+            _clients[key] = client
+        return client
+
+
+# Shared Cloud Storage client
+def get_storage_client(credentials_path=SERVICE_ACCOUNT_FILE):
+    """Returns the process-wide storage client for credentials_path."""
+    def factory(credentials):
+        from google.cloud import storage
+        return storage.Client(project=credentials.project_id, credentials=credentials)
+
+    return _get_client("storage", credentials_path, None, factory)
+
+
+# Shared Speech-to-Text client, one per API version and regional endpoint
+def get_speech_client(version="v2", location=None, credentials_path=SERVICE_ACCOUNT_FILE):
+    """Returns the process-wide Speech client for (version, credentials, endpoint).
+
+    location selects a regional endpoint such as "us-central1"; None or "global" uses
+    the default endpoint. Clients keep their gRPC channel open, so reusing them skips
+    the credential refresh and connection handshake on every call.
+    """
+    endpoint = None
+    if location and location != "global":
+        endpoint = f"{location}-speech.googleapis.com"
+
+    def factory(credentials):
+        import importlib
+        speech = importlib.import_module(SPEECH_MODULES[version])
+        client_options = {"api_endpoint": endpoint} if endpoint else None
+        return speech.SpeechClient(credentials=credentials, client_options=client_options)
+
+    return _get_client(f"speech_{version}", credentials_path, endpoint, factory)
+
+
+# Drop every cached client (e.g. after rotating the service account key)
+def clear_clients():
+    """Forgets all cached credentials and clients."""
+    with _lock:
+        _clients.clear()
+        _credentials.clear()
@@ -1,38 +1,59 @@
 import os
 from google.cloud import speech
-from google.oauth2 import service_account
+from google_clients import get_speech_client
+from streaming import stream_file
+from audio_preprocess import TARGET_SAMPLE_RATE, probe_audio
+from audio_source import URI, choose_submission, linear16_key, recognition_audio, remove_uploaded, upload_name
+from silence_chunking import transcribe_chunked
+from instrumentation import metrics
+from job_tracker import get_tracker
 
 # Path to your local audio file and service account JSON key
 audio_path = "butter.mp3"  
 credentials_path = "woven-century-448009-r7-01f84d62a35c.json" 
 
-# Initialize credentials
-credentials = service_account.Credentials.from_service_account_file(credentials_path)
-
 def transcribe_local_audio(audio_path: str) -> str:
     """Transcribes a local audio file using the Google Cloud Speech-to-Text API."""
-    # Instantiate the Speech client with provided credentials
-    client = speech.SpeechClient(credentials=credentials)
+    # Shared Speech client for the provided credentials
+    client = get_speech_client("v1", credentials_path=credentials_path)
 
-    # Read the local audio file into memory
-    with open(audio_path, "rb") as audio_file:
-        audio_content = audio_file.read()
+    # Decide inline vs gs:// URI from the header before decoding anything
+    info = probe_audio(audio_path)
+    submission = choose_submission(info)
+    print(f"{info.duration:.1f}s of audio; sending it {'inline' if submission == 'inline' else 'by GCS URI'}")
 
-    # Prepare the audio content for the request
-    audio = speech.RecognitionAudio(content=audio_content)
+    # The operation is journaled by content hash; after a crash it is picked up again without another upload
+    tracker = get_tracker()
+    audio_key = linear16_key(audio_path)
+    uploaded = None
+    tracked = tracker.resume("google-v1", audio_key, credentials_path=credentials_path, client=client)
+    if tracked is None:
+        # Prepare the audio as 16 kHz mono LINEAR16; long audio is piped from the decoder into an upload
+        audio, uploaded = recognition_audio(speech, audio_path, submission, info=info)
 
-    # Configure the transcription request
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.MP3, 
-        sample_rate_hertz=44100,  
-        language_code="bn-BD",   
-    )
+        # Configure the transcription request to match the normalized audio
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16, 
+            sample_rate_hertz=TARGET_SAMPLE_RATE,  
+            language_code="bn-BD",   
+        )
 
-    # Perform the transcription
-    operation = client.long_running_recognize(config=config, audio=audio)
+        # Perform the transcription
+        try:
+            tracked = tracker.submit(
+                "google-v1", audio_key,
+                lambda: client.long_running_recognize(config=config, audio=audio),
+                version="v1", credentials_path=credentials_path, client=client,
+            )
+        except Exception:
+            remove_uploaded(uploaded)
+            raise
+    elif submission == URI:
+        uploaded = upload_name(audio_path, info=info)  # uploaded by the run that submitted the operation
 
     print("Waiting for operation to complete...")
-    response = operation.result(timeout=600)
+    response = tracked.result(timeout=600)
+    remove_uploaded(uploaded)
 
     # Collect the transcription results
     transcript_builder = []
@@ -43,8 +64,21 @@ def transcribe_local_audio(audio_path: str) -> str:
     # Combine and print the full transcript
     transcript = "".join(transcript_builder)
     print(transcript)
+    tracker.mark_collected(tracked)
 
     return transcript
 
+def stream_local_audio(audio_path: str):
+    """Streams a local audio file and yields interim and final results as they arrive."""
+    return stream_file(audio_path, language_code="bn-BD", version="v1", credentials_path=credentials_path)
+
+def transcribe_local_audio_chunked(audio_path: str) -> str:
+    """Transcribes a short or medium file as parallel synchronous requests split at silences."""
+    result = transcribe_chunked(audio_path, language_code="bn-BD", version="v1", credentials_path=credentials_path)
+    print(result["transcript"])
+    return result["transcript"]
+
 # Call the function with the local audio file path
-transcribe_local_audio(audio_path)
+if __name__ == "__main__":
+    transcribe_local_audio(audio_path)
+    metrics.print_summary()
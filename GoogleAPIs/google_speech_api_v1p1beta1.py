@@ -1,33 +1,60 @@
 from google.cloud import speech_v1p1beta1 as speech
+from google_clients import get_speech_client
+from streaming import stream_file
+from audio_preprocess import TARGET_SAMPLE_RATE, probe_audio
+from audio_source import URI, choose_submission, linear16_key, recognition_audio, remove_uploaded, upload_name
+from silence_chunking import transcribe_chunked
+from instrumentation import metrics
+from job_tracker import get_tracker
 import os
-from pydub import AudioSegment
 
 def transcribe_audio(file_path):
-    # Initialize client
-    client = speech.SpeechClient.from_service_account_file('service-account.json')
+    # Shared client
+    client = get_speech_client("v1p1beta1")
     
     try:
-        # Read audio file
-        with open(file_path, "rb") as audio_file:
-            content = audio_file.read()
+        # Decide inline vs gs:// URI up front, from the probed duration
+        info = probe_audio(file_path)
+        submission = choose_submission(info)
 
-        # Create recognition request for long-running operation
-        audio = speech.RecognitionAudio(content=content)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.MP3,  # Specify the audio encoding
-            sample_rate_hertz=16000,  # Adjust based on your audio file's sample rate
-            language_code="bn-BD",  # Bangla language code
-            enable_word_time_offsets=True,  # Enable word-level timestamps
-            enable_automatic_punctuation=True,  # Enable automatic punctuation
-            model="default"  # Use the default model
-        )
+        # The operation is journaled by content hash, so a rerun after a crash picks it up without uploading again
+        tracker = get_tracker()
+        audio_key = linear16_key(file_path)
+        uploaded = None
+        tracked = tracker.resume("google-v1p1beta1", audio_key, client=client)
+        if tracked is None:
+            # Send the audio as 16 kHz mono LINEAR16 (WAV as is; long audio piped from the decoder into an upload)
+            print(f"Normalizing {file_path} to {TARGET_SAMPLE_RATE} Hz mono ({info.duration:.1f}s, {submission})")
 
-        # Perform transcription (long-running operation)
-        print("Processing audio... (This may take a while for long files)")
-        operation = client.long_running_recognize(config=config, audio=audio)
+            # Create recognition request for long-running operation
+            audio, uploaded = recognition_audio(speech, file_path, submission, info=info)
+            config = speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,  # Specify the audio encoding
+                sample_rate_hertz=TARGET_SAMPLE_RATE,  # Matches the normalized audio
+                audio_channel_count=1,
+                language_code="bn-BD",  # Bangla language code
+                enable_word_time_offsets=True,  # Enable word-level timestamps
+                enable_automatic_punctuation=True,  # Enable automatic punctuation
+                model="default"  # Use the default model
+            )
+
+            # Perform transcription (long-running operation)
+            print("Processing audio... (This may take a while for long files)")
+            try:
+                tracked = tracker.submit(
+                    "google-v1p1beta1", audio_key,
+                    lambda: client.long_running_recognize(config=config, audio=audio),
+                    version="v1p1beta1", client=client,
+                )
+            except Exception:
+                remove_uploaded(uploaded)
+                raise
+        elif submission == URI:
+            uploaded = upload_name(file_path, info=info)  # uploaded by the run that submitted the operation
         
         # Wait for the operation to complete
-        response = operation.result(timeout=600)  # Increase timeout if needed
+        response = tracked.result(timeout=600)  # Increase timeout if needed
+        remove_uploaded(uploaded)
         
         # Process results
         # Collect the transcription results
@@ -54,21 +81,41 @@ def transcribe_audio(file_path):
                 #         end_time = word.end_time.total_seconds()
                 #         print(f"Word: {word.word}, Start: {start_time:.2f}s, End: {end_time:.2f}s")
 
+        tracker.mark_collected(tracked)
         print("Transcription completed.")
+        return transcript
 
        
 
     except Exception as e:
         print(f"Error during transcription: {str(e)}")
 
-def convert_to_mono(input_file, output_file):
-    sound = AudioSegment.from_mp3(input_file)
-    sound = sound.set_channels(1)
-    sound.export(output_file, format="mp3")
-    print("File converted to mono")
+def transcribe_audio_streaming(file_path):
+    """Streams the file to StreamingRecognize and prints text as soon as it is recognized."""
+    transcript_builder = []
+    try:
+        for result in stream_file(file_path, language_code="bn-BD", version="v1p1beta1"):
+            if result["is_final"]:
+                print(f"[{result['end_time']:.2f}s] {result['transcript']}")
+                transcript_builder.append(result["transcript"].strip())
+        return " ".join(transcript_builder)
+
+    except Exception as e:
+        print(f"Error during streaming transcription: {str(e)}")
+
+def transcribe_audio_chunked(file_path):
+    """Splits the file at silences and recognizes the pieces in parallel (best for 1-10 minute calls)."""
+    try:
+        result = transcribe_chunked(file_path, language_code="bn-BD", version="v1p1beta1")
+        print(result["transcript"])
+        print("Transcription completed.")
+        return result
+
+    except Exception as e:
+        print(f"Error during chunked transcription: {str(e)}")
 
 if __name__ == "__main__":
     input_file = "butter.mp3"  # Replace with your audio file name
-    mono_file = "converted_mono.mp3"
-    convert_to_mono(input_file, mono_file)
-    transcribe_audio(mono_file)
\ No newline at end of file
+    # Mono conversion and resampling happen inside transcribe_audio, without loading the whole file
+    transcribe_audio(input_file)
+    metrics.print_summary()
\ No newline at end of file
@@ -1,113 +1,123 @@
-from google.cloud import speech_v2 as speech
 from google.cloud.speech_v2.types import cloud_speech
-from google.cloud import storage
-from pydub import AudioSegment
-import json
+from google_clients import get_speech_client
+from gcs_results import extract_words, job_output_dir, read_response_results
+from gcs_cleanup import cleanup
+from gcs_upload import upload_file
+from inline_recognition import INLINE, SYNC, choose_result_path_for_file, inline_output_config, recognize_file
+from instrumentation import metrics, stage
+from job_tracker import get_tracker
+from recognizers import recognizer_manager
 import os
 from urllib.parse import urlparse
 
+BACKEND = "google-v2"
+
+# Recognizer configuration
+PROJECT_ID = "woven-century-448009-r7"
+LOCATION = "global"
+RECOGNIZER_ID = "bangla-recognizer-2"
+PARENT = f"projects/{PROJECT_ID}/locations/{LOCATION}"
+
 def upload_to_gcs(bucket_name, source_file_name, destination_blob_name):
     """Uploads a file to Google Cloud Storage."""
-    storage_client = storage.Client.from_service_account_json('service-account.json')
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
+    # Large files are uploaded as parallel, resumable parts
+    upload_file(bucket_name, source_file_name, destination_blob_name)
     print(f"File {source_file_name} uploaded to GCS as {destination_blob_name}.")
 
-def download_transcription_and_save_to_txt(bucket_name, gcs_json_dir, output_txt_filename):
-    """Downloads JSON results from GCS and saves clean transcript to TXT."""
-    storage_client = storage.Client.from_service_account_json('service-account.json')
-    bucket = storage_client.bucket(bucket_name)
-    blobs = sorted(bucket.list_blobs(prefix=gcs_json_dir), key=lambda x: x.name)  # Sort blobs chronologically
+def recognition_config():
+    return cloud_speech.RecognitionConfig(
+        auto_decoding_config={},
+        language_codes=["bn-BD"],
+        model="latest_long",
+        features=cloud_speech.RecognitionFeatures(
+            # enable_automatic_punctuation=True,
+            enable_word_time_offsets=True,
+            # enable_spoken_punctuation=True,
+            enable_spoken_emojis=False
+        )
+    )
+
+def download_transcription_and_save_to_txt(response, gcs_uri, output_txt_filename):
+    """Reads the results reported for gcs_uri and saves clean transcript to TXT."""
+    # Inline results come from the response; a result object is read directly, no bucket listing
+    return save_clean_transcript(read_response_results(response, [gcs_uri])[0], output_txt_filename)
 
+def save_clean_transcript(results, output_txt_filename):
+    """Joins the first alternative of each result entry and saves the cleaned text."""
     full_transcript = []
 
-    for blob in blobs:
-        if blob.name.endswith(".json"):
-            json_content = blob.download_as_text()
-            data = json.loads(json_content)
-            
-            # Process results in chronological order
-            for result in data.get("results", []):
-                # Take only the first (highest-confidence) alternative
-                if result.get("alternatives"):
-                    transcript = result["alternatives"][0].get("transcript", "")
-                    full_transcript.append(transcript.strip())
-
-    # Combine with spaces between segments
-    final_transcript = " ".join(full_transcript)
+    for result in results:
+        # Take only the first (highest-confidence) alternative
+        if result.get("alternatives"):
+            transcript = result["alternatives"][0].get("transcript", "").strip()
+            if transcript:
+                full_transcript.append(transcript)
+
+    with stage("postprocess", backend=BACKEND):
+        # Combine with spaces between segments
+        final_transcript = " ".join(full_transcript)
     
-    # Add basic punctuation normalization
-    final_transcript = final_transcript.replace(" .", ".").replace(" ,", ",")
-    final_transcript = final_transcript[0].upper() + final_transcript[1:] + "."
+        # Add basic punctuation normalization
+        final_transcript = final_transcript.replace(" .", ".").replace(" ,", ",")
+        # Silence or no speech recognized: save an empty transcript
+        if final_transcript:
+            final_transcript = final_transcript[0].upper() + final_transcript[1:] + "."
 
-    # Save to file
-    with open(output_txt_filename, "w", encoding="utf-8") as txt_file:
-        txt_file.write(final_transcript)
+        # Save to file
+        with open(output_txt_filename, "w", encoding="utf-8") as txt_file:
+            txt_file.write(final_transcript)
     print(f"Clean transcription saved to {output_txt_filename}")
+    return final_transcript
 
-def transcribe_long_audio(gcs_uri, bucket_name):
-    # Initialize client
-    client = speech.SpeechClient.from_service_account_file('service-account.json')
-    
-    # Recognizer configuration
-    project_id = "woven-century-448009-r7"
-    location = "global"
-    recognizer_id = "bangla-recognizer-2"
-    parent = f"projects/{project_id}/locations/{location}"
-    recognizer_name = f"{parent}/recognizers/{recognizer_id}"
-    
-    try:
-        # Create/get recognizer with optimized settings
-        try:
-            recognizer = client.get_recognizer(name=recognizer_name)
-        except:
-            recognizer = client.create_recognizer(
-                parent=parent,
-                recognizer_id=recognizer_id,
-                recognizer={
-                    "language_codes": ["bn-BD"],
-                    "model": "latest_long",
-                    "default_recognition_config": {  # Add default config
-                        "auto_decoding_config": {},
-                        "features": {
-                            "enable_automatic_punctuation": True,
-                            "enable_word_time_offsets": True
-                        }
-                    }
-                }
-            )
-
-        # Output configuration
-        output_dir = "transcription_results/"
+def recognize_to_gcs(gcs_uri, bucket_name, output_dir=None, inline=False):
+    """Runs batch_recognize for one GCS file and waits until its JSON results are written.
+
+    Results go to output_dir, a new folder for this job by default, or with
+    inline=True come back in the operation response. Returns the finished
+    TrackedOperation from the job tracker.
+    """
+    # Shared client
+    client = get_speech_client()
+    recognizer_name = f"{PARENT}/recognizers/{RECOGNIZER_ID}"
+
+    # Output configuration, in a folder of its own so concurrent jobs never mix results
+    output_prefix = None
+    if inline:
+        output_config = inline_output_config()
+    else:
+        if output_dir is None:
+            output_dir = job_output_dir(gcs_uri)
+        output_prefix = f"gs://{bucket_name}/{output_dir}"
         output_config = cloud_speech.RecognitionOutputConfig(
-            gcs_output_config=cloud_speech.GcsOutputConfig(
-                uri=f"gs://{bucket_name}/{output_dir}"
-            )
+            gcs_output_config=cloud_speech.GcsOutputConfig(uri=output_prefix)
         )
 
-        # Create optimized recognition request
-        request = cloud_speech.BatchRecognizeRequest(
-            recognizer=recognizer_name,
-            config=cloud_speech.RecognitionConfig(
-                auto_decoding_config={},
-                language_codes=["bn-BD"],
-                model="latest_long",
-                features=cloud_speech.RecognitionFeatures(
-                    # enable_automatic_punctuation=True,
-                    enable_word_time_offsets=True,
-                    # enable_spoken_punctuation=True,
-                    enable_spoken_emojis=False
-                )
-            ),
-            files=[{"uri": gcs_uri}],
-            recognition_output_config=output_config
-        )
+    # Create optimized recognition request
+    request = cloud_speech.BatchRecognizeRequest(
+        recognizer=recognizer_name,
+        config=recognition_config(),
+        files=[{"uri": gcs_uri}],
+        recognition_output_config=output_config
+    )
 
-        # Process audio
-        print("Processing audio with optimized settings...")
-        operation = client.batch_recognize(request=request)
-        operation.result(timeout=3600)  # Increased timeout for large files
+    # Process audio
+    print("Processing audio with optimized settings...")
+    # The recognizer is resolved once and cached; it is only looked up again if missing
+    def submit(recognizer_name):
+        request.recognizer = recognizer_name
+        return client.batch_recognize(request=request)
+    # Journaled, so a rerun after a crash resumes the operation instead of resubmitting the audio
+    tracked = get_tracker().submit(
+        BACKEND, gcs_uri, lambda: recognizer_manager.run(client, PARENT, RECOGNIZER_ID, "latest_long", submit),
+        output_prefix=output_prefix, location=LOCATION, client=client,
+    )
+    tracked.result(timeout=3600)  # Increased timeout for large files
+    return tracked
+
+def transcribe_long_audio(gcs_uri, bucket_name, inline=False, with_words=False):
+    """Returns the transcript of gcs_uri, or (transcript, word timings) with with_words=True."""
+    try:
+        tracked = recognize_to_gcs(gcs_uri, bucket_name, inline=inline)
 
         # Generate output filename
         parsed_uri = urlparse(gcs_uri)
@@ -115,7 +125,41 @@ def transcribe_long_audio(gcs_uri, bucket_name):
         output_txt_filename = f"{base_name}_clean_transcript.txt"
 
         # Process and save transcript
-        download_transcription_and_save_to_txt(bucket_name, output_dir, output_txt_filename)
+        results = read_response_results(tracked.result(), [gcs_uri])[0]
+        transcript = save_clean_transcript(results, output_txt_filename)
+        get_tracker().mark_collected(tracked)
+
+        # Delete this job's output folder (if any), off the request path; the audio is the caller's
+        if tracked.job["output_prefix"]:
+            cleanup(bucket_name, prefixes=[urlparse(tracked.job["output_prefix"]).path.lstrip("/")])
+        return (transcript, extract_words(results)) if with_words else transcript
+
+    except Exception as e:
+        print(f"Transcription error: {str(e)}")
+
+def transcribe_audio_file(input_file, bucket_name, destination_blob_name, with_words=False):
+    """Transcribes a local file, skipping the GCS round trips when it is short enough.
+
+    Clips that fit recognize() are sent inline; longer files are uploaded and, up to
+    INLINE_MAX_SECONDS, their results are returned in the operation response. With
+    with_words=True returns (transcript, word timings).
+    """
+    result_path = choose_result_path_for_file(input_file)
+    if result_path != SYNC:
+        upload_to_gcs(bucket_name, input_file, destination_blob_name)
+        return transcribe_long_audio(f"gs://{bucket_name}/{destination_blob_name}", bucket_name,
+                                     inline=result_path == INLINE, with_words=with_words)
+
+    try:
+        client = get_speech_client()
+        print("Processing short audio inline...")
+        results = recognizer_manager.run(
+            client, PARENT, RECOGNIZER_ID, "latest_long",
+            lambda recognizer_name: recognize_file(client, recognizer_name, recognition_config(), input_file, BACKEND)
+        )
+        base_name = os.path.splitext(os.path.basename(destination_blob_name))[0]
+        transcript = save_clean_transcript(results, f"{base_name}_clean_transcript.txt")
+        return (transcript, extract_words(results)) if with_words else transcript
 
     except Exception as e:
         print(f"Transcription error: {str(e)}")
@@ -125,9 +169,6 @@ if __name__ == "__main__":
     bucket_name = "bangla_audio_files"
     destination_blob_name = "call_files/call_recordings/butterfly_jannat.wav"
     
-    # Upload directly (assuming file is already in correct format)
-    upload_to_gcs(bucket_name, input_file, destination_blob_name)
-    
-    # Start transcription
-    gcs_uri = f"gs://{bucket_name}/{destination_blob_name}"
-    transcribe_long_audio(gcs_uri, bucket_name)
\ No newline at end of file
+    # Short files are recognized inline; others are uploaded directly (assuming the format is already correct)
+    transcribe_audio_file(input_file, bucket_name, destination_blob_name)
+    metrics.print_summary()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+
+from audio_preprocess import probe_audio
+from gcs_results import results_as_json
+from instrumentation import stage
+from quota_scheduler import get_scheduler, resource_scope
+
+# How a file's results come back
+SYNC = "sync"      # recognize(): audio sent inline, results in the reply; no GCS at all
+INLINE = "inline"  # batch_recognize from GCS with the results returned in the operation response
+GCS = "gcs"        # batch_recognize writing JSON results to GCS
+
+# recognize() accepts at most one minute of audio and 10 MB of content per request
+SYNC_MAX_SECONDS = 60
+SYNC_MAX_BYTES = 10 * 1024 * 1024
+# Longer files write their results to GCS so the operation response stays small
+INLINE_MAX_SECONDS = 15 * 60
+# "auto" picks from duration and size; "off" always uses GCS output
+INLINE_MODE = os.environ.get("SPEECH2TEXT_INLINE_MODE", "auto")
+
+
+def choose_result_path(duration, size, mode=None):
+    """Returns SYNC, INLINE or GCS for audio of duration seconds and size bytes."""
+    if (mode or INLINE_MODE) == "off" or duration is None:
+        return GCS
+    if duration <= SYNC_MAX_SECONDS and size <= SYNC_MAX_BYTES:
+        return SYNC
+    if duration <= INLINE_MAX_SECONDS:
+        return INLINE
+    return GCS
+
+
+# Decide for a local file; probing only reads the header (or runs ffprobe)
+def choose_result_path_for_file(path, mode=None):
+    """Like choose_result_path, probing the file; unreadable files take the GCS path."""
+    try:
+        duration = probe_audio(path).duration
+    except Exception as e:
+        print(f"Could not probe {path} ({e}); using GCS output")
+        return GCS
+    return choose_result_path(duration, os.path.getsize(path), mode)
+
+
+def inline_output_config():
+    """Output config that returns batch_recognize results in the operation response."""
+    from google.cloud.speech_v2.types import cloud_speech
+    return cloud_speech.RecognitionOutputConfig(inline_response_config=cloud_speech.InlineOutputConfig())
+
+
+# Recognize a short local file in one synchronous call
+def recognize_file(client, recognizer_name, config, path, backend):
+    """Sends the file's bytes with recognize() and returns result entries in the JSON
+    result file format, so they go through the same post-processing."""
+    from google.cloud.speech_v2.types import cloud_speech
+    with open(path, "rb") as audio_file:
+        content = audio_file.read()
+    with stage("recognize", backend=backend, mode=SYNC) as record:
+        record.add_bytes(len(content))
+        request = cloud_speech.RecognizeRequest(recognizer=recognizer_name, config=config, content=content)
+        response = get_scheduler().call("recognize", lambda: client.recognize(request=request),
+                                        subject=path, **resource_scope(recognizer_name))
+    return results_as_json(response)
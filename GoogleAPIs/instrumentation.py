@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stages of the transcription flow, in the order a job goes through them
+STAGES = (
+    "credentials",        # load the service account key (once per process)
+    "convert",            # read and decode/resample the local file
+    "load",               # load a local model
+    "upload",
+    "recognizer_lookup",
+    "quota_wait",         # waiting for a request slot or backing off after an error
+    "queue_wait",         # long-running operation accepted but not started yet
+    "recognize",
+    "download",
+    "postprocess",
+    "cleanup",
+)
+
+# Environment variables read when this module is imported
+METRICS_LOG_ENV = "SPEECH2TEXT_METRICS_LOG"
+METRICS_PORT_ENV = "SPEECH2TEXT_METRICS_PORT"
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800, 3600)
+
+
+class StageRecord:
+    """One timed stage; the code inside the stage adds bytes and retries as it goes."""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.seconds = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.error = None
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+    def retry(self):
+        self.retries += 1
+
+
+class Metrics:
+    """Collects stage timings, writes them as JSON lines and renders them for Prometheus.
+
+    Totals are aggregated per (stage, backend) label pair. Other labels (file, job, ...)
+    only go to the JSON log, so the Prometheus series count stays small.
+    """
+
+    def __init__(self, json_log_path=None):
+        self.json_log_path = json_log_path
+        self._lock = threading.Lock()
+        self._totals = {}
+        # The JSON log stays open; its own lock keeps log writes from holding up the totals
+        self._log_lock = threading.Lock()
+        self._log_file = None
+
+    def observe(self, name, seconds, bytes=0, retries=0, error=None, **labels):
+        """Records a stage that was timed elsewhere (e.g. from worker-reported timings)."""
+        record = StageRecord(name, labels)
+        record.seconds, record.bytes, record.retries, record.error = seconds, bytes, retries, error
+        self._record(record)
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """Times the enclosed block as one stage; exceptions are recorded and re-raised."""
+        record = StageRecord(name, labels)
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.seconds = time.perf_counter() - started
+            self._record(record)
+
+    def _record(self, record):
+        key = (record.name, str(record.labels.get("backend", "")))
+        with self._lock:
+            totals = self._totals.get(key)
+            if totals is None:
+                totals = self._totals[key] = {
+                    "count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "retries": 0,
+                    "buckets": [0] * len(SECONDS_BUCKETS),
+                }
+            totals["count"] += 1
+            totals["errors"] += record.error is not None
+            totals["seconds"] += record.seconds
+            totals["max_seconds"] = max(totals["max_seconds"], record.seconds)
+            totals["bytes"] += record.bytes
+            totals["retries"] += record.retries
+            for index, bound in enumerate(SECONDS_BUCKETS):
+                if record.seconds <= bound:
+                    totals["buckets"][index] += 1
+
+        if self.json_log_path:
+            line = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "stage": record.name,
+                "seconds": round(record.seconds, 4),
+                "bytes": record.bytes,
+                "retries": record.retries,
+                "error": record.error,
+                **{key: str(value) for key, value in record.labels.items()},
+            }
+            self._write_log(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def _write_log(self, text):
+        with self._log_lock:
+            if self._log_file is None:
+                # Line buffered, so each record reaches the file as soon as it is written
+                self._log_file = open(self.json_log_path, "a", encoding="utf-8", buffering=1)
+            self._log_file.write(text)
+
+    def snapshot(self):
+        """Returns {(stage, backend): totals} copied under the lock."""
+        with self._lock:
+            return {key: dict(totals, buckets=list(totals["buckets"])) for key, totals in self._totals.items()}
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+    def render_prometheus(self):
+        """Returns the totals in the Prometheus text exposition format."""
+        snapshot = sorted(self.snapshot().items())
+        lines = [
+            "# HELP speech2text_stage_seconds Wall time spent in each transcription stage.",
+            "# TYPE speech2text_stage_seconds histogram",
+        ]
+        for (name, backend), totals in snapshot:
+            labels = f'stage="{name}",backend="{backend}"'
+            for bound, count in zip(SECONDS_BUCKETS, totals["buckets"]):
+                lines.append(f'speech2text_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'speech2text_stage_seconds_bucket{{{labels},le="+Inf"}} {totals["count"]}')
+            lines.append(f"speech2text_stage_seconds_sum{{{labels}}} {totals['seconds']:.6f}")
+            lines.append(f"speech2text_stage_seconds_count{{{labels}}} {totals['count']}")
+
+        for metric, field, help_text in (
+            ("speech2text_stage_bytes_total", "bytes", "Bytes moved by each stage."),
+            ("speech2text_stage_retries_total", "retries", "Retries made inside each stage."),
+            ("speech2text_stage_errors_total", "errors", "Stages that ended with an exception."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (name, backend), totals in snapshot:
+                lines.append(f'{metric}{{stage="{name}",backend="{backend}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
+
+    def print_summary(self):
+        """Prints per-stage totals, slowest first."""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        print(f"{'stage':<18} {'backend':<18} {'count':>5} {'total s':>9} {'max s':>8} {'MB':>9} {'retries':>7}")
+        for (name, backend), totals in sorted(snapshot.items(), key=lambda item: -item[1]["seconds"]):
+            print(f"{name:<18} {backend:<18} {totals['count']:>5} {totals['seconds']:>9.2f} "
+                  f"{totals['max_seconds']:>8.2f} {totals['bytes'] / 1e6:>9.2f} {totals['retries']:>7}")
+
+
+# Process-wide metrics shared by the scripts in this folder
+metrics = Metrics(os.environ.get(METRICS_LOG_ENV) or None)
+stage = metrics.stage
+observe = metrics.observe
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Serves GET /metrics in Prometheus text format from a background thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            payload = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+if os.environ.get(METRICS_PORT_ENV):
+    serve_metrics(int(os.environ[METRICS_PORT_ENV]))
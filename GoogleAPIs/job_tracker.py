@@ -0,0 +1,356 @@
+import importlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from google_clients import SERVICE_ACCOUNT_FILE, SPEECH_MODULES, get_speech_client, get_storage_client
+from instrumentation import observe
+from quota_scheduler import PERMANENT, classify, error_code, get_scheduler
+
+# Shared by every script, next to the transcript cache
+DEFAULT_JOURNAL_DB = os.path.join(os.path.expanduser("~"), ".cache", "speech2text", "jobs.sqlite3")
+# Adaptive polling: start fast, slow down while an operation makes no progress
+MIN_POLL_SECONDS = 1.0
+MAX_POLL_SECONDS = 30.0
+POLL_BACKOFF = 1.5
+POLL_WORKERS = 8
+# Operations older than this are not resumed (the service only keeps them for a while)
+MAX_RESUME_AGE_SECONDS = 3 * 24 * 3600
+
+# Job states in the journal
+RUNNING = "running"      # submitted, not finished yet
+DONE = "done"            # finished; results not collected by the caller yet
+FAILED = "failed"
+COLLECTED = "collected"  # results downloaded, nothing left to resume
+
+
+def quota_kind(version):
+    """Quota that submitting (and running) an operation of this API version counts against."""
+    return "batch_recognize" if version == "v2" else "long_running"
+
+
+class JobJournal:
+    """SQLite record of every submitted long-running operation and its state."""
+
+    def __init__(self, db_path=DEFAULT_JOURNAL_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "operation_name TEXT PRIMARY KEY, backend TEXT NOT NULL, input_uri TEXT NOT NULL, "
+            "output_prefix TEXT, version TEXT NOT NULL, location TEXT, credentials_path TEXT NOT NULL, "
+            "status TEXT NOT NULL, error TEXT, submitted_at REAL NOT NULL, updated_at REAL NOT NULL, "
+            "audio_version TEXT)"
+        )
+        # Journals written before audio_version was recorded
+        if "audio_version" not in {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN audio_version TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_input ON jobs (backend, input_uri, status)")
+        self._db.commit()
+
+    def add(self, operation_name, backend, input_uri, output_prefix, version, location, credentials_path,
+            audio_version=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (operation_name, backend, input_uri, output_prefix, version, location, "
+                "credentials_path, status, error, submitted_at, updated_at, audio_version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?)",
+                (operation_name, backend, input_uri, output_prefix, version, location, credentials_path,
+                 RUNNING, now, now, audio_version),
+            )
+            self._db.commit()
+
+    def set_status(self, operation_name, status, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE operation_name = ?",
+                (status, error, time.time(), operation_name),
+            )
+            self._db.commit()
+
+    def find_resumable(self, backend, input_uri, audio_version=None):
+        """Returns the newest running or finished-but-uncollected job for this request, or None.
+
+        Only a job submitted for the same audio_version (see audio_version()) matches, so
+        new audio uploaded to the same URI is recognized again.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE backend = ? AND input_uri = ? AND audio_version IS ? "
+                "AND status IN (?, ?) AND submitted_at > ? ORDER BY submitted_at DESC LIMIT 1",
+                (backend, input_uri, audio_version, RUNNING, DONE, time.time() - MAX_RESUME_AGE_SECONDS),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def jobs(self, statuses=None):
+        """Returns journal rows as dicts, newest first, optionally filtered by status."""
+        query = "SELECT * FROM jobs"
+        params = ()
+        if statuses:
+            query += f" WHERE status IN ({', '.join('?' for _ in statuses)})"
+            params = tuple(statuses)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(query + " ORDER BY submitted_at DESC", params)]
+
+
+def audio_version(input_uri, credentials_path=SERVICE_ACCOUNT_FILE):
+    """Returns the GCS generations of the gs:// URIs in input_uri (one per line), or None.
+
+    A generation changes whenever an object is overwritten. Keys without gs:// URIs, such as
+    content hashes, already identify the audio.
+    """
+    uris = [line for line in input_uri.splitlines() if line.startswith("gs://")]
+    if not uris:
+        return None
+    storage_client = get_storage_client(credentials_path)
+    generations = []
+    for uri in uris:
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        blob = get_scheduler().call("storage", lambda: storage_client.bucket(bucket_name).get_blob(blob_name))
+        generations.append(str(blob.generation) if blob is not None else "missing")
+    return ",".join(generations)
+
+
+def _operation_types(version):
+    """Returns the (response, metadata) message types of the version's recognition operations."""
+    if version == "v2":
+        from google.cloud.speech_v2.types import cloud_speech
+        return cloud_speech.BatchRecognizeResponse, cloud_speech.OperationMetadata
+    speech = importlib.import_module(SPEECH_MODULES[version])
+    return speech.LongRunningRecognizeResponse, speech.LongRunningRecognizeMetadata
+
+
+class TrackedOperation:
+    """A journaled operation polled by an OperationTracker; result() blocks without polling."""
+
+    def __init__(self, job):
+        self.job = job
+        self.name = job["operation_name"]
+        self._future = Future()
+        self.tracked_at = time.perf_counter()
+        self.release_slot = None  # gives back the running-operation quota slot
+        self.client = None  # the client that submitted the operation; None for jobs resumed from the journal
+        self.started_at = None  # first time the service reported progress
+        self.interval = MIN_POLL_SECONDS
+        self.next_poll = 0.0
+        self.progress = 0
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        """Returns the operation's response message, raising if it failed."""
+        try:
+            return self._future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Operation {self.name} did not complete within {timeout}s") from None
+
+
+class OperationTracker:
+    """Polls many long-running recognition operations from one background loop.
+
+    Every submitted operation is written to a JobJournal first, so after a crash the
+    same request attaches to the operation that is already running (or finished)
+    instead of being recognized again. Each operation is polled with its own backoff,
+    from MIN_POLL_SECONDS up to MAX_POLL_SECONDS while it reports no new progress.
+    """
+
+    def __init__(self, journal=None, poll_workers=POLL_WORKERS):
+        self.journal = journal if journal is not None else JobJournal()
+        self.poll_workers = poll_workers
+        self._tracked = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, backend, input_uri, submit_fn, output_prefix=None, version="v2", location=None,
+               credentials_path=SERVICE_ACCOUNT_FILE, client=None):
+        """Starts submit_fn() unless the same request is already running or finished.
+
+        submit_fn returns a google.api_core operation. A request is identified by
+        (backend, input_uri); input_uri can be any stable key, such as a gs:// URI or a
+        content hash for inline audio. For gs:// URIs the objects' generations are part
+        of the key, so audio overwritten at the same URI is not answered from an old job.
+        output_prefix is only recorded: results are read from the URIs in the response,
+        so a resumed job may have written elsewhere. The operation is polled with client
+        (the one submit_fn uses) when it is given.
+        """
+        version_key = audio_version(input_uri, credentials_path)
+        tracked = self._resume(backend, input_uri, version_key, client)
+        if tracked is not None:
+            return tracked
+
+        # Submission waits for a running-operation slot and is retried on quota and transient errors
+        scheduler = get_scheduler()
+        release_slot = scheduler.hold_operation(quota_kind(version), location=location)
+        try:
+            operation = scheduler.call(quota_kind(version), submit_fn, location=location, subject=input_uri)
+        except Exception:
+            release_slot()
+            raise
+        operation_name = operation.operation.name
+        self.journal.add(operation_name, backend, input_uri, output_prefix, version, location, credentials_path,
+                         version_key)
+        return self._track({
+            "operation_name": operation_name, "backend": backend, "input_uri": input_uri,
+            "output_prefix": output_prefix, "version": version, "location": location,
+            "credentials_path": credentials_path, "status": "running",
+        }, release_slot, client)
+
+    def resume(self, backend, input_uri, credentials_path=SERVICE_ACCOUNT_FILE, client=None):
+        """Returns the TrackedOperation of a running or finished request like submit's, or None.
+
+        Lets a caller skip preparing the request (e.g. uploading its audio) when the
+        journal already has it.
+        """
+        return self._resume(backend, input_uri, audio_version(input_uri, credentials_path), client)
+
+    def _resume(self, backend, input_uri, version_key, client):
+        job = self.journal.find_resumable(backend, input_uri, version_key)
+        if job is None:
+            return None
+        print(f"Resuming {job['status']} operation {job['operation_name']} for {input_uri}")
+        return self._track(job, client=client)
+
+    def resume_all(self):
+        """Tracks every running or uncollected job in the journal; returns the TrackedOperations."""
+        cutoff = time.time() - MAX_RESUME_AGE_SECONDS
+        return [self._track(job) for job in self.journal.jobs((RUNNING, DONE)) if job["submitted_at"] > cutoff]
+
+    def mark_collected(self, tracked):
+        """Records that the results of a finished operation have been downloaded."""
+        self.journal.set_status(tracked.name, COLLECTED)
+
+    def _track(self, job, release_slot=None, client=None):
+        with self._condition:
+            tracked = self._tracked.get(job["operation_name"])
+            if tracked is None:
+                tracked = self._tracked[job["operation_name"]] = TrackedOperation(job)
+                # An operation resumed from the journal is already running; it takes a slot without waiting
+                tracked.release_slot = release_slot or get_scheduler().hold_operation(
+                    quota_kind(job["version"]), location=job["location"], block=False)
+            elif release_slot is not None:
+                release_slot()
+            tracked.client = tracked.client or client
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return tracked
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.poll_workers) as executor:
+            while True:
+                with self._condition:
+                    while not self._tracked:
+                        self._condition.wait()
+                    now = time.perf_counter()
+                    due = [tracked for tracked in self._tracked.values() if tracked.next_poll <= now]
+                    if not due:
+                        next_poll = min(tracked.next_poll for tracked in self._tracked.values())
+                        self._condition.wait(next_poll - now)
+                        continue
+                list(executor.map(self._poll, due))
+
+    def _poll(self, tracked):
+        job = tracked.job
+        try:
+            # A fresh client is only needed for jobs resumed from the journal
+            client = tracked.client or get_speech_client(job["version"], job["location"], job["credentials_path"])
+            with get_scheduler().admit("operations", location=job["location"]):
+                operation = client.transport.operations_client.get_operation(tracked.name)
+            response_type, metadata_type = _operation_types(job["version"])
+
+            if not operation.done:
+                progress = metadata_type.deserialize(operation.metadata.value).progress_percent
+                if progress and tracked.started_at is None:
+                    tracked.started_at = time.perf_counter()
+                # Back off while nothing changes; poll more often again once it moves
+                if progress != tracked.progress:
+                    tracked.interval = max(MIN_POLL_SECONDS, tracked.interval / POLL_BACKOFF)
+                else:
+                    tracked.interval = min(MAX_POLL_SECONDS, tracked.interval * POLL_BACKOFF)
+                tracked.progress = progress
+                tracked.next_poll = time.perf_counter() + tracked.interval
+                return
+
+            if operation.error.code:
+                error = f"{operation.error.code}: {operation.error.message}"
+                self.journal.set_status(tracked.name, FAILED, error)
+                # The request was accepted but the operation failed; keep the recording on record
+                get_scheduler().dead_letters.record(
+                    quota_kind(job["version"]), job["input_uri"], f"Operation {tracked.name} failed: {error}",
+                    "operation", operation.error.code, location=job["location"])
+                self._finish(tracked, error=RuntimeError(f"Operation {tracked.name} failed: {error}"))
+            else:
+                if job["status"] != COLLECTED:
+                    self.journal.set_status(tracked.name, DONE)
+                self._finish(tracked, response=response_type.deserialize(operation.response.value))
+        except Exception as e:
+            if classify(e) == PERMANENT:
+                # NotFound, PermissionDenied, an expired operation...: polling again cannot help, and
+                # leaving the job running would make later submits of the same input resume it
+                error = f"{type(e).__name__}: {e}"
+                print(f"Giving up on operation {tracked.name}: {error}")
+                self.journal.set_status(tracked.name, FAILED, error)
+                get_scheduler().dead_letters.record(
+                    quota_kind(job["version"]), job["input_uri"], f"Polling {tracked.name} failed: {error}",
+                    PERMANENT, error_code(e), location=job["location"])
+                self._finish(tracked, error=e)
+                return
+            # Transient poll errors are retried on the next round; the job stays in the journal
+            print(f"Error polling operation {tracked.name}: {e}")
+            tracked.interval = min(MAX_POLL_SECONDS, tracked.interval * POLL_BACKOFF)
+            tracked.next_poll = time.perf_counter() + tracked.interval
+
+    def _finish(self, tracked, response=None, error=None):
+        with self._condition:
+            self._tracked.pop(tracked.name, None)
+        tracked.release_slot()
+        finished = time.perf_counter()
+        started = tracked.started_at or tracked.tracked_at
+        labels = {"backend": tracked.job["backend"], "operation": tracked.name}
+        observe("queue_wait", started - tracked.tracked_at, **labels)
+        observe("recognize", finished - started, error=str(error) if error else None, **labels)
+        if error is not None:
+            tracked._future.set_exception(error)
+        else:
+            tracked._future.set_result(response)
+
+
+_default_tracker = None
+_default_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Returns the process-wide tracker backed by DEFAULT_JOURNAL_DB."""
+    global _default_tracker
+    with _default_tracker_lock:
+        if _default_tracker is None:
+            _default_tracker = OperationTracker()
+        return _default_tracker
+
+
+if __name__ == "__main__":
+    # python job_tracker.py           list the journal
+    # python job_tracker.py resume    wait for every running job left by a previous process
+    tracker = get_tracker()
+    if sys.argv[1:] == ["resume"]:
+        pending = tracker.resume_all()
+        print(f"Supervising {len(pending)} operation(s)...")
+        for tracked in pending:
+            try:
+                tracked.result()
+                print(f"Finished {tracked.name} ({tracked.job['input_uri']})")
+            except Exception as e:
+                print(f"Failed {tracked.name}: {e}")
+    else:
+        for job in tracker.journal.jobs():
+            submitted = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["submitted_at"]))
+            print(f"{submitted}  {job['status']:<9}  {job['backend']:<16}  {job['input_uri']}  {job['operation_name']}")
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+import chirp2model
+from gcs_cleanup import cleanup
+from gcs_results import job_output_dir
+from job_tracker import get_tracker
+from transcript_cache import fingerprint_audio
+
+# Marks the end of the input for a stage's workers
+_DONE = object()
+
+
+class Recording:
+    """One recording moving through the upload -> recognize -> download stages."""
+
+    def __init__(self, local_path, bucket_name, destination_prefix):
+        self.local_path = local_path
+        self.bucket_name = bucket_name
+        self.destination_prefix = destination_prefix
+        self.base_name = os.path.splitext(os.path.basename(local_path))[0]
+        # Set by name_blob() in the upload stage, where hashing overlaps with other uploads
+        self.blob_name = None
+        self.gcs_uri = None
+        self.output_dir = None
+        self.output_txt_filename = f"{self.base_name}_transcript.txt"
+        self.operation = None
+        self.error = None
+        self.timings = {}
+
+    def name_blob(self):
+        # The content hash keeps recordings with the same file name from sharing a blob (and a
+        # journaled operation); the same recording always maps to the same name
+        content_hash = fingerprint_audio(self.local_path)[:16]
+        self.blob_name = f"{self.destination_prefix.rstrip('/')}/{content_hash}-{os.path.basename(self.local_path)}"
+        self.gcs_uri = f"gs://{self.bucket_name}/{self.blob_name}"
+        # Each job writes to its own folder so concurrent downloads never mix results
+        self.output_dir = job_output_dir(self.gcs_uri)
+
+
+async def _stage(name, func, inbox, outbox, concurrency, downstream_workers=0):
+    """Runs func on recordings from inbox with `concurrency` workers, forwarding to outbox.
+
+    Queues are bounded, so a slow stage blocks the one before it instead of letting
+    work pile up in memory.
+    """
+    async def worker():
+        while True:
+            recording = await inbox.get()
+            if recording is _DONE:
+                break
+            if recording.error is None:
+                started = time.perf_counter()
+                try:
+                    # Stage implementations are the blocking helpers from the scripts
+                    await asyncio.to_thread(func, recording)
+                except Exception as e:
+                    recording.error = f"{name}: {e}"
+                    print(f"Pipeline error for {recording.local_path}: {recording.error}")
+                recording.timings[name] = time.perf_counter() - started
+            if outbox is not None:
+                await outbox.put(recording)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    for _ in range(downstream_workers):
+        await outbox.put(_DONE)
+
+
+async def run_pipeline(recordings, bucket_name, backend=chirp2model,
+                       destination_prefix="call_files/call_recordings/",
+                       upload_concurrency=4, recognize_concurrency=8, download_concurrency=4):
+    """Transcribes local recordings with overlapping upload, recognition and download.
+
+    backend is one of the v2 scripts (chirp2model, chirpModel, google_speech_api_v2);
+    its upload_to_gcs, recognize_to_gcs and download_transcription_and_save_to_txt
+    functions are used as the stage implementations. Returns the Recording objects
+    in input order.
+    """
+    jobs = [Recording(path, bucket_name, destination_prefix) for path in recordings]
+
+    def upload(recording):
+        recording.name_blob()
+        backend.upload_to_gcs(bucket_name, recording.local_path, recording.blob_name)
+
+    def recognize(recording):
+        recording.operation = backend.recognize_to_gcs(recording.gcs_uri, bucket_name, recording.output_dir)
+
+    def download(recording):
+        # The result object is read from the URI in the operation's response
+        backend.download_transcription_and_save_to_txt(
+            recording.operation.result(), recording.gcs_uri, recording.output_txt_filename
+        )
+        get_tracker().mark_collected(recording.operation)
+        # A resumed operation wrote to the folder recorded when it was first submitted
+        output_prefix = recording.operation.job["output_prefix"]
+        output_dir = urlparse(output_prefix).path.lstrip("/") if output_prefix else recording.output_dir
+        cleanup(bucket_name, names=[recording.blob_name], prefixes=[output_dir])
+
+    # Each queue holds at most one waiting item per downstream worker
+    to_upload = asyncio.Queue(maxsize=upload_concurrency)
+    to_recognize = asyncio.Queue(maxsize=recognize_concurrency)
+    to_download = asyncio.Queue(maxsize=download_concurrency)
+
+    async def feed():
+        for recording in jobs:
+            await to_upload.put(recording)
+        for _ in range(upload_concurrency):
+            await to_upload.put(_DONE)
+
+    await asyncio.gather(
+        feed(),
+        _stage("upload", upload, to_upload, to_recognize, upload_concurrency, recognize_concurrency),
+        _stage("recognize", recognize, to_recognize, to_download, recognize_concurrency, download_concurrency),
+        _stage("download", download, to_download, None, download_concurrency),
+    )
+    return jobs
+
+
+if __name__ == "__main__":
+    # python pipeline.py <file-or-directory> [...]
+    bucket_name = "bangla_audio_files"
+    recordings = chirp2model.list_recordings(sys.argv[1:])
+    started = time.perf_counter()
+    jobs = asyncio.run(run_pipeline(recordings, bucket_name))
+
+    failed = [job for job in jobs if job.error]
+    print(f"Transcribed {len(jobs) - len(failed)}/{len(jobs)} recordings "
+          f"in {time.perf_counter() - started:.1f}s")
+    for job in failed:
+        print(f"  {job.local_path}: {job.error}")
@@ -0,0 +1,361 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import observe
+
+# Environment variables read when the scheduler is created
+QUOTAS_CONFIG_ENV = "SPEECH2TEXT_QUOTAS"  # JSON file of per-kind quota overrides
+DEFAULT_PROJECT = os.environ.get("SPEECH2TEXT_PROJECT", "woven-century-448009-r7")
+# Shared by every script, next to the job journal
+DEFAULT_DEAD_LETTER_DB = os.path.join(os.path.expanduser("~"), ".cache", "speech2text", "dead_letters.sqlite3")
+
+# Quotas of each kind of call, per (project, location); set them from the Cloud console quota page
+#   requests_per_minute   token bucket refill rate
+#   burst                 requests that may start at once after an idle period (default: 1 s worth)
+#   max_concurrent        requests in flight at once from this process
+#   max_operations        long-running operations that may be running at once; a slot is held
+#                         from submission until the operation finishes
+DEFAULT_QUOTAS = {
+    "recognize": {"requests_per_minute": 900, "max_concurrent": 32},
+    "streaming": {"requests_per_minute": 300, "max_concurrent": 16},
+    "long_running": {"requests_per_minute": 150, "max_concurrent": 8, "max_operations": 100},
+    "batch_recognize": {"requests_per_minute": 150, "max_concurrent": 8, "max_operations": 50},
+    "operations": {"requests_per_minute": 600, "max_concurrent": 16},
+    "recognizer": {"requests_per_minute": 60, "max_concurrent": 4},
+    "storage": {"requests_per_minute": 6000, "max_concurrent": 64},
+}
+
+# How a failed call is treated
+THROTTLED = "throttled"  # over quota: back off and slow down every caller of the same quota
+TRANSIENT = "transient"  # retried with backoff
+PERMANENT = "permanent"  # raised at once and dead-lettered
+AMBIGUOUS = "ambiguous"  # a request that is not safe to repeat may have reached the server: raised and dead-lettered
+THROTTLED_CODES = {"RESOURCE_EXHAUSTED", 429}
+TRANSIENT_CODES = {"UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL", "ABORTED", "UNKNOWN", 408, 500, 502, 503, 504}
+# Network errors that carry no status code
+TRANSIENT_ERRORS = {"TransportError", "ConnectionError", "ChunkedEncodingError", "ReadTimeout", "ConnectTimeout"}
+# Calls that start an operation are not idempotent: resending one after a timeout or an internal
+# error can start the same job twice, so they are only retried when the server provably did not
+# take the request
+NON_IDEMPOTENT_KINDS = {"long_running", "batch_recognize"}
+REJECTED_CODES = {"UNAVAILABLE", 503}
+# (base seconds, cap seconds, attempts) of the full-jitter exponential backoff
+RETRY_POLICY = {THROTTLED: (2.0, 120.0, 8), TRANSIENT: (1.0, 30.0, 5)}
+# A throttled quota drops to half its rate (not below this fraction) and recovers by
+# RATE_RECOVERY of the configured rate with every successful call
+MIN_RATE_FRACTION = 0.1
+RATE_RECOVERY = 0.02
+
+
+def error_code(error):
+    """Returns the gRPC status name or HTTP status of a Google API error, or None."""
+    grpc_code = getattr(error, "grpc_status_code", None)
+    if grpc_code is not None:
+        return getattr(grpc_code, "name", str(grpc_code))
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    if callable(code):  # a raw grpc.RpcError
+        try:
+            return code().name
+        except Exception:
+            return None
+    return None
+
+
+def classify(error, idempotent=True):
+    """Returns THROTTLED, TRANSIENT, AMBIGUOUS or PERMANENT for an exception raised by a call.
+
+    With idempotent=False a transient error is only TRANSIENT when it shows the request
+    was rejected before it was processed (REJECTED_CODES); otherwise it is AMBIGUOUS.
+    """
+    code = error_code(error)
+    if code in THROTTLED_CODES:
+        return THROTTLED
+    if code in TRANSIENT_CODES:
+        return TRANSIENT if idempotent or code in REJECTED_CODES else AMBIGUOUS
+    if code is None and (isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in TRANSIENT_ERRORS):
+        return TRANSIENT if idempotent else AMBIGUOUS
+    return PERMANENT
+
+
+def resource_scope(name):
+    """Returns {"project", "location"} from a name like "projects/p/locations/l/recognizers/r"."""
+    parts = name.split("/")
+    scope = {}
+    for key, field in (("projects", "project"), ("locations", "location")):
+        if key in parts[:-1]:
+            scope[field] = parts[parts.index(key) + 1]
+    return scope
+
+
+class TokenBucket:
+    """Hands out requests_per_minute tokens, up to burst at once.
+
+    The rate adapts to the service: a throttled bucket halves its rate and goes into
+    debt for the cooldown, so every waiting caller pauses together instead of retrying
+    at once, and the rate creeps back up with each success.
+    """
+
+    def __init__(self, requests_per_minute, burst=None):
+        self.max_rate = requests_per_minute / 60
+        self.rate = self.max_rate
+        self.burst = burst or max(1.0, self.max_rate)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        """Waits for a token; returns the seconds spent waiting."""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self, cooldown):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0) - cooldown * self.rate
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+
+class _Slots:
+    """Counting limit that can also be taken without waiting (for resumed operations)."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, block=True):
+        started = time.monotonic()
+        with self._condition:
+            while block and self.limit is not None and self.used >= self.limit:
+                self._condition.wait()
+            self.used += 1
+        return time.monotonic() - started
+
+    def release(self):
+        with self._condition:
+            self.used -= 1
+            self._condition.notify()
+
+
+class _Quota:
+    def __init__(self, settings):
+        self.bucket = TokenBucket(settings["requests_per_minute"], settings.get("burst"))
+        self.requests = _Slots(settings.get("max_concurrent"))
+        self.operations = _Slots(settings.get("max_operations"))
+
+
+class DeadLetters:
+    """SQLite record of calls that failed for good, one row per (kind, subject).
+
+    A later successful call for the same subject removes its row, so what is left
+    are the recordings that still need attention.
+    """
+
+    def __init__(self, db_path=DEFAULT_DEAD_LETTER_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "kind TEXT NOT NULL, subject TEXT NOT NULL, project TEXT, location TEXT, category TEXT NOT NULL, "
+            "code TEXT, error TEXT NOT NULL, attempts INTEGER NOT NULL, first_failed_at REAL NOT NULL, "
+            "last_failed_at REAL NOT NULL, PRIMARY KEY (kind, subject))"
+        )
+        self._db.commit()
+
+    def record(self, kind, subject, error, category, code=None, attempts=1, project=None, location=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO dead_letters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (kind, subject) DO UPDATE "
+                "SET category = excluded.category, code = excluded.code, error = excluded.error, "
+                "attempts = dead_letters.attempts + excluded.attempts, last_failed_at = excluded.last_failed_at",
+                (kind, subject, project, location, category, None if code is None else str(code), error, attempts,
+                 now, now),
+            )
+            self._db.commit()
+
+    def resolve(self, kind, subject):
+        with self._lock:
+            if self._db.execute("DELETE FROM dead_letters WHERE kind = ? AND subject = ?", (kind, subject)).rowcount:
+                self._db.commit()
+
+    def entries(self):
+        """Returns dead letters as dicts, most recent failure first."""
+        with self._lock:
+            return [dict(row) for row in self._db.execute("SELECT * FROM dead_letters ORDER BY last_failed_at DESC")]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM dead_letters")
+            self._db.commit()
+
+
+def load_quotas(config_path=None):
+    """Returns DEFAULT_QUOTAS with the overrides from config_path (or $SPEECH2TEXT_QUOTAS)."""
+    quotas = {kind: dict(settings) for kind, settings in DEFAULT_QUOTAS.items()}
+    config_path = config_path or os.environ.get(QUOTAS_CONFIG_ENV)
+    if config_path:
+        with open(config_path, encoding="utf-8") as f:
+            for kind, overrides in json.load(f).items():
+                if kind not in quotas:
+                    raise ValueError(f"Unknown quota kind {kind!r}; choose from {', '.join(quotas)}")
+                quotas[kind].update(overrides)
+    return quotas
+
+
+class QuotaScheduler:
+    """Admission control and retries for the Google Cloud calls made by these scripts.
+
+    Every kind of call has a token bucket (request rate) and concurrency limits per
+    (project, location). call() waits for both, then runs the request; throttled and
+    transient errors are retried with full-jitter exponential backoff, anything else
+    (or running out of attempts) is raised and written to the dead-letter table when
+    the call names a subject, e.g. the recording it was made for.
+    """
+
+    def __init__(self, quotas=None, dead_letters=None, project=DEFAULT_PROJECT):
+        self.quotas = quotas if quotas is not None else load_quotas()
+        self.dead_letters = dead_letters if dead_letters is not None else DeadLetters()
+        self.project = project
+        self._scopes = {}
+        self._lock = threading.Lock()
+
+    def _quota(self, kind, project, location):
+        key = (kind, project or self.project, location or "global")
+        with self._lock:
+            quota = self._scopes.get(key)
+            if quota is None:
+                quota = self._scopes[key] = _Quota(self.quotas[kind])
+            return quota
+
+    @contextmanager
+    def admit(self, kind, project=None, location=None):
+        """Holds one request slot of kind for the enclosed block; no retries."""
+        quota = self._quota(kind, project, location)
+        waited = quota.requests.acquire()
+        try:
+            waited += quota.bucket.take()
+            if waited >= 0.01:
+                observe("quota_wait", waited, backend=kind, location=location or "global")
+            yield quota
+        finally:
+            quota.requests.release()
+
+    def hold_operation(self, kind, project=None, location=None, block=True):
+        """Takes a running-operation slot of kind and returns a function that gives it back.
+
+        block=False takes the slot even when the limit is reached, for operations that
+        are already running (e.g. resumed from the job journal).
+        """
+        quota = self._quota(kind, project, location)
+        waited = quota.operations.acquire(block)
+        if waited >= 0.01:
+            observe("quota_wait", waited, backend=kind, location=location or "global", slot="operation")
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                quota.operations.release()
+        return release
+
+    def call(self, kind, fn, project=None, location=None, subject=None, idempotent=None):
+        """Runs fn() within the quota of kind and returns its result.
+
+        Throttled and transient errors are retried according to RETRY_POLICY; the last
+        error is raised otherwise. With a subject, a final failure is dead-lettered and
+        a success clears earlier dead letters of the same subject. idempotent defaults
+        to False for NON_IDEMPOTENT_KINDS; pass False for any other call that creates
+        something (see classify).
+        """
+        if idempotent is None:
+            idempotent = kind not in NON_IDEMPOTENT_KINDS
+        attempt = 0
+        while True:
+            attempt += 1
+            with self.admit(kind, project, location) as quota:
+                try:
+                    result = fn()
+                except Exception as e:
+                    error = e
+                else:
+                    quota.bucket.succeeded()
+                    if subject is not None:
+                        self.dead_letters.resolve(kind, subject)
+                    return result
+
+            category = classify(error, idempotent)
+            code = error_code(error)
+            base, cap, attempts = RETRY_POLICY.get(category, (0.0, 0.0, 1))
+            if attempt >= attempts:
+                if subject is not None:
+                    self.dead_letters.record(kind, subject, f"{type(error).__name__}: {error}", category, code,
+                                             attempt, project or self.project, location)
+                    print(f"Giving up on {kind} for {subject} after {attempt} attempt(s) ({category}, {code}); "
+                          f"recorded in {self.dead_letters.db_path}")
+                    if category == AMBIGUOUS:
+                        print(f"The {kind} request may still have been accepted; check the running "
+                              f"operations before resubmitting {subject}")
+                raise error
+
+            if category == THROTTLED:
+                quota.bucket.throttled(base)
+            delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+            print(f"{kind} call {category} ({code}); retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            observe("quota_wait", delay, retries=1, error=str(code), backend=kind, location=location or "global")
+            time.sleep(delay)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide scheduler with load_quotas() and DEFAULT_DEAD_LETTER_DB."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = QuotaScheduler()
+        return _default_scheduler
+
+
+if __name__ == "__main__":
+    # python quota_scheduler.py         list the dead letters
+    # python quota_scheduler.py clear   forget them (after re-queueing the recordings)
+    dead_letters = DeadLetters()
+    if sys.argv[1:] == ["clear"]:
+        dead_letters.clear()
+    else:
+        for entry in dead_letters.entries():
+            failed = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_failed_at"]))
+            print(f"{failed}  {entry['kind']:<16}  {entry['category']:<9}  {entry['code'] or '-':<18}  "
+                  f"x{entry['attempts']:<3} {entry['subject']}  {entry['error']}")
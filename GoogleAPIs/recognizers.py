@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+
+from instrumentation import stage
+from quota_scheduler import get_scheduler, resource_scope
+
+# Local file that remembers resolved recognizers between runs
+RECOGNIZER_CACHE_FILE = ".recognizer_cache.json"
+RECOGNIZER_TTL_SECONDS = 24 * 3600
+
+DEFAULT_FEATURES = {
+    "enable_automatic_punctuation": True,
+    "enable_word_time_offsets": True
+}
+
+
+def _is_not_found(error):
+    from google.api_core import exceptions
+    return isinstance(error, exceptions.NotFound)
+
+
+class RecognizerManager:
+    """Resolves Speech v2 recognizers once and caches them in memory and on disk.
+
+    Entries are keyed by (parent, recognizer id, model, languages), where parent is
+    "projects/<project>/locations/<location>". A cached recognizer is trusted until
+    its TTL runs out or a request fails with NotFound, so the get/create round-trip
+    is off the critical path of every job.
+    """
+
+    def __init__(self, cache_path=RECOGNIZER_CACHE_FILE, ttl=RECOGNIZER_TTL_SECONDS):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(self._entries, cache_file, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    @staticmethod
+    def _key(parent, recognizer_id, model, language_codes):
+        return f"{parent}/recognizers/{recognizer_id}|{model}|{','.join(language_codes)}"
+
+    def invalidate(self, parent, recognizer_id, model, language_codes=("bn-BD",)):
+        """Drops a cached recognizer so the next resolve() checks the service again."""
+        with self._lock:
+            if self._entries.pop(self._key(parent, recognizer_id, model, language_codes), None):
+                self._save()
+
+    def resolve(self, client, parent, recognizer_id, model, language_codes=("bn-BD",), features=None):
+        """Returns the recognizer name, creating the recognizer only if it is missing."""
+        key = self._key(parent, recognizer_id, model, language_codes)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry["resolved_at"] < self.ttl:
+                return entry["name"]
+
+        recognizer_name = f"{parent}/recognizers/{recognizer_id}"
+        scheduler = get_scheduler()
+        try:
+            scheduler.call("recognizer", lambda: client.get_recognizer(name=recognizer_name), **resource_scope(parent))
+        except Exception as e:
+            # Only a missing recognizer is created; transient errors were already retried
+            if not _is_not_found(e):
+                raise
+            operation = scheduler.call("recognizer", lambda: client.create_recognizer(
+                parent=parent,
+                recognizer_id=recognizer_id,
+                recognizer={
+                    "language_codes": list(language_codes),
+                    "model": model,
+                    "default_recognition_config": {
+                        "auto_decoding_config": {},
+                        "features": features if features is not None else DEFAULT_FEATURES
+                    }
+                }
+            ), idempotent=False, **resource_scope(parent))
+            operation.result(timeout=300)
+            print(f"Created recognizer {recognizer_name} ({model})")
+
+        with self._lock:
+            self._entries[key] = {"name": recognizer_name, "resolved_at": time.time()}
+            self._save()
+        return recognizer_name
+
+    def run(self, client, parent, recognizer_id, model, request_fn, language_codes=("bn-BD",), features=None):
+        """Calls request_fn(recognizer_name), re-resolving once if the recognizer is gone."""
+        with stage("recognizer_lookup", recognizer=recognizer_id, model=model):
+            recognizer_name = self.resolve(client, parent, recognizer_id, model, language_codes, features)
+        try:
+            return request_fn(recognizer_name)
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            with stage("recognizer_lookup", recognizer=recognizer_id, model=model) as record:
+                record.retry()
+                self.invalidate(parent, recognizer_id, model, language_codes)
+                recognizer_name = self.resolve(client, parent, recognizer_id, model, language_codes, features)
+            return request_fn(recognizer_name)
+
+
+# Process-wide manager shared by the scripts in this folder
+recognizer_manager = RecognizerManager()
@@ -0,0 +1,129 @@
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_source import open_linear16
+from google_clients import SERVICE_ACCOUNT_FILE, SPEECH_MODULES, get_speech_client
+from instrumentation import stage
+from quota_scheduler import get_scheduler
+
+# Synchronous recognize() accepts at most 60 s of audio; keep a margin
+MAX_SEGMENT_SECONDS = 55
+MIN_SILENCE_SECONDS = 0.3
+FRAME_SECONDS = 0.03
+RECOGNIZE_WORKERS = 8
+
+
+def frame_energy(samples, sample_rate, frame_seconds=FRAME_SECONDS):
+    """Returns the RMS energy of consecutive frames of int16 samples."""
+    frame = max(1, int(sample_rate * frame_seconds))
+    count = len(samples) // frame
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:count * frame].astype(np.float32).reshape(count, frame) / 32768
+    return np.sqrt((frames ** 2).mean(axis=1))
+
+
+def find_segments(samples, sample_rate, max_seconds=MAX_SEGMENT_SECONDS,
+                  min_silence=MIN_SILENCE_SECONDS, frame_seconds=FRAME_SECONDS):
+    """Splits audio at silences into (start, end) sample ranges no longer than max_seconds.
+
+    A frame is silent when its energy is below three times the noise floor (the 10th
+    percentile of frame energies). Each segment is cut at the last long-enough silence
+    before the limit, or at the quietest frame of its second half if there is none.
+    """
+    energy = frame_energy(samples, sample_rate, frame_seconds)
+    frame = max(1, int(sample_rate * frame_seconds))
+    if len(energy) == 0:
+        return [(0, len(samples))] if len(samples) else []
+
+    threshold = max(np.percentile(energy, 10) * 3, 1e-4)
+    silent = energy < threshold
+
+    # Middle frame of every silent run that is long enough to cut in
+    min_run = max(1, int(min_silence / frame_seconds))
+    cut_points = []
+    run_start = None
+    for index, is_silent in enumerate(np.append(silent, False)):
+        if is_silent and run_start is None:
+            run_start = index
+        elif not is_silent and run_start is not None:
+            if index - run_start >= min_run:
+                cut_points.append((run_start + index) // 2)
+            run_start = None
+
+    max_frames = int(max_seconds / frame_seconds)
+    segments = []
+    start = 0
+    while len(energy) - start > max_frames:
+        limit = start + max_frames
+        candidates = [point for point in cut_points if start + max_frames // 4 < point <= limit]
+        if candidates:
+            cut = candidates[-1]
+        else:
+            cut = start + max_frames // 2 + int(np.argmin(energy[start + max_frames // 2:limit]))
+        segments.append((start * frame, cut * frame))
+        start = cut
+    segments.append((start * frame, len(samples)))
+    return segments
+
+
+def transcribe_chunked(audio_path, language_code="bn-BD", version="v1p1beta1",
+                       credentials_path=SERVICE_ACCOUNT_FILE, workers=RECOGNIZE_WORKERS):
+    """Transcribes a medium-length recording as parallel synchronous recognize() calls.
+
+    The audio is mapped as 16 kHz mono, split at silences into segments under the
+    synchronous limit and the segments are recognized concurrently. Returns
+    {"transcript", "words"} with word times relative to the start of the whole file.
+    """
+    speech = importlib.import_module(SPEECH_MODULES[version])
+    client = get_speech_client(version, credentials_path=credentials_path)
+
+    with open_linear16(audio_path) as source:
+        rate = source.sample_rate_hertz
+        # Silence detection reads the mapped samples in place
+        samples = np.frombuffer(source.view(), dtype="<i2")
+        segments = find_segments(samples, rate)
+        del samples  # release the buffer before the mapping is closed
+        print(f"Split {source.duration:.1f}s of audio into {len(segments)} segments")
+
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=rate,
+            language_code=language_code,
+            enable_word_time_offsets=True,
+            enable_automatic_punctuation=True,
+        )
+
+        def recognize(segment):
+            start, end = segment
+            # Each request copies only its own segment out of the mapping
+            audio = speech.RecognitionAudio(content=bytes(source.view(start * 2, end * 2)))
+            with stage("recognize", backend=f"google-{version}", mode="chunked", segment_start=start / rate) as record:
+                record.add_bytes((end - start) * 2)
+                return get_scheduler().call("recognize", lambda: client.recognize(config=config, audio=audio),
+                                            subject=f"{audio_path}@{start / rate:.2f}s")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            responses = list(executor.map(recognize, segments))
+
+    # Stitch in segment order, shifting word times by each segment's start
+    transcripts = []
+    words = []
+    for (start, _), response in zip(segments, responses):
+        offset = start / rate
+        for result in response.results:
+            if not result.alternatives:
+                continue
+            alternative = result.alternatives[0]
+            transcripts.append(alternative.transcript.strip())
+            for word in alternative.words:
+                words.append({
+                    "word": word.word,
+                    "start": offset + word.start_time.total_seconds(),
+                    "end": offset + word.end_time.total_seconds(),
+                    "confidence": word.confidence,
+                })
+
+    return {"transcript": " ".join(transcript for transcript in transcripts if transcript), "words": words}
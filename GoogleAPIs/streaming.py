@@ -0,0 +1,130 @@
+import importlib
+import subprocess
+import sys
+
+from google_clients import SERVICE_ACCOUNT_FILE, SPEECH_MODULES, get_speech_client
+from instrumentation import stage
+from quota_scheduler import get_scheduler
+
+# StreamingRecognize accepts about 5 minutes of audio per stream, so longer audio
+# is sent over consecutive streams that each stay below this limit
+STREAMING_LIMIT_SECONDS = 290
+# Google recommends ~100 ms frames
+FRAME_MILLISECONDS = 100
+
+
+# Read audio in fixed-size frames from a file path, "-" (stdin) or an open binary file
+def read_frames(source, frame_bytes):
+    """Yields frames of at most frame_bytes without loading the whole audio."""
+    if source == "-":
+        audio_file, close = sys.stdin.buffer, False
+    elif isinstance(source, str):
+        audio_file, close = open(source, "rb"), True
+    else:
+        audio_file, close = source, False
+
+    try:
+        while True:
+            frame = audio_file.read(frame_bytes)
+            if not frame:
+                break
+            yield frame
+    finally:
+        if close:
+            audio_file.close()
+
+
+# Decode any audio file to 16-bit mono PCM on the fly (ffmpeg is the decoder pydub uses)
+def open_pcm_stream(path, sample_rate_hertz=16000):
+    """Starts ffmpeg writing raw LINEAR16 audio of path to its stdout."""
+    return subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+         "-f", "s16le", "-ac", "1", "-ar", str(sample_rate_hertz), "-"],
+        stdout=subprocess.PIPE,
+    )
+
+
+def streaming_transcribe(source, language_code="bn-BD", encoding="LINEAR16", sample_rate_hertz=16000,
+                         version="v1p1beta1", interim_results=True, credentials_path=SERVICE_ACCOUNT_FILE):
+    """Streams audio to StreamingRecognize and yields results as they arrive.
+
+    Each yielded dict has "transcript", "is_final", "stability" and "end_time"
+    (seconds from the start of the audio). For LINEAR16 audio the stream is restarted
+    before the per-stream limit so audio of any length can be transcribed; other
+    encodings are sent over a single stream.
+    """
+    speech = importlib.import_module(SPEECH_MODULES[version])
+    client = get_speech_client(version, credentials_path=credentials_path)
+
+    streaming_config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=getattr(speech.RecognitionConfig.AudioEncoding, encoding),
+            sample_rate_hertz=sample_rate_hertz,
+            language_code=language_code,
+            enable_automatic_punctuation=True,
+        ),
+        interim_results=interim_results,
+    )
+
+    # 16-bit mono PCM has a known byte rate; compressed audio does not
+    bytes_per_second = sample_rate_hertz * 2 if encoding == "LINEAR16" else None
+    frame_bytes = bytes_per_second * FRAME_MILLISECONDS // 1000 if bytes_per_second else 4096
+    stream_limit_bytes = STREAMING_LIMIT_SECONDS * bytes_per_second if bytes_per_second else None
+
+    frames = read_frames(source, frame_bytes)
+    offset_seconds = 0.0
+    first_frame = next(frames, None)
+
+    while first_frame is not None:
+        sent = {"bytes": 0}
+
+        def requests(frame=first_frame):
+            while frame is not None:
+                sent["bytes"] += len(frame)
+                yield speech.StreamingRecognizeRequest(audio_content=frame)
+                if stream_limit_bytes and sent["bytes"] >= stream_limit_bytes:
+                    return
+                frame = next(frames, None)
+
+        # One recognize stage per stream; it includes the time the caller spends on each result.
+        # The stream holds a streaming slot while open; it is not retried, as results were already yielded
+        with get_scheduler().admit("streaming"), \
+                stage("recognize", backend=f"google-{version}", mode="streaming", offset=offset_seconds) as record:
+            for response in client.streaming_recognize(config=streaming_config, requests=requests()):
+                for result in response.results:
+                    if not result.alternatives:
+                        continue
+                    yield {
+                        "transcript": result.alternatives[0].transcript,
+                        "is_final": result.is_final,
+                        "stability": result.stability,
+                        "end_time": offset_seconds + result.result_end_time.total_seconds(),
+                    }
+            record.add_bytes(sent["bytes"])
+
+        if bytes_per_second:
+            offset_seconds += sent["bytes"] / bytes_per_second
+        # Start the next stream only if there is audio left
+        first_frame = next(frames, None) if stream_limit_bytes and sent["bytes"] >= stream_limit_bytes else None
+
+
+def stream_file(path, sample_rate_hertz=16000, **kwargs):
+    """Decodes path with ffmpeg while streaming it, so memory stays flat for any length."""
+    process = open_pcm_stream(path, sample_rate_hertz)
+    try:
+        yield from streaming_transcribe(process.stdout, sample_rate_hertz=sample_rate_hertz, **kwargs)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+if __name__ == "__main__":
+    # Stream raw 16 kHz LINEAR16 audio from a file or stdin, e.g.
+    #   ffmpeg -i call.mp3 -f s16le -ac 1 -ar 16000 - | python streaming.py -
+    source = sys.argv[1] if len(sys.argv) > 1 else "-"
+    for result in streaming_transcribe(source):
+        if result["is_final"]:
+            print(f"[{result['end_time']:7.2f}s] {result['transcript']}")
+        else:
+            print(f"  ... {result['transcript']}", end="\r")
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Shared by every script, whichever folder it is started from
+DEFAULT_CACHE_DB = os.path.join(os.path.expanduser("~"), ".cache", "speech2text", "transcripts.sqlite3")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# Hash the audio content in blocks so large recordings are never read into memory at once
+def fingerprint_audio(audio_path):
+    """Returns the SHA-256 hex digest of the file content."""
+    digest = hashlib.sha256()
+    with open(audio_path, "rb") as audio_file:
+        for block in iter(lambda: audio_file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """Transcripts and word timings keyed by audio content plus recognition settings.
+
+    A small in-memory LRU sits in front of an optional SQLite store (db_path=None keeps
+    the cache in memory only). Both layers evict least recently used entries once
+    their total size goes over the configured byte budget.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_DB, max_bytes=DEFAULT_MAX_BYTES,
+                 memory_max_bytes=DEFAULT_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = min(memory_max_bytes, max_bytes)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(audio_hash, backend, model, language, **features):
+        """Builds the cache key for audio_hash recognized with the given settings."""
+        settings = {"backend": backend, "model": model, "language": language, "features": features}
+        return audio_hash + ":" + hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def key_for_file(self, audio_path, backend, model, language, **features):
+        """Cache key for a local recording, e.g. key_for_file(path, "google-v2", "chirp_2", "bn-BD", punctuation=True)."""
+        return self.make_key(fingerprint_audio(audio_path), backend, model, language, **features)
+
+    def _remember(self, key, entry, size):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (entry, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            self._memory_bytes -= self._memory.popitem(last=False)[1][1]
+
+    def get(self, key):
+        """Returns {"transcript", "words", "created_at"} for key, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                if self._db is not None:
+                    self._db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                return self._memory[key][0]
+            if self._db is None:
+                return None
+
+            row = self._db.execute("SELECT value, size FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            entry = json.loads(row[0])
+            self._remember(key, entry, row[1])
+            return entry
+
+    def put(self, key, transcript, words=None):
+        """Stores a transcript (and optional word timings) and returns the stored entry."""
+        entry = {"transcript": transcript, "words": words or [], "created_at": time.time()}
+        value = json.dumps(entry, ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._remember(key, entry, size)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO transcripts (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, size, time.time()),
+                )
+                self._evict()
+                self._db.commit()
+        return entry
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM transcripts ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM transcripts")
+                self._db.commit()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Returns the process-wide cache backed by DEFAULT_CACHE_DB."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TranscriptCache()
+        return _default_cache
@@ -0,0 +1,567 @@
+import argparse
+import array
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+
+from transcript_cache import fingerprint_audio
+
+# Shared by every script, next to the transcript cache
+DEFAULT_STORE_DB = os.path.join(os.path.expanduser("~"), ".cache", "speech2text", "store.sqlite3")
+# Words are grouped into caption-sized segments; each segment is one row of the full-text index
+SEGMENT_MAX_SECONDS = 10.0
+SEGMENT_GAP_SECONDS = 1.0
+SENTENCE_ENDS = ("।", ".", "?", "!")
+# Bangla vowel signs are combining marks; without M* the tokenizer would split words at them
+FTS_TOKENIZER = "unicode61 remove_diacritics 0 categories 'L* N* Co M*'"
+WORD_SEPARATOR = "\x1f"
+IMPORT_BATCH_SIZE = 500
+RECORDING_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a", ".amr")
+# Suffixes the scripts add to a recording's name: "<name>_chirp2_transcript.txt",
+# "<name>_clean_transcript.txt", "<name>_transcript_<id>.json" from batch_recognize, ...
+RESULT_NAME_SUFFIX = re.compile(r"_(?:chirp2?_|clean_)?transcript(?:_[0-9A-Za-z-]+)?$")
+EXPORT_FORMATS = ("srt", "vtt", "jsonl")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    audio_hash TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    source TEXT NOT NULL,
+    duration REAL,
+    transcript TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (audio_hash, backend)
+);
+CREATE INDEX IF NOT EXISTS recordings_source ON recordings (source);
+
+-- One row per recording; each column is a packed array over all of its words
+CREATE TABLE IF NOT EXISTS words (
+    recording_id INTEGER PRIMARY KEY,
+    tokens TEXT NOT NULL,
+    starts BLOB NOT NULL,
+    ends BLOB NOT NULL,
+    confidences BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    recording_id INTEGER NOT NULL,
+    first_word INTEGER,
+    word_count INTEGER NOT NULL,
+    start_ms INTEGER,
+    end_ms INTEGER,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_recording ON segments (recording_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id', tokenize="{FTS_TOKENIZER}"
+);
+CREATE TRIGGER IF NOT EXISTS segments_fts_insert AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_fts_delete AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+# Packed little-endian columns; times are integer milliseconds
+def _pack(kind, values):
+    packed = array.array(kind, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(kind, data):
+    packed = array.array(kind)
+    packed.frombytes(data)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed
+
+
+def _ms(seconds):
+    return None if seconds is None else int(round(seconds * 1000))
+
+
+def _seconds(ms):
+    return None if ms is None else ms / 1000
+
+
+def _tokens(text):
+    """Splits text the way FTS_TOKENIZER does: runs of letters, digits and marks, lowercased."""
+    tokens = []
+    current = []
+    for char in text:
+        category = unicodedata.category(char)
+        if category[0] in "LNM" or category == "Co":
+            current.append(char)
+        elif current:
+            tokens.append("".join(current).lower())
+            current = []
+    if current:
+        tokens.append("".join(current).lower())
+    return tokens
+
+
+def _clean_words(words):
+    cleaned = []
+    for word in words or []:
+        text = " ".join(str(word.get("word", "")).split())
+        if not text:
+            continue
+        confidence = word.get("confidence")
+        cleaned.append({
+            "word": text.replace(WORD_SEPARATOR, " "),
+            "start": float(word.get("start") or 0.0),
+            "end": float(word.get("end") or word.get("start") or 0.0),
+            "confidence": float(confidence) if confidence is not None else None,
+        })
+    return cleaned
+
+
+def build_segments(words, max_seconds=SEGMENT_MAX_SECONDS, max_gap=SEGMENT_GAP_SECONDS):
+    """Groups timed words into caption-sized segments.
+
+    A segment ends at sentence punctuation, before a pause longer than max_gap, or
+    before it would run over max_seconds. Returns [(first_word, word_count, start, end, text)].
+    """
+    segments = []
+    first = 0
+
+    def close(end_index):
+        span = words[first:end_index]
+        segments.append((first, len(span), span[0]["start"], span[-1]["end"], " ".join(w["word"] for w in span)))
+
+    for index, word in enumerate(words):
+        if index > first and (word["start"] - words[index - 1]["end"] > max_gap
+                              or word["end"] - words[first]["start"] > max_seconds):
+            close(index)
+            first = index
+        if word["word"].endswith(SENTENCE_ENDS):
+            close(index + 1)
+            first = index + 1
+    if first < len(words):
+        close(len(words))
+    return segments
+
+
+def chunk_segments(chunks, duration=None):
+    """Segments from Whisper-style chunks ({"text", "timestamp": (start, end)}) without word timings."""
+    segments = []
+    for index, chunk in enumerate(chunks):
+        text = chunk.get("text", "").strip()
+        if not text:
+            continue
+        start, end = chunk.get("timestamp") or (None, None)
+        if end is None:
+            # The last chunk of a window may have no end; it lasts until the next one starts
+            following = chunks[index + 1].get("timestamp") if index + 1 < len(chunks) else None
+            end = following[0] if following else duration
+        segments.append((None, 0, start, end, text))
+    return segments
+
+
+def _find_phrase(words, tokens):
+    """Returns (first, last) indexes of the words that contain tokens in order, or None."""
+    flat = [(index, token) for index, word in enumerate(words) for token in _tokens(word["word"])]
+    for start in range(len(flat) - len(tokens) + 1):
+        if all(flat[start + offset][1] == token for offset, token in enumerate(tokens)):
+            return flat[start][0], flat[start + len(tokens) - 1][0]
+    return None
+
+
+class TranscriptStore:
+    """Searchable transcripts with word-level timestamps, one row per recording and backend.
+
+    Word texts, start/end times and confidences are kept as packed per-recording
+    columns; words are grouped into short segments that are indexed with SQLite FTS5,
+    so a phrase search returns the matching calls with the time of each mention.
+    Adding the same audio again with the same backend replaces the earlier transcript.
+    """
+
+    def __init__(self, db_path=DEFAULT_STORE_DB):
+        self._lock = threading.Lock()
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def _prepare(self, source, backend, text, words=None, chunks=None, audio_hash=None, duration=None):
+        # Hashing and segmenting happen before the write lock is taken
+        if os.path.isfile(source):
+            audio_hash = audio_hash or fingerprint_audio(source)
+            source = os.path.abspath(source)
+        audio_hash = audio_hash or "uri:" + source
+        words = _clean_words(words)
+        if words:
+            segments = build_segments(words)
+        elif chunks:
+            segments = chunk_segments(chunks, duration)
+        else:
+            segments = [(None, 0, None, None, text.strip())] if text and text.strip() else []
+        if duration is None:
+            ends = [segment[3] for segment in segments if segment[3] is not None]
+            duration = max(ends) if ends else None
+        return audio_hash, backend, source, duration, text or "", words, segments
+
+    def _insert(self, audio_hash, backend, source, duration, text, words, segments):
+        row = self._db.execute(
+            "SELECT id FROM recordings WHERE audio_hash = ? AND backend = ?", (audio_hash, backend)
+        ).fetchone()
+        if row is not None:
+            self._delete(row[0])
+        recording_id = self._db.execute(
+            "INSERT INTO recordings (audio_hash, backend, source, duration, transcript, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (audio_hash, backend, source, duration, text, time.time()),
+        ).lastrowid
+        if words:
+            self._db.execute(
+                "INSERT INTO words (recording_id, tokens, starts, ends, confidences) VALUES (?, ?, ?, ?, ?)",
+                (recording_id, WORD_SEPARATOR.join(word["word"] for word in words),
+                 _pack("i", [_ms(word["start"]) for word in words]),
+                 _pack("i", [_ms(word["end"]) for word in words]),
+                 _pack("f", [math.nan if word["confidence"] is None else word["confidence"] for word in words])),
+            )
+        self._db.executemany(
+            "INSERT INTO segments (recording_id, first_word, word_count, start_ms, end_ms, text) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(recording_id, first, count, _ms(start), _ms(end), segment_text)
+             for first, count, start, end, segment_text in segments],
+        )
+        return recording_id
+
+    def _delete(self, recording_id):
+        self._db.execute("DELETE FROM segments WHERE recording_id = ?", (recording_id,))
+        self._db.execute("DELETE FROM words WHERE recording_id = ?", (recording_id,))
+        self._db.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+
+    def add(self, source, backend, text, words=None, chunks=None, audio_hash=None, duration=None):
+        """Stores one transcript and returns its recording id.
+
+        source is the local recording or its gs:// URI. words are {"word", "start",
+        "end", "confidence"} with times in seconds; without them, Whisper chunks or
+        else the plain text are indexed.
+        """
+        return self.add_many([dict(source=source, backend=backend, text=text, words=words, chunks=chunks,
+                                   audio_hash=audio_hash, duration=duration)])[0]
+
+    def add_result(self, source, backend, result, audio_hash=None):
+        """Stores a backend result ({"text", "words" or "chunks", ...}) and returns its id."""
+        return self.add(source, backend, result["text"], words=result.get("words"), chunks=result.get("chunks"),
+                        audio_hash=audio_hash, duration=result.get("duration"))
+
+    def add_many(self, entries):
+        """Stores many transcripts (dicts of add() arguments) in one transaction; returns their ids."""
+        prepared = [self._prepare(**entry) for entry in entries]
+        with self._lock, self._db:
+            return [self._insert(*entry) for entry in prepared]
+
+    def contains(self, audio_hash, backend):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM recordings WHERE audio_hash = ? AND backend = ?", (audio_hash, backend)
+            ).fetchone() is not None
+
+    def remove(self, recording_id):
+        with self._lock, self._db:
+            self._delete(recording_id)
+
+    def recordings(self, source=None, backend=None):
+        """Lists stored recordings as {"id", "source", "backend", "duration", "created_at"}."""
+        conditions, params = [], []
+        if source is not None:
+            conditions.append("source = ?")
+            params.append(os.path.abspath(source) if os.path.exists(source) else source)
+        if backend is not None:
+            conditions.append("backend = ?")
+            params.append(backend)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, source, backend, duration, created_at FROM recordings{where} ORDER BY id", params
+            ).fetchall()
+        return [dict(zip(("id", "source", "backend", "duration", "created_at"), row)) for row in rows]
+
+    def _load_words(self, recording_id):
+        row = self._db.execute(
+            "SELECT tokens, starts, ends, confidences FROM words WHERE recording_id = ?", (recording_id,)
+        ).fetchone()
+        if row is None:
+            return []
+        starts, ends, confidences = _unpack("i", row[1]), _unpack("i", row[2]), _unpack("f", row[3])
+        return [{"word": word, "start": _seconds(start), "end": _seconds(end),
+                 "confidence": None if math.isnan(confidence) else round(confidence, 4)}
+                for word, start, end, confidence in zip(row[0].split(WORD_SEPARATOR), starts, ends, confidences)]
+
+    def get(self, recording_id):
+        """Returns a recording with its "segments" and "words", or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, source, backend, duration, transcript, created_at FROM recordings WHERE id = ?",
+                (recording_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            recording = dict(zip(("id", "source", "backend", "duration", "transcript", "created_at"), row))
+            recording["words"] = self._load_words(recording_id)
+            recording["segments"] = [
+                {"first_word": first, "word_count": count, "start": _seconds(start), "end": _seconds(end),
+                 "text": text}
+                for first, count, start, end, text in self._db.execute(
+                    "SELECT first_word, word_count, start_ms, end_ms, text FROM segments "
+                    "WHERE recording_id = ? ORDER BY id", (recording_id,)
+                )
+            ]
+        return recording
+
+    def search(self, query, limit=20, backend=None, raw=False):
+        """Finds segments that contain query; best matches first.
+
+        The query is matched as a phrase unless raw=True, in which case it is passed to
+        FTS5 as is (AND/OR/NEAR, prefix* and so on). Each hit is {"recording_id",
+        "source", "backend", "start", "end", "text", "snippet"}; for a phrase, start and
+        end are those of the matching words when word timings were stored.
+        """
+        match = query if raw else '"' + query.replace('"', '""') + '"'
+        sql = ("SELECT s.recording_id, s.first_word, s.word_count, s.start_ms, s.end_ms, s.text, "
+               "snippet(segments_fts, 0, '[', ']', '…', 16), r.source, r.backend "
+               "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+               "JOIN recordings r ON r.id = s.recording_id WHERE segments_fts MATCH ?")
+        params = [match]
+        if backend is not None:
+            sql += " AND r.backend = ?"
+            params.append(backend)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        query_tokens = [] if raw else _tokens(query)
+        hits = []
+        words_by_recording = {}
+        with self._lock:
+            for recording_id, first, count, start, end, text, snippet, source, hit_backend in self._db.execute(
+                    sql, params).fetchall():
+                start, end = _seconds(start), _seconds(end)
+                if query_tokens and first is not None:
+                    if recording_id not in words_by_recording:
+                        words_by_recording[recording_id] = self._load_words(recording_id)
+                    words = words_by_recording[recording_id][first:first + count]
+                    span = _find_phrase(words, query_tokens)
+                    if span is not None:
+                        start, end = words[span[0]]["start"], words[span[1]]["end"]
+                hits.append({"recording_id": recording_id, "source": source, "backend": hit_backend,
+                             "start": start, "end": end, "text": text, "snippet": snippet})
+        return hits
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _timestamp(seconds, separator):
+    hours, rest = divmod(int(round(seconds * 1000)), 3600 * 1000)
+    minutes, rest = divmod(rest, 60 * 1000)
+    whole, ms = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{whole:02d}{separator}{ms:03d}"
+
+
+def _timed_segments(recording):
+    segments = []
+    for segment in recording["segments"]:
+        if segment["start"] is None:
+            continue
+        if segment["end"] is None:
+            # An open-ended last chunk lasts until the end of the recording, when that is known
+            duration = recording["duration"]
+            end = duration if duration is not None and duration > segment["start"] else segment["start"]
+            segment = dict(segment, end=end)
+        segments.append(segment)
+    if not segments:
+        raise ValueError(f"Recording {recording['id']} ({recording['source']}) has no timestamps; export it as jsonl")
+    return segments
+
+
+def to_srt(recording):
+    cues = [f"{number}\n{_timestamp(segment['start'], ',')} --> {_timestamp(segment['end'], ',')}\n{segment['text']}\n"
+            for number, segment in enumerate(_timed_segments(recording), 1)]
+    return "\n".join(cues)
+
+
+def to_vtt(recording):
+    cues = [f"{_timestamp(segment['start'], '.')} --> {_timestamp(segment['end'], '.')}\n{segment['text']}\n"
+            for segment in _timed_segments(recording)]
+    return "WEBVTT\n\n" + "\n".join(cues)
+
+
+def to_jsonl(recording):
+    """One JSON object per segment, with the words that belong to it."""
+    lines = []
+    for segment in recording["segments"]:
+        words = []
+        if segment["first_word"] is not None:
+            words = recording["words"][segment["first_word"]:segment["first_word"] + segment["word_count"]]
+        lines.append(json.dumps({"source": recording["source"], "backend": recording["backend"],
+                                 "start": segment["start"], "end": segment["end"], "text": segment["text"],
+                                 "words": words}, ensure_ascii=False))
+    return "".join(line + "\n" for line in lines)
+
+
+EXPORTERS = {"srt": to_srt, "vtt": to_vtt, "jsonl": to_jsonl}
+
+
+def export(recording, fmt):
+    """Renders a recording from TranscriptStore.get as srt, vtt or jsonl text."""
+    try:
+        return EXPORTERS[fmt](recording)
+    except KeyError:
+        raise ValueError(f"Unknown export format {fmt!r}; choose from {', '.join(EXPORTERS)}") from None
+
+
+def read_result_file(path):
+    """Returns {"text", "words"} from a saved batch_recognize JSON result or a plain .txt transcript."""
+    if not path.endswith(".json"):
+        with open(path, encoding="utf-8") as text_file:
+            return {"text": text_file.read().strip(), "words": []}
+
+    from gcs_results import extract_words, iter_results
+    with open(path, "rb") as result_file:
+        results = list(iter_results(result_file))
+    transcripts = [result["alternatives"][0].get("transcript", "").strip()
+                   for result in results if result.get("alternatives")]
+    return {"text": " ".join(transcript for transcript in transcripts if transcript),
+            "words": extract_words(results)}
+
+
+def result_source(path, recordings_dir=None):
+    """Returns the recording a saved result or transcript file was made from, or None.
+
+    The recording is looked up by the name the result file was given after it, in
+    recordings_dir or next to the result file.
+    """
+    base_name = RESULT_NAME_SUFFIX.sub("", os.path.splitext(os.path.basename(path))[0])
+    folder = recordings_dir or os.path.dirname(path) or "."
+    for extension in RECORDING_EXTENSIONS:
+        candidate = os.path.join(folder, base_name + extension)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Returns the process-wide store backed by DEFAULT_STORE_DB."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = TranscriptStore()
+        return _default_store
+
+
+def _format_time(seconds):
+    return "--:--:--.---" if seconds is None else _timestamp(seconds, ".")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search and export stored transcripts")
+    parser.add_argument("--db", default=DEFAULT_STORE_DB, help="store database (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser("search", help="find the calls that mention a phrase, with times")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-n", "--limit", type=int, default=20)
+    search_parser.add_argument("-b", "--backend")
+    search_parser.add_argument("--raw", action="store_true", help="pass the query to FTS5 unchanged")
+
+    export_parser = commands.add_parser("export", help="write recordings as SRT, WebVTT or JSON lines")
+    export_parser.add_argument("recordings", nargs="+", help="recording ids or sources")
+    export_parser.add_argument("-f", "--format", choices=EXPORT_FORMATS, default="srt")
+    export_parser.add_argument("-o", "--output-dir", help="write <name>.<backend>.<format> here instead of stdout")
+
+    import_parser = commands.add_parser("import", help="bulk-load saved JSON results or .txt transcripts")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("-b", "--backend", required=True, help="backend that produced the files")
+    import_parser.add_argument("-s", "--source", action="append",
+                               help="recording (path or gs:// URI) a file was made from; give it once per file, "
+                                    "in order (default: the recording with the same name)")
+    import_parser.add_argument("--recordings", help="folder to find the recordings in (default: next to the files)")
+
+    list_parser = commands.add_parser("list", help="list stored recordings")
+    list_parser.add_argument("--source")
+    list_parser.add_argument("-b", "--backend")
+    args = parser.parse_args(argv)
+
+    store = TranscriptStore(args.db)
+    if args.command == "search":
+        started = time.perf_counter()
+        hits = store.search(args.query, args.limit, args.backend, args.raw)
+        for hit in hits:
+            print(f"{hit['source']}  {_format_time(hit['start'])}  [{hit['backend']}]  {hit['snippet']}")
+        print(f"{len(hits)} hit(s) in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+
+    elif args.command == "export":
+        recordings = []
+        for name in args.recordings:
+            found = [entry["id"] for entry in store.recordings(source=name)]
+            if not found and name.isdigit():
+                found = [int(name)]
+            if not found:
+                print(f"{name}: not in the store", file=sys.stderr)
+            recordings.extend(recording for recording in map(store.get, found) if recording is not None)
+        for recording in recordings:
+            try:
+                rendered = export(recording, args.format)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                continue
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                base_name = os.path.splitext(os.path.basename(recording["source"]))[0]
+                output_path = os.path.join(args.output_dir, f"{base_name}.{recording['backend']}.{args.format}")
+                with open(output_path, "w", encoding="utf-8") as output_file:
+                    output_file.write(rendered)
+                print(f"Exported recording {recording['id']} to {output_path}")
+            else:
+                sys.stdout.write(rendered)
+
+    elif args.command == "import":
+        if args.source and len(args.source) != len(args.files):
+            parser.error(f"--source given {len(args.source)} time(s) for {len(args.files)} file(s)")
+        sources = args.source or [result_source(path, args.recordings) for path in args.files]
+        files = []
+        for path, source in zip(args.files, sources):
+            if source is None:
+                print(f"{path}: no recording found for it; pass --source", file=sys.stderr)
+            else:
+                files.append((path, source))
+        for start in range(0, len(files), IMPORT_BATCH_SIZE):
+            batch = files[start:start + IMPORT_BATCH_SIZE]
+            entries = [dict(source=source, backend=args.backend, **read_result_file(path)) for path, source in batch]
+            store.add_many(entries)
+            print(f"Imported {start + len(batch)}/{len(files)} file(s)")
+
+    else:
+        for entry in store.recordings(args.source, args.backend):
+            duration = f"{entry['duration']:.1f}s" if entry["duration"] is not None else "?"
+            print(f"{entry['id']:>8}  {entry['backend']:<24} {duration:>9}  {entry['source']}")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import importlib.util
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+
+# GCS location used by the v2 / Chirp backends
+BUCKET_NAME = "bangla_audio_files"
+DESTINATION_PREFIX = "call_files/call_recordings/"
+# banglaspeech2text model loaded by every script; also part of its transcript cache key
+BANGLA_MODEL = os.environ.get("SPEECH2TEXT_BANGLA_MODEL", "base")
+
+# Every backend imports its SDK only when it is first used
+_lock = threading.Lock()
+_local_models = {}
+
+
+def _destination(audio_path):
+    # The content hash keeps recordings with the same file name from sharing a blob (and a
+    # journaled operation); the same recording always maps to the same name
+    from transcript_cache import fingerprint_audio
+    return f"{DESTINATION_PREFIX}{fingerprint_audio(audio_path)[:16]}-{os.path.basename(audio_path)}"
+
+
+def google_v1(audio_path):
+    import google_speech_api
+    return {"text": google_speech_api.transcribe_local_audio(audio_path)}
+
+
+def google_v1p1beta1(audio_path):
+    import google_speech_api_v1p1beta1
+    return {"text": google_speech_api_v1p1beta1.transcribe_audio(audio_path)}
+
+
+def google_v1p1beta1_chunked(audio_path):
+    from silence_chunking import transcribe_chunked
+    result = transcribe_chunked(audio_path, language_code="bn-BD", version="v1p1beta1")
+    return {"text": result["transcript"], "words": result["words"]}
+
+
+# The v2 backends send short clips inline and only upload longer files
+def google_v2_latest_long(audio_path):
+    import google_speech_api_v2
+    outcome = google_speech_api_v2.transcribe_audio_file(audio_path, BUCKET_NAME, _destination(audio_path),
+                                                         with_words=True)
+    if outcome is None:
+        return {"text": None}
+    return {"text": outcome[0], "words": outcome[1]}
+
+
+def chirp(audio_path):
+    import chirpModel
+    outcome = chirpModel.transcribe_audio_file(audio_path, BUCKET_NAME, _destination(audio_path), with_words=True)
+    if outcome is None:
+        return {"text": None}
+    return {"text": outcome[0], "words": outcome[1]}
+
+
+def chirp_2(audio_path):
+    import chirp2model
+    outcome = chirp2model.transcribe_audio_file(audio_path, BUCKET_NAME, _destination(audio_path))
+    if outcome is None:
+        return {"text": None}
+    return {"text": outcome[0], "words": outcome[1]}
+
+
+def banglaspeech2text(audio_path):
+    # Prefer a warm bangla_server.py worker; otherwise load the model in this process once
+    import bangla_server
+    if bangla_server.server_status() is not None:
+        result = bangla_server.transcribe_remote(audio_path)
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+        return {"text": result["text"]}
+
+    with _lock:
+        model = _local_models.get("banglaspeech2text")
+        if model is None:
+            from banglaspeech2text import Speech2Text
+            model = Speech2Text(BANGLA_MODEL)
+            _local_models["banglaspeech2text"] = model
+    return {"text": model.recognize(audio_path)}
+
+
+def whisper_large_v3(audio_path):
+    with _lock:
+        engine = _local_models.get("whisper")
+        if engine is None:
+            from whisper_engine import WhisperEngine
+            engine = WhisperEngine()
+            _local_models["whisper"] = engine
+    result = engine.transcribe([audio_path])[0]
+    return {"text": result["text"], "chunks": result["chunks"], "duration": result["duration"]}
+
+
+BACKENDS = {
+    "google-v1": google_v1,
+    "google-v1p1beta1": google_v1p1beta1,
+    "google-v1p1beta1-chunked": google_v1p1beta1_chunked,
+    "google-v2": google_v2_latest_long,
+    "chirp": chirp,
+    "chirp-2": chirp_2,
+    "banglaspeech2text": banglaspeech2text,
+    "whisper": whisper_large_v3,
+}
+
+# Backends that call Google Cloud and can be replaced by recorded responses offline
+GOOGLE_BACKENDS = {"google-v1", "google-v1p1beta1", "google-v1p1beta1-chunked", "google-v2", "chirp", "chirp-2"}
+
+# Module each backend imports on first use (its SDK comes with it)
+BACKEND_MODULES = {
+    "google-v1": "google_speech_api",
+    "google-v1p1beta1": "google_speech_api_v1p1beta1",
+    "google-v1p1beta1-chunked": "silence_chunking",
+    "google-v2": "google_speech_api_v2",
+    "chirp": "chirpModel",
+    "chirp-2": "chirp2model",
+    "banglaspeech2text": "bangla_server",
+    "whisper": "whisper_engine",
+}
+
+# Package each backend needs; checked without importing it
+BACKEND_PACKAGES = {
+    "google-v1": "google.cloud.speech",
+    "google-v1p1beta1": "google.cloud.speech_v1p1beta1",
+    "google-v1p1beta1-chunked": "google.cloud.speech_v1p1beta1",
+    "google-v2": "google.cloud.speech_v2",
+    "chirp": "google.cloud.speech_v2",
+    "chirp-2": "google.cloud.speech_v2",
+    "banglaspeech2text": "banglaspeech2text",
+    "whisper": "transformers",
+}
+
+# Transcript cache settings (engine, model, language, features) of each backend; chirp-2
+# uses the same key as chirp2model.transcribe_local_file and banglaspeech2text the same as
+# speech2textBangla.py
+CACHE_SETTINGS = {
+    "google-v1": ("google-v1", "default", "bn-BD", {}),
+    "google-v1p1beta1": ("google-v1p1beta1", "default", "bn-BD", {}),
+    "google-v1p1beta1-chunked": ("google-v1p1beta1", "default", "bn-BD", {"chunked": True}),
+    "google-v2": ("google-v2", "latest_long", "bn-BD", {"word_time_offsets": True}),
+    "chirp": ("google-v2", "chirp_2", "bn-BD", {"automatic_punctuation": True, "word_time_offsets": True,
+                                                "script": "chirpModel"}),
+    "chirp-2": ("google-v2", "chirp_2", "bn-BD", {"automatic_punctuation": True, "word_time_offsets": True}),
+    "banglaspeech2text": ("banglaspeech2text", BANGLA_MODEL, "bn", {}),
+    "whisper": ("whisper", "openai/whisper-large-v3", "bengali", {}),
+}
+
+
+def is_installed(name):
+    """True if the package the backend needs can be imported; nothing is imported to find out."""
+    try:
+        return importlib.util.find_spec(BACKEND_PACKAGES[name]) is not None
+    except ImportError:  # a parent package such as google.cloud is missing
+        return False
+
+
+def get_backend(name):
+    """Returns the transcribe(audio_path) -> {"text", ...} function for a backend name."""
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}") from None
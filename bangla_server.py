@@ -0,0 +1,297 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import freeze_support
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+from instrumentation import metrics, observe
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+# Seconds the workers may take to load the model (including a first download)
+DEFAULT_LOAD_TIMEOUT = 1800
+# Seconds a request may wait for its transcript, queueing included
+DEFAULT_REQUEST_TIMEOUT = 3600
+
+
+def _worker_main(model_name, slot, jobs, results, current):
+    """Loads the model once, then recognizes files from the job queue until told to stop."""
+    from banglaspeech2text import Speech2Text
+
+    started = time.perf_counter()
+    try:
+        model = Speech2Text(model_name)
+    except Exception as e:
+        results.put(("failed", os.getpid(), f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", os.getpid(), time.perf_counter() - started))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, file_name, queued_at = job
+        # Lets the service fail this job if the process dies while recognizing it
+        current[slot] = job_id
+        started_at = time.time()
+        try:
+            text, error = model.recognize(file_name), None
+        except Exception as e:
+            text, error = None, str(e)
+        finished_at = time.time()
+        current[slot] = 0
+        results.put(("done", job_id, {
+            "text": text,
+            "error": error,
+            "worker": os.getpid(),
+            "queue_seconds": round(started_at - queued_at, 3),
+            "recognize_seconds": round(finished_at - started_at, 3),
+        }))
+
+
+class TranscriptionService:
+    """A pool of worker processes that each keep a banglaspeech2text model loaded."""
+
+    def __init__(self, model_name, workers=1):
+        self.model_name = model_name
+        self.workers = workers
+        self._jobs = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        # Job each worker is recognizing, 0 when idle
+        self._current = multiprocessing.Array("q", workers)
+        self._processes = []
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def start(self, load_timeout=DEFAULT_LOAD_TIMEOUT):
+        """Starts the workers and waits until each has loaded the model.
+
+        Raises RuntimeError if a worker fails to load it or dies, and TimeoutError if
+        loading takes longer than load_timeout seconds; the workers are stopped first.
+        """
+        for slot in range(self.workers):
+            process = multiprocessing.Process(
+                target=_worker_main, args=(self.model_name, slot, self._jobs, self._results, self._current),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        deadline = time.monotonic() + load_timeout
+        loaded = set()
+        try:
+            while len(loaded) < self.workers:
+                try:
+                    kind, pid, value = self._results.get(timeout=1)
+                except queue.Empty:
+                    dead = [p for p in self._processes if p.pid not in loaded and not p.is_alive()]
+                    if dead:
+                        raise RuntimeError(f"Worker {dead[0].pid} exited with code {dead[0].exitcode} "
+                                           f"while loading {self.model_name}")
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Workers did not load {self.model_name} within {load_timeout}s")
+                    continue
+                if kind == "failed":
+                    raise RuntimeError(f"Worker {pid} could not load {self.model_name}: {value}")
+                loaded.add(pid)
+                observe("load", value, backend="banglaspeech2text", worker=pid)
+                print(f"Worker {pid} loaded {self.model_name} in {value:.1f}s")
+        except Exception:
+            self.stop()
+            raise
+        threading.Thread(target=self._route_results, daemon=True).start()
+
+    def _route_results(self):
+        while True:
+            try:
+                _, job_id, result = self._results.get(timeout=1)
+            except queue.Empty:
+                self._fail_dead_workers()
+                continue
+            with self._pending_lock:
+                waiter = self._pending.pop(job_id, None)
+            if waiter is not None:
+                waiter["result"] = result
+                waiter["event"].set()
+
+    def _fail_dead_workers(self):
+        # A crashed worker (e.g. killed for running out of memory) never reports its job
+        failed = {}
+        for slot, process in enumerate(self._processes):
+            if not process.is_alive() and self._current[slot]:
+                failed[self._current[slot]] = f"Worker {process.pid} exited with code {process.exitcode}"
+                self._current[slot] = 0
+        if not any(process.is_alive() for process in self._processes):
+            # Nothing is left to pick up the queued jobs either
+            failed.update({job_id: "No banglaspeech2text worker is running"
+                           for job_id in self._pending if job_id not in failed})
+        now = time.time()
+        with self._pending_lock:
+            waiters = [(self._pending.pop(job_id, None), error) for job_id, error in failed.items()]
+        for waiter, error in waiters:
+            if waiter is not None:
+                waiter["result"] = {"text": None, "error": error, "worker": None,
+                                    "queue_seconds": 0.0, "recognize_seconds": round(now - waiter["queued_at"], 3)}
+                waiter["event"].set()
+
+    def transcribe(self, file_name, timeout=DEFAULT_REQUEST_TIMEOUT):
+        """Queues a job and blocks until a worker has recognized it (or has died trying)."""
+        job_id = next(self._ids)
+        waiter = {"event": threading.Event(), "result": None, "queued_at": time.time()}
+        with self._pending_lock:
+            self._pending[job_id] = waiter
+        submitted = waiter["queued_at"]
+        self._jobs.put((job_id, file_name, submitted))
+        if not waiter["event"].wait(timeout):
+            with self._pending_lock:
+                self._pending.pop(job_id, None)
+            raise TimeoutError(f"Transcription of {file_name} timed out")
+        result = dict(waiter["result"])
+        result["total_seconds"] = round(time.time() - submitted, 3)
+        labels = {"backend": "banglaspeech2text", "file": os.path.basename(file_name), "worker": result["worker"]}
+        observe("queue_wait", result["queue_seconds"], **labels)
+        observe("recognize", result["recognize_seconds"], error=result["error"], **labels)
+        return result
+
+    def status(self):
+        with self._pending_lock:
+            in_flight = len(self._pending)
+        busy = sum(1 for job_id in self._current if job_id)
+        return {
+            "model": str(self.model_name),
+            "workers": self.workers,
+            "busy_workers": busy,
+            "idle_workers": self.workers - busy,
+            "in_flight": in_flight,
+        }
+
+    def stop(self):
+        for _ in self._processes:
+            self._jobs.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            # A worker still loading the model never reads the stop message
+            if process.is_alive():
+                process.terminate()
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, service.status())
+            elif self.path == "/metrics":
+                payload = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/transcribe":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                file_name = os.path.abspath(request["path"])
+            except (ValueError, KeyError):
+                self._send(400, {"error": 'expected JSON body {"path": "<audio file>"}'})
+                return
+            try:
+                result = service.transcribe(file_name, timeout=request.get("timeout", DEFAULT_REQUEST_TIMEOUT))
+            except TimeoutError as e:
+                self._send(504, {"text": None, "error": str(e)})
+                return
+            self._send(500 if result["error"] else 200, result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(model_name=None, workers=1, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Starts the workers and serves GET /health, GET /metrics and POST /transcribe until interrupted."""
+    if model_name is None:
+        from backends import BANGLA_MODEL
+        model_name = BANGLA_MODEL  # same default model as speech2textBangla.py
+
+    service = TranscriptionService(model_name, workers)
+    service.start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Serving {model_name} with {workers} worker(s) on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+# Client side
+def transcribe_remote(file_name, url=DEFAULT_URL, timeout=DEFAULT_REQUEST_TIMEOUT + 60):
+    """Sends a file path to a running server and returns {"text", "error", timings...}."""
+    body = json.dumps({"path": os.path.abspath(file_name)}).encode("utf-8")
+    request = urllib.request.Request(
+        f"{url}/transcribe", data=body, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+def server_status(url=DEFAULT_URL, timeout=2):
+    """Returns the server's /health status, or None if no server is running."""
+    try:
+        with urllib.request.urlopen(f"{url}/health", timeout=timeout) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    freeze_support()
+    parser = argparse.ArgumentParser(description="Warm banglaspeech2text transcription server")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subcommands.add_parser("serve", help="load the model and serve requests")
+    serve_parser.add_argument("--model", default=None, help="model name (default: same as speech2textBangla.py)")
+    serve_parser.add_argument("--workers", type=int, default=1)
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    client_parser = subcommands.add_parser("transcribe", help="send a file to a running server")
+    client_parser.add_argument("audio")
+    client_parser.add_argument("--url", default=DEFAULT_URL)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.model, args.workers, args.host, args.port)
+    else:
+        result = transcribe_remote(args.audio, args.url)
+        print(result.get("text") or result.get("error"))
+        print(f"queued {result.get('queue_seconds')}s, recognized {result.get('recognize_seconds')}s, "
+              f"total {result.get('total_seconds')}s")
@@ -0,0 +1,308 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import freeze_support
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+from audio_preprocess import probe_audio
+from transcript_cache import fingerprint_audio
+
+import backends
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a", ".amr")
+DEFAULT_CONCURRENCY = "1,4,8"
+RESULTS_DIR = "benchmark-results"
+# Seconds a backend may take for all its concurrency levels before its process is stopped
+DEFAULT_BACKEND_TIMEOUT = 4 * 3600
+
+
+# Corpus: every audio file in a directory, with an optional <name>.txt reference next to it
+def load_corpus(corpus_dir):
+    """Returns [{"path", "name", "hash", "duration", "reference"}] sorted by file name."""
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        path = os.path.join(corpus_dir, name)
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read()
+        corpus.append({
+            "path": path,
+            "name": name,
+            "hash": fingerprint_audio(path),
+            "duration": probe_audio(path).duration,
+            "reference": reference,
+        })
+    return corpus
+
+
+# Accuracy
+def normalize_text(text):
+    """Lowercases, drops punctuation (including the Bangla danda) and collapses whitespace."""
+    text = unicodedata.normalize("NFC", text or "").lower()
+    text = "".join(" " if unicodedata.category(c).startswith("P") else c for c in text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def edit_distance(reference, hypothesis):
+    """Levenshtein distance between two sequences."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, r in enumerate(reference, 1):
+        current = [i]
+        for j, h in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1]
+
+
+def error_counts(reference, hypothesis):
+    """Returns (word_edits, reference_words, char_edits, reference_chars)."""
+    reference = normalize_text(reference)
+    hypothesis = normalize_text(hypothesis)
+    return (edit_distance(reference.split(), hypothesis.split()), len(reference.split()),
+            edit_distance(reference, hypothesis), len(reference))
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+# Recorded responses, so the Google backends can be benchmarked offline
+def recording_path(recordings_dir, backend_name, audio_hash):
+    return os.path.join(recordings_dir, backend_name, f"{audio_hash}.json")
+
+
+def recording_backend(transcribe, backend_name, recordings_dir):
+    """Wraps a backend so every response is saved as {"text", "seconds"} for later replay."""
+    def transcribe_and_record(item):
+        started = time.perf_counter()
+        result = transcribe(item["path"])
+        path = recording_path(recordings_dir, backend_name, item["hash"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"text": result.get("text"), "seconds": time.perf_counter() - started}, f, ensure_ascii=False)
+        return result
+    return transcribe_and_record
+
+
+def replay_backend(backend_name, recordings_dir, simulate_latency=True):
+    """Returns a backend that answers from recordings, optionally sleeping for the recorded time."""
+    def replay(item):
+        path = recording_path(recordings_dir, backend_name, item["hash"])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No recorded {backend_name} response for {item['name']}")
+        with open(path, encoding="utf-8") as f:
+            recorded = json.load(f)
+        if simulate_latency:
+            time.sleep(recorded["seconds"])
+        return {"text": recorded["text"]}
+    return replay
+
+
+def make_transcriber(backend_name, record_dir=None, replay_dir=None, simulate_latency=True):
+    if replay_dir and backend_name in backends.GOOGLE_BACKENDS:
+        return replay_backend(backend_name, replay_dir, simulate_latency)
+    transcribe = backends.get_backend(backend_name)
+    if record_dir and backend_name in backends.GOOGLE_BACKENDS:
+        return recording_backend(transcribe, backend_name, record_dir)
+    return lambda item: transcribe(item["path"])
+
+
+def run_level(transcribe, corpus, concurrency):
+    """Transcribes the whole corpus with `concurrency` requests in flight."""
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            text, error = transcribe(item)["text"], None
+            # The Google scripts report errors by returning no transcript
+            if text is None:
+                raise RuntimeError("no transcript returned")
+        except Exception as e:
+            text, error = None, f"{type(e).__name__}: {e}"
+        return {"name": item["name"], "text": text, "error": error, "seconds": time.perf_counter() - started}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        files = list(executor.map(timed, corpus))
+    wall = time.perf_counter() - started
+
+    ok = [(item, f) for item, f in zip(corpus, files) if f["error"] is None]
+    latencies = [f["seconds"] for _, f in ok]
+    audio_seconds = sum(item["duration"] for item, _ in ok)
+    for item, f in zip(corpus, files):
+        f["rtf"] = f["seconds"] / item["duration"] if item["duration"] else None
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "errors": len(files) - len(ok),
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        # Sum of processing time over audio time, as if the files were run one after another
+        "rtf": sum(latencies) / audio_seconds if audio_seconds else None,
+        "files_per_second": len(ok) / wall if wall else None,
+        "audio_seconds_per_second": audio_seconds / wall if wall else None,
+        "files": files,
+    }
+
+
+def accuracy(corpus, files):
+    """Corpus-level WER / CER over the files that have a reference and a transcript."""
+    totals = [0, 0, 0, 0]
+    scored = 0
+    for item, f in zip(corpus, files):
+        if item["reference"] is None or f["text"] is None:
+            continue
+        counts = error_counts(item["reference"], f["text"])
+        f["wer"] = counts[0] / counts[1] if counts[1] else None
+        f["cer"] = counts[2] / counts[3] if counts[3] else None
+        totals = [total + count for total, count in zip(totals, counts)]
+        scored += 1
+    return {
+        "scored_files": scored,
+        "wer": totals[0] / totals[1] if totals[1] else None,
+        "cer": totals[2] / totals[3] if totals[3] else None,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children, in MB."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 / 1024 / 1024 if sys.platform == "darwin" else 1 / 1024
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_peak, children_peak) * scale
+
+
+def benchmark_backend(backend_name, corpus, levels, warmup=1, record_dir=None, replay_dir=None,
+                      simulate_latency=True):
+    """Runs every concurrency level for one backend and returns its report."""
+    transcribe = make_transcriber(backend_name, record_dir, replay_dir, simulate_latency)
+    report = {"backend": backend_name, "replayed": bool(replay_dir) and backend_name in backends.GOOGLE_BACKENDS}
+
+    # Model loading and client setup happen on the first call; keep them out of the latencies
+    started = time.perf_counter()
+    for item in corpus[:warmup]:
+        try:
+            transcribe(item)
+        except Exception as e:
+            print(f"{backend_name}: warm-up on {item['name']} failed: {e}")
+    report["warmup_seconds"] = time.perf_counter() - started
+
+    report["levels"] = []
+    for concurrency in levels:
+        level = run_level(transcribe, corpus, concurrency)
+        print(f"{backend_name} x{concurrency}: p50 {level['latency_p50']}s, p95 {level['latency_p95']}s, "
+              f"RTF {level['rtf']}, {level['errors']} errors")
+        report["levels"].append(level)
+
+    if report["levels"]:
+        report["accuracy"] = accuracy(corpus, report["levels"][0]["files"])
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def _backend_process(results, *args):
+    try:
+        results.put(benchmark_backend(*args))
+    except Exception as e:
+        results.put({"backend": args[0], "error": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(*args, timeout=DEFAULT_BACKEND_TIMEOUT):
+    """Benchmarks a backend in a fresh process so its model memory and peak RSS are its own.
+
+    A process that crashes (e.g. killed for running out of memory) or runs longer than
+    timeout seconds is reported as an error instead of blocking the run.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_backend_process, args=(results,) + args)
+    process.start()
+    deadline = time.monotonic() + timeout
+    report = None
+    while report is None:
+        try:
+            report = results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                # The report may have been flushed just before the process exited
+                try:
+                    report = results.get(timeout=1)
+                except queue.Empty:
+                    report = {"backend": args[0], "error": f"benchmark process exited with code {process.exitcode}"}
+            elif time.monotonic() > deadline:
+                process.terminate()
+                report = {"backend": args[0], "error": f"timed out after {timeout}s"}
+    process.join()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transcription backends on a fixed corpus")
+    parser.add_argument("corpus", help="directory of audio files with optional <name>.txt references")
+    parser.add_argument("--backends", default=",".join(backends.BACKENDS),
+                        help=f"comma-separated backends (default: all of {', '.join(backends.BACKENDS)})")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma-separated concurrency levels")
+    parser.add_argument("--warmup", type=int, default=1, help="files transcribed untimed before measuring")
+    parser.add_argument("--record", metavar="DIR", help="save Google responses here for offline replay")
+    parser.add_argument("--replay", metavar="DIR", help="answer Google backends from recorded responses")
+    parser.add_argument("--no-latency", action="store_true", help="replay without sleeping the recorded time")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_BACKEND_TIMEOUT,
+                        help="seconds each backend may run before it is stopped")
+    parser.add_argument("--output", help="JSON results file (default: benchmark-results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    backend_names = [name.strip() for name in args.backends.split(",") if name.strip()]
+    for name in backend_names:
+        backends.get_backend(name)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"No audio files found in {args.corpus}")
+        return
+    print(f"Corpus: {len(corpus)} files, {sum(item['duration'] for item in corpus):.1f}s of audio")
+
+    reports = []
+    for name in backend_names:
+        print(f"Benchmarking {name}...")
+        reports.append(run_isolated(name, corpus, levels, args.warmup, args.record, args.replay,
+                                    not args.no_latency, timeout=args.timeout))
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "corpus": [{key: item[key] for key in ("name", "hash", "duration")} for item in corpus],
+            "concurrency": levels,
+            "results": reports,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    freeze_support()
+    main()
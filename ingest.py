@@ -0,0 +1,425 @@
+import argparse
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import json
+import os
+import select
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+from audio_preprocess import probe_audio
+from instrumentation import metrics
+from transcript_cache import fingerprint_audio, get_default_cache
+from transcript_store import get_default_store
+
+import backends
+import speech2text
+from router import SHORT_CALL_SECONDS
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a", ".amr")
+# Which files were already transcribed, across restarts
+DEFAULT_INGEST_DB = os.path.join(os.path.expanduser("~"), ".cache", "speech2text", "ingest.sqlite3")
+# Polling: a file is complete once its size and mtime stay the same for this long
+SETTLE_SECONDS = 2.0
+POLL_SECONDS = 1.0
+# Drain rate is measured over this window
+RATE_WINDOW_SECONDS = 300
+STATUS_INTERVAL_SECONDS = 60
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _is_audio(name):
+    return not name.startswith(".") and name.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def _scan(directory):
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if _is_audio(name)]
+
+
+class InotifyWatcher:
+    """Reports files in a directory once they are closed after writing or moved in (Linux only)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+        self._pending = _scan(directory)  # files that were already there
+
+    def poll(self, timeout):
+        """Returns completed file paths, waiting up to timeout seconds for the first one."""
+        if self._pending:
+            paths, self._pending = self._pending, []
+            return paths
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped (e.g. while backpressure held us); the directory is the truth
+                return _scan(self.directory)
+            if _is_audio(os.fsdecode(name)):
+                paths.append(os.path.join(self.directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Portable fallback: rescans the directory and reports files whose size stopped changing."""
+
+    def __init__(self, directory, settle_seconds=SETTLE_SECONDS):
+        self.directory = directory
+        self.settle_seconds = settle_seconds
+        self._seen = {}  # path -> (size, mtime, first time seen with that size and mtime)
+        self._reported = set()
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        now = time.monotonic()
+        paths = []
+        current = set()
+        for path in _scan(self.directory):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            current.add(path)
+            signature = (stat.st_size, stat.st_mtime)
+            previous = self._seen.get(path)
+            if previous is None or previous[:2] != signature:
+                self._seen[path] = signature + (now,)
+                self._reported.discard(path)
+                continue
+            if path not in self._reported and now - previous[2] >= self.settle_seconds:
+                self._reported.add(path)
+                paths.append(path)
+        # Forget files that were removed
+        for path in set(self._seen) - current:
+            del self._seen[path]
+            self._reported.discard(path)
+        return paths
+
+    def close(self):
+        pass
+
+
+class QueueFileSource:
+    """A local queue: a text file that producers append one audio path per line to."""
+
+    def __init__(self, queue_path):
+        self.queue_path = queue_path
+        self._offset = 0
+        self._partial = b""
+
+    def poll(self, timeout):
+        if not os.path.exists(self.queue_path) or os.path.getsize(self.queue_path) <= self._offset:
+            time.sleep(timeout)
+            return []
+        with open(self.queue_path, "rb") as queue_file:
+            queue_file.seek(self._offset)
+            data = self._partial + queue_file.read()
+            self._offset = queue_file.tell()
+        # A line without its newline is still being written
+        *lines, self._partial = data.split(b"\n")
+        return [os.path.abspath(line.decode("utf-8").strip()) for line in lines if line.strip()]
+
+    def close(self):
+        pass
+
+
+def make_watcher(directory, polling=False, settle_seconds=SETTLE_SECONDS):
+    """Returns an InotifyWatcher, or a PollingWatcher if inotify is unavailable or polling is set."""
+    if not polling:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError, TypeError) as e:
+            print(f"inotify unavailable ({e}); polling {directory} instead")
+    return PollingWatcher(directory, settle_seconds)
+
+
+class IngestLedger:
+    """SQLite record of every ingested recording by content hash, so duplicates are skipped."""
+
+    def __init__(self, db_path=DEFAULT_INGEST_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS recordings ("
+            "audio_hash TEXT PRIMARY KEY, path TEXT NOT NULL, duration REAL, status TEXT NOT NULL, "
+            "backend TEXT, error TEXT, queued_at REAL NOT NULL, finished_at REAL)"
+        )
+        self._db.commit()
+
+    def status(self, audio_hash):
+        with self._lock:
+            row = self._db.execute("SELECT status FROM recordings WHERE audio_hash = ?", (audio_hash,)).fetchone()
+        return row[0] if row else None
+
+    def queued(self, audio_hash, path, duration):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, 'queued', NULL, NULL, ?, NULL)",
+                (audio_hash, path, duration, time.time()),
+            )
+            self._db.commit()
+
+    def finished(self, audio_hash, status, backend=None, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE recordings SET status = ?, backend = ?, error = ?, finished_at = ? WHERE audio_hash = ?",
+                (status, backend, error, time.time(), audio_hash),
+            )
+            self._db.commit()
+
+
+class IngestDaemon:
+    """Feeds recordings from watchers and queue files into transcription.
+
+    Short recordings (up to short_seconds) are taken before long ones; within each
+    group recordings are processed in arrival order. At most max_in_flight are
+    transcribed at once. Once max_pending recordings are waiting, intake stops until
+    the queue drains; an inotify watcher then rescans its directory on overflow.
+    """
+
+    def __init__(self, sources, backend=speech2text.AUTO, output_dir="transcripts", max_in_flight=4,
+                 max_pending=1000, short_seconds=SHORT_CALL_SECONDS, ledger=None, cache=None, store=None):
+        self.sources = sources
+        self.backend = backend
+        self.output_dir = output_dir
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.short_seconds = short_seconds
+        self.ledger = ledger if ledger is not None else IngestLedger()
+        self.cache = cache if cache is not None else get_default_cache()
+        # Every transcript is also indexed for phrase search
+        self.store = store if store is not None else get_default_store()
+        self._heap = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._active = set()  # hashes queued or in flight in this process
+        self._in_flight = 0
+        self._finished = deque()  # finish times within RATE_WINDOW_SECONDS
+        self._arrived = deque()
+        self._counts = {"done": 0, "failed": 0, "duplicates": 0}
+        self._stopping = threading.Event()
+
+    def offer(self, path):
+        """Queues a completed recording unless it is a duplicate; blocks while the queue is full."""
+        try:
+            audio_hash = fingerprint_audio(path)
+            duration = probe_audio(path).duration
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            return False
+
+        with self._condition:
+            if audio_hash in self._active or self.ledger.status(audio_hash) == "done":
+                self._counts["duplicates"] += 1
+                return False
+            while len(self._heap) >= self.max_pending and not self._stopping.is_set():
+                self._condition.wait()
+            if self._stopping.is_set():
+                return False
+            self._active.add(audio_hash)
+            self.ledger.queued(audio_hash, path, duration)
+            priority = 0 if duration <= self.short_seconds else 1
+            heapq.heappush(self._heap, (priority, next(self._order), path, audio_hash, duration))
+            self._arrived.append(time.monotonic())
+            self._condition.notify_all()
+        return True
+
+    def _next(self):
+        with self._condition:
+            while not self._heap or self._in_flight >= self.max_in_flight:
+                if self._stopping.is_set():
+                    return None
+                self._condition.wait(1.0)
+            self._in_flight += 1
+            item = heapq.heappop(self._heap)
+            self._condition.notify_all()
+            return item
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            _, _, path, audio_hash, duration = item
+            status, backend, error = "done", None, None
+            try:
+                result = speech2text.transcribe_file(path, self.backend, self.cache, {}, self.store)
+                if result.get("text") is None:
+                    raise RuntimeError("no transcript returned")
+                backend = result["backend"]
+                os.makedirs(self.output_dir, exist_ok=True)
+                # Named after the content too, so same-named files from different folders all keep theirs
+                output_path = speech2text.output_path(self.output_dir, path, audio_hash)
+                with open(output_path, "w", encoding="utf-8") as output_file:
+                    output_file.write(result["text"])
+                print(f"Transcribed {path} ({duration:.1f}s) with {backend} -> {output_path}")
+            except Exception as e:
+                status, error = "failed", f"{type(e).__name__}: {e}"
+                print(f"Failed {path}: {error}")
+            self.ledger.finished(audio_hash, status, backend, error)
+            with self._condition:
+                self._in_flight -= 1
+                self._counts[status] += 1
+                self._finished.append(time.monotonic())
+                # A failed file is retried only when it is seen again after a restart
+                if status == "done":
+                    self._active.discard(audio_hash)
+                self._condition.notify_all()
+
+    def status(self):
+        """Returns queue depth, in-flight count, totals and arrival / drain rates per minute."""
+        with self._condition:
+            cutoff = time.monotonic() - RATE_WINDOW_SECONDS
+            for times in (self._finished, self._arrived):
+                while times and times[0] < cutoff:
+                    times.popleft()
+            return {
+                "queued": len(self._heap),
+                "queued_short": sum(1 for item in self._heap if item[0] == 0),
+                "in_flight": self._in_flight,
+                **self._counts,
+                "arrival_rate_per_minute": len(self._arrived) * 60 / RATE_WINDOW_SECONDS,
+                "drain_rate_per_minute": len(self._finished) * 60 / RATE_WINDOW_SECONDS,
+            }
+
+    def _read_source(self, source):
+        while not self._stopping.is_set():
+            try:
+                for path in source.poll(POLL_SECONDS):
+                    self.offer(path)
+            except Exception as e:
+                print(f"Ingest source error: {e}")
+                time.sleep(POLL_SECONDS)
+
+    def run(self):
+        """Runs until interrupted, printing the status every STATUS_INTERVAL_SECONDS."""
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.max_in_flight)]
+        threads += [threading.Thread(target=self._read_source, args=(source,), daemon=True) for source in self.sources]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                time.sleep(STATUS_INTERVAL_SECONDS)
+                print(f"Ingest status: {json.dumps(self.status())}")
+        except KeyboardInterrupt:
+            print("Stopping; waiting for recordings in flight...")
+        finally:
+            self.stop()
+            for thread in threads[:self.max_in_flight]:
+                thread.join()
+            for source in self.sources:
+                source.close()
+
+    def stop(self):
+        self._stopping.set()
+        with self._condition:
+            # Recordings still waiting stay 'queued' in the ledger and are picked up on the next start
+            self._heap.clear()
+            self._condition.notify_all()
+
+
+def render_ingest_metrics(status):
+    """Returns the daemon status as Prometheus gauges and counters."""
+    lines = []
+    for name, field, kind in (
+        ("speech2text_ingest_queue_depth", "queued", "gauge"),
+        ("speech2text_ingest_in_flight", "in_flight", "gauge"),
+        ("speech2text_ingest_drain_rate_per_minute", "drain_rate_per_minute", "gauge"),
+        ("speech2text_ingest_arrival_rate_per_minute", "arrival_rate_per_minute", "gauge"),
+    ):
+        lines += [f"# TYPE {name} {kind}", f"{name} {status[field]}"]
+    lines.append("# TYPE speech2text_ingest_recordings_total counter")
+    for field in ("done", "failed", "duplicates"):
+        lines.append(f'speech2text_ingest_recordings_total{{status="{field}"}} {status[field]}')
+    return "\n".join(lines) + "\n"
+
+
+def serve_status(daemon, port, host="127.0.0.1"):
+    """Serves GET /health (status JSON) and GET /metrics (stage metrics plus ingest gauges)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                payload = json.dumps(daemon.status()).encode("utf-8")
+                content_type = "application/json"
+            elif self.path == "/metrics":
+                payload = (metrics.render_prometheus() + render_ingest_metrics(daemon.status())).encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Ingest status at http://{host}:{server.server_address[1]}/health")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch for call recordings and transcribe them as they arrive")
+    parser.add_argument("--watch", action="append", default=[], metavar="DIR", help="directory to watch")
+    parser.add_argument("--queue", action="append", default=[], metavar="FILE",
+                        help="text file that producers append audio paths to, one per line")
+    parser.add_argument("-b", "--backend", default=speech2text.AUTO, choices=[speech2text.AUTO] + list(backends.BACKENDS))
+    parser.add_argument("-o", "--output-dir", default="transcripts")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--short-seconds", type=float, default=SHORT_CALL_SECONDS,
+                        help="recordings up to this length are transcribed first")
+    parser.add_argument("--destination-prefix", default=backends.DESTINATION_PREFIX,
+                        help="GCS folder the v2 / Chirp backends upload to")
+    parser.add_argument("--poll", action="store_true", help="poll directories instead of using inotify")
+    parser.add_argument("--port", type=int, help="serve /health and /metrics on this port")
+    args = parser.parse_args()
+    if not args.watch and not args.queue:
+        parser.error("give at least one --watch directory or --queue file")
+
+    backends.DESTINATION_PREFIX = args.destination_prefix
+    sources = [make_watcher(directory, args.poll) for directory in args.watch]
+    sources += [QueueFileSource(queue_path) for queue_path in args.queue]
+    daemon = IngestDaemon(sources, args.backend, args.output_dir, args.max_in_flight, args.max_pending,
+                          args.short_seconds)
+    if args.port:
+        serve_status(daemon, args.port)
+    daemon.run()
+    metrics.print_summary()
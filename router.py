@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+from audio_preprocess import probe_audio
+from inline_recognition import SYNC_MAX_SECONDS
+
+import backends
+import bangla_server
+
+# Environment variables read when a Router is created
+ROUTER_CONFIG_ENV = "SPEECH2TEXT_ROUTER_CONFIG"  # JSON file of per-backend overrides
+ROUTER_LOG_ENV = "SPEECH2TEXT_ROUTER_LOG"        # JSON-lines log of routing decisions
+
+INTERACTIVE = "interactive"  # minimize the latency of this call
+BULK = "bulk"                # maximize throughput over a backlog
+# Without an explicit priority, calls up to this length are treated as interactive
+SHORT_CALL_SECONDS = 120
+# How long a bangla_server /health answer is trusted
+WORKER_STATUS_TTL = 2.0
+
+# Routing profile of each backend:
+#   rtf                    processing time / audio time (update from benchmark.py results)
+#   overhead_seconds       fixed time per request (upload, operation polling, result download)
+#   sync_overhead_seconds  the same for clips short enough for the inline fast path
+#   max_seconds            longest audio the backend accepts
+#   max_in_flight          concurrent requests allowed from this process
+#   requests_per_minute    request quota
+#   cost_per_minute        USD per audio minute
+#   local_worker           only used while a bangla_server worker is idle
+DEFAULT_ROUTES = {
+    "chirp-2": {"rtf": 0.15, "overhead_seconds": 25, "sync_overhead_seconds": 2, "max_seconds": 8 * 3600,
+                "max_in_flight": 20, "requests_per_minute": 120, "cost_per_minute": 0.016},
+    "chirp": {"rtf": 0.2, "overhead_seconds": 25, "sync_overhead_seconds": 2, "max_seconds": 8 * 3600,
+              "max_in_flight": 10, "requests_per_minute": 60, "cost_per_minute": 0.016},
+    "google-v2": {"rtf": 0.1, "overhead_seconds": 20, "sync_overhead_seconds": 1.5, "max_seconds": 8 * 3600,
+                  "max_in_flight": 20, "requests_per_minute": 120, "cost_per_minute": 0.016},
+    "google-v1p1beta1-chunked": {"rtf": 0.3, "overhead_seconds": 2, "max_seconds": 4 * 3600,
+                                 "max_in_flight": 8, "requests_per_minute": 60, "cost_per_minute": 0.024},
+    "banglaspeech2text": {"rtf": 0.6, "overhead_seconds": 0.5, "max_seconds": 1800,
+                          "max_in_flight": 4, "cost_per_minute": 0.0, "local_worker": True},
+    "whisper": {"rtf": 1.5, "overhead_seconds": 0.5, "max_seconds": 1800,
+                "max_in_flight": 1, "cost_per_minute": 0.0},
+}
+
+
+def load_routes(config_path=None):
+    """Returns DEFAULT_ROUTES with the overrides from config_path (or $SPEECH2TEXT_ROUTER_CONFIG).
+
+    The file maps backend names to profile fields; {"enabled": false} removes a backend.
+    """
+    routes = {name: dict(profile) for name, profile in DEFAULT_ROUTES.items()}
+    config_path = config_path or os.environ.get(ROUTER_CONFIG_ENV)
+    if config_path:
+        with open(config_path, encoding="utf-8") as f:
+            for name, overrides in json.load(f).items():
+                backends.get_backend(name)
+                routes.setdefault(name, {}).update(overrides)
+    return {name: profile for name, profile in routes.items() if profile.get("enabled", True)}
+
+
+class Router:
+    """Sends each recording to the backend expected to serve it best right now.
+
+    Interactive calls go to the lowest estimated latency; bulk calls go to the lowest
+    estimated time per free slot, which spreads a backlog over the backends with the
+    most spare capacity. Backends that cannot take the file, are at their in-flight
+    or per-minute quota, or (for local models) have no idle worker are skipped. If a
+    backend fails, the next candidate is tried.
+    """
+
+    def __init__(self, routes=None, log_path=None, max_cost_per_minute=None, worker_url=bangla_server.DEFAULT_URL):
+        self.routes = routes if routes is not None else load_routes()
+        self.log_path = log_path or os.environ.get(ROUTER_LOG_ENV) or None
+        self.max_cost_per_minute = max_cost_per_minute
+        self.worker_url = worker_url
+        self._lock = threading.Lock()
+        self._in_flight = {name: 0 for name in self.routes}
+        self._started = {name: deque() for name in self.routes}
+        self._worker_status = None
+        self._worker_checked = 0.0
+        self._worker_dispatched = 0  # local jobs sent since the last /health answer
+
+    # Measured RTFs replace the defaults
+    def update_from_benchmark(self, results_path):
+        """Takes each backend's single-request RTF from a benchmark.py results file."""
+        with open(results_path, encoding="utf-8") as f:
+            results = json.load(f)["results"]
+        for report in results:
+            levels = [level for level in report.get("levels", []) if level.get("rtf") is not None]
+            if report.get("backend") in self.routes and levels:
+                self.routes[report["backend"]]["rtf"] = min(levels, key=lambda level: level["concurrency"])["rtf"]
+
+    def _idle_local_workers(self):
+        now = time.monotonic()
+        if now - self._worker_checked > WORKER_STATUS_TTL:
+            self._worker_status = bangla_server.server_status(self.worker_url, timeout=0.5)
+            self._worker_checked = now
+            self._worker_dispatched = 0
+        if self._worker_status is None:
+            return 0
+        return self._worker_status["idle_workers"] - self._worker_dispatched
+
+    def _evaluate(self, name, duration, priority):
+        """Returns (score, estimated_seconds) or (None, reason the backend is skipped)."""
+        profile = self.routes[name]
+        if duration > profile.get("max_seconds", float("inf")):
+            return None, f"longer than {profile['max_seconds']}s"
+        if self.max_cost_per_minute is not None and profile.get("cost_per_minute", 0) > self.max_cost_per_minute:
+            return None, "over cost limit"
+        free_slots = profile.get("max_in_flight", 1) - self._in_flight[name]
+        if free_slots <= 0:
+            return None, "at in-flight quota"
+        per_minute = profile.get("requests_per_minute")
+        started = self._started[name]
+        while started and started[0] < time.monotonic() - 60:
+            started.popleft()
+        if per_minute is not None and len(started) >= per_minute:
+            return None, "at per-minute quota"
+        if profile.get("local_worker") and self._idle_local_workers() <= 0:
+            return None, "no idle local worker"
+
+        overhead = profile.get("overhead_seconds", 0)
+        if duration <= SYNC_MAX_SECONDS and "sync_overhead_seconds" in profile:
+            overhead = profile["sync_overhead_seconds"]
+        estimated = overhead + profile["rtf"] * duration
+        score = estimated if priority == INTERACTIVE else estimated / free_slots
+        # Equal scores go to the cheaper backend
+        return (score, profile.get("cost_per_minute", 0)), estimated
+
+    def _choose(self, duration, priority, exclude):
+        """Picks a backend and reserves a slot on it; returns (name, estimated_seconds, candidates)."""
+        with self._lock:
+            candidates = {}
+            best = None
+            for name in self.routes:
+                if name in exclude:
+                    candidates[name] = "failed"
+                    continue
+                score, detail = self._evaluate(name, duration, priority)
+                if score is None:
+                    candidates[name] = detail
+                    continue
+                candidates[name] = round(score[0], 3)
+                if best is None or score < best[0]:
+                    best = (score, name, detail)
+            if best is None:
+                return None, None, candidates
+
+            _, name, estimated = best
+            self._in_flight[name] += 1
+            self._started[name].append(time.monotonic())
+            if self.routes[name].get("local_worker"):
+                self._worker_dispatched += 1
+            return name, estimated, candidates
+
+    def _release(self, name):
+        with self._lock:
+            self._in_flight[name] -= 1
+
+    def _log(self, decision):
+        print(f"Routed {os.path.basename(decision['file'])} ({decision['duration']:.1f}s, {decision['priority']}) "
+              f"to {decision['backend']}" + (f" - failed: {decision['error']}" if decision["error"] else ""))
+        if self.log_path:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as log_file:
+                log_file.write(json.dumps(decision, ensure_ascii=False) + "\n")
+
+    def route(self, path, priority=None, duration=None):
+        """Returns the routing decision for path without transcribing it (no slot is kept)."""
+        duration = probe_audio(path).duration if duration is None else duration
+        priority = priority or (INTERACTIVE if duration <= SHORT_CALL_SECONDS else BULK)
+        name, estimated, candidates = self._choose(duration, priority, ())
+        if name is not None:
+            with self._lock:
+                self._in_flight[name] -= 1
+                self._started[name].pop()
+                if self.routes[name].get("local_worker"):
+                    self._worker_dispatched -= 1
+        return {"file": path, "duration": duration, "priority": priority, "backend": name,
+                "estimated_seconds": estimated, "candidates": candidates}
+
+    def transcribe(self, path, priority=None, duration=None):
+        """Transcribes path on the best available backend, falling back to the next one on failure.
+
+        priority is INTERACTIVE or BULK; by default calls up to SHORT_CALL_SECONDS are
+        interactive. Returns the backend's result dict with a "backend" key added.
+        """
+        duration = probe_audio(path).duration if duration is None else duration
+        priority = priority or (INTERACTIVE if duration <= SHORT_CALL_SECONDS else BULK)
+        failed = []
+        while True:
+            name, estimated, candidates = self._choose(duration, priority, failed)
+            if name is None:
+                raise RuntimeError(f"No backend available for {path}: {candidates}")
+
+            decision = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "file": path, "duration": round(duration, 3),
+                "priority": priority, "backend": name, "estimated_seconds": round(estimated, 3),
+                "candidates": candidates, "error": None,
+            }
+            started = time.perf_counter()
+            try:
+                result = backends.get_backend(name)(path)
+                # The Google scripts report errors by returning no transcript
+                if result.get("text") is None:
+                    raise RuntimeError("no transcript returned")
+            except Exception as e:
+                decision["error"] = f"{type(e).__name__}: {e}"
+                failed.append(name)
+            finally:
+                self._release(name)
+                decision["seconds"] = round(time.perf_counter() - started, 3)
+                self._log(decision)
+            if decision["error"] is None:
+                return dict(result, backend=name)
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_router():
+    """Returns the process-wide router configured from the environment."""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = Router()
+        return _default_router
+
+
+def transcribe(path, priority=None):
+    """Transcribes path on whichever backend the shared router picks; see Router.transcribe."""
+    return get_router().transcribe(path, priority)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe recordings on the best available backend")
+    parser.add_argument("files", nargs="+", help="audio files")
+    parser.add_argument("--priority", choices=(INTERACTIVE, BULK), help="default: by duration")
+    parser.add_argument("--benchmark", metavar="JSON", help="take backend RTFs from a benchmark.py results file")
+    parser.add_argument("--dry-run", action="store_true", help="print the routing decisions only")
+    args = parser.parse_args()
+
+    router = get_router()
+    if args.benchmark:
+        router.update_from_benchmark(args.benchmark)
+    for file_name in args.files:
+        if args.dry_run:
+            print(json.dumps(router.route(file_name, args.priority), ensure_ascii=False))
+        else:
+            print(router.transcribe(file_name, args.priority).get("text"))
@@ -0,0 +1,184 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import importlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+
+# Only lightweight modules are imported here; a backend's SDK is imported when it is selected
+import backends
+
+AUTO = "auto"
+
+
+# Time since the process was created, i.e. interpreter start-up before this module ran
+def _process_age():
+    try:
+        with open("/proc/self/stat") as stat_file:
+            start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None  # not Linux
+
+
+_INTERPRETER_SECONDS = _process_age()
+_IMPORT_SECONDS = time.perf_counter() - _STARTED
+
+
+def cache_keys(cache, audio_path, backend_name, audio_hash=None):
+    """Returns [(backend, key)] to look up; with AUTO a result from any backend counts."""
+    from transcript_cache import fingerprint_audio
+
+    audio_hash = audio_hash or fingerprint_audio(audio_path)
+    names = backends.BACKENDS if backend_name == AUTO else [backend_name]
+    keys = []
+    for name in names:
+        # A backend whose package is not installed cannot run, so there is nothing to look up for it
+        if backend_name == AUTO and not backends.is_installed(name):
+            continue
+        engine, model, language, features = backends.CACHE_SETTINGS[name]
+        keys.append((name, cache.make_key(audio_hash, engine, model, language, **features)))
+    return keys
+
+
+def transcribe_file(audio_path, backend_name, cache, timings, store=None):
+    """Returns {"text", "backend", "cached", "audio_hash", ...}, adding each phase's seconds to timings.
+
+    With a TranscriptStore, new transcripts (and cached ones it does not have yet) are
+    indexed there with their word timings.
+    """
+    started = time.perf_counter()
+    audio_hash = None
+    if cache is not None or store is not None:
+        from transcript_cache import fingerprint_audio
+        audio_hash = fingerprint_audio(audio_path)
+    keys = cache_keys(cache, audio_path, backend_name, audio_hash) if cache is not None else []
+    for name, key in keys:
+        entry = cache.get(key)
+        if entry is not None:
+            timings["cache lookup"] = timings.get("cache lookup", 0.0) + time.perf_counter() - started
+            result = {"text": entry["transcript"], "words": entry["words"], "backend": name, "cached": True,
+                      "audio_hash": audio_hash}
+            if store is not None and not store.contains(audio_hash, name):
+                _store_result(store, audio_path, result, audio_hash, timings)
+            return result
+    timings["cache lookup"] = timings.get("cache lookup", 0.0) + time.perf_counter() - started
+
+    started = time.perf_counter()
+    if backend_name == AUTO:
+        import router
+        transcribe = router.transcribe
+    else:
+        importlib.import_module(backends.BACKEND_MODULES[backend_name])
+        transcribe = backends.get_backend(backend_name)
+    timings["backend import"] = timings.get("backend import", 0.0) + time.perf_counter() - started
+
+    started = time.perf_counter()
+    result = dict(transcribe(audio_path))
+    timings["transcribe"] = timings.get("transcribe", 0.0) + time.perf_counter() - started
+    result.setdefault("backend", backend_name)
+    result["cached"] = False
+    result["audio_hash"] = audio_hash
+
+    key = dict(keys).get(result["backend"])
+    if key is not None and result.get("text") is not None:
+        cache.put(key, result["text"], result.get("words"))
+    if store is not None and result.get("text") is not None:
+        _store_result(store, audio_path, result, audio_hash, timings)
+    return result
+
+
+def _store_result(store, audio_path, result, audio_hash, timings):
+    started = time.perf_counter()
+    store.add_result(audio_path, result["backend"], result, audio_hash=audio_hash)
+    timings["store"] = timings.get("store", 0.0) + time.perf_counter() - started
+
+
+def output_path(output_dir, audio_path, audio_hash=None):
+    """Returns <output_dir>/<name>-<hash>.txt for a recording.
+
+    The first 8 hex digits of the content hash keep recordings with the same file name
+    (from different folders, or re-recorded) from overwriting each other's transcript.
+    """
+    from transcript_cache import fingerprint_audio
+
+    audio_hash = audio_hash or fingerprint_audio(audio_path)
+    base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    return os.path.join(output_dir, f"{base_name}-{audio_hash[:8]}.txt")
+
+
+def print_timings(timings):
+    """Writes the start-up and per-phase breakdown to stderr."""
+    phases = []
+    if _INTERPRETER_SECONDS is not None:
+        phases.append(("interpreter", _INTERPRETER_SECONDS))
+    phases.append(("cli imports", _IMPORT_SECONDS))
+    phases.extend(timings.items())
+    # Credential loading and model loading happen inside the first call and are timed as stages
+    instrumentation = sys.modules.get("instrumentation")
+    if instrumentation is not None:
+        for (name, backend), totals in sorted(instrumentation.metrics.snapshot().items()):
+            if name in ("credentials", "load"):
+                phases.append((f"  of which {name}" + (f" ({backend})" if backend else ""), totals["seconds"]))
+    phases.append(("total", time.perf_counter() - _STARTED + (_INTERPRETER_SECONDS or 0.0)))
+    for name, seconds in phases:
+        print(f"{name:<32} {seconds * 1000:>9.1f} ms", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="speech2text", description="Transcribe Bangla recordings with any of the backends in this repo"
+    )
+    parser.add_argument("files", nargs="+", help="audio files")
+    parser.add_argument("-b", "--backend", default=AUTO, choices=[AUTO] + list(backends.BACKENDS),
+                        help="backend to use; auto lets router.py choose per file (default)")
+    parser.add_argument("-o", "--output-dir", help="write <name>-<hash>.txt here instead of printing the transcripts")
+    parser.add_argument("--no-cache", action="store_true", help="always transcribe, ignoring stored transcripts")
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not index the transcripts for search (see GoogleAPIs/transcript_store.py)")
+    parser.add_argument("--timings", action="store_true", help="print a start-up and per-phase time breakdown")
+    args = parser.parse_args(argv)
+
+    timings = {}
+    cache = None
+    if not args.no_cache:
+        from transcript_cache import get_default_cache
+        cache = get_default_cache()
+    store = None
+    if not args.no_store:
+        from transcript_store import get_default_store
+        store = get_default_store()
+
+    failed = 0
+    for audio_path in args.files:
+        try:
+            result = transcribe_file(audio_path, args.backend, cache, timings, store)
+        except Exception as e:
+            result = {"text": None, "error": f"{type(e).__name__}: {e}"}
+        if result.get("text") is None:
+            failed += 1
+            print(f"{audio_path}: transcription failed {result.get('error', '')}".rstrip(), file=sys.stderr)
+            continue
+
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            transcript_path = output_path(args.output_dir, audio_path, result.get("audio_hash"))
+            with open(transcript_path, "w", encoding="utf-8") as output_file:
+                output_file.write(result["text"])
+            print(f"{audio_path}: {result['backend']}{' (cached)' if result['cached'] else ''} -> {transcript_path}")
+        else:
+            print(result["text"])
+
+    if args.timings:
+        print_timings(timings)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
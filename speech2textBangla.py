@@ -29,33 +29,59 @@
 # print(f"Output saved to: {output_path}")
 
 
-from banglaspeech2text import Speech2Text
 import os
+import sys
 from multiprocessing import freeze_support
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+from transcript_cache import get_default_cache
+from instrumentation import metrics, stage
+from backends import BANGLA_MODEL
+from bangla_server import server_status, transcribe_remote
+
 def main():
-    # Load a model
-    models = Speech2Text.list_models()  # get a list of available models
-    print(models)  # print the list of models
-    model = models[1]  # select a model
+    # A running bangla_server.py already has its model loaded; otherwise use the same one as backends.py
+    server = server_status()
+    model = server["model"] if server is not None else BANGLA_MODEL  # set SPEECH2TEXT_BANGLA_MODEL to change it
     print(model)  # print the model name
-    model = Speech2Text(model)  # load the model
 
     # Use with file
     # Get path to Downloads folder
     downloads_path = os.path.join(os.path.expanduser('~'), 'Downloads')
     file_name = os.path.join(downloads_path, '245.mp3')
 
-    output = model.recognize(file_name)
-    print(output)  # output will be a dict containing text
+    # Reuse the transcript if this exact audio was already recognized with this model
+    cache = get_default_cache()
+    key = cache.key_for_file(file_name, "banglaspeech2text", str(model), "bn")
+    cached = cache.get(key)
+    if cached is not None:
+        output_text = cached["transcript"]
+        print("Using cached transcription")
+    elif server is not None:
+        result = transcribe_remote(file_name)
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+        output_text = result["text"]
+        print(output_text)
+        cache.put(key, output_text)
+    else:
+        from banglaspeech2text import Speech2Text
+        with stage("load", backend="banglaspeech2text", model=model):
+            model = Speech2Text(model)  # load the model
+        with stage("recognize", backend="banglaspeech2text", file=os.path.basename(file_name)):
+            output = model.recognize(file_name)
+        print(output)  # output will be a dict containing text
+        output_text = output
+        cache.put(key, output_text)
 
     # Write output to text file
-    output_text = output
     output_path = os.path.join(downloads_path, 'speech_output_new.txt')
 
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(output_text)
 
+    metrics.print_summary()
+
 if __name__ == '__main__':
     freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "GoogleAPIs"))
+from transcript_store import TranscriptStore, export
+
+CHUNKS = [{"text": " hello", "timestamp": (0.0, 1.0)}, {"text": " world", "timestamp": (1.0, None)}]
+
+
+def test_open_ended_last_chunk_ends_at_its_start_without_duration():
+    store = TranscriptStore(":memory:")
+    recording_id = store.add("gs://bucket/call.wav", "whisper", "hello world", chunks=CHUNKS)
+
+    srt = export(store.get(recording_id), "srt")
+
+    assert "00:00:01,000 --> 00:00:01,000\nworld" in srt
+    assert "WEBVTT" in export(store.get(recording_id), "vtt")
+
+
+def test_open_ended_last_chunk_ends_at_duration():
+    store = TranscriptStore(":memory:")
+    recording_id = store.add("gs://bucket/call.wav", "whisper", "hello world", chunks=CHUNKS, duration=2.5)
+
+    srt = export(store.get(recording_id), "srt")
+
+    assert "00:00:01,000 --> 00:00:02,500\nworld" in srt
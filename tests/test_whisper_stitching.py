@@ -0,0 +1,134 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import whisper_engine
+import whisper_parallel
+from whisper_engine import (BATCH_SIZE, MODEL_ID, OVERLAP_SECONDS, SAMPLE_RATE, WINDOW_SECONDS, WhisperEngine,
+                            split_windows, stitch_windows)
+from whisper_parallel import ParallelWhisper, seam_times, text_away_from_seams
+
+DURATION = 62.0
+
+
+# One word per second, as the model would report it for the whole recording
+def spoken_words(duration=DURATION):
+    return [{"text": f" w{second}", "timestamp": (second + 0.2, second + 0.8)} for second in range(int(duration))]
+
+
+def window_outputs(words, duration=DURATION):
+    """Per-window segments with window-relative times, as transcribe_windows returns them."""
+    starts = [start for start, _ in split_windows(np.zeros(int(duration * SAMPLE_RATE), dtype=np.float32))]
+    window_segments = []
+    for start in starts:
+        end = start + WINDOW_SECONDS
+        window_segments.append([
+            {"text": word["text"], "timestamp": (word["timestamp"][0] - start, word["timestamp"][1] - start)}
+            for word in words if start <= word["timestamp"][0] and word["timestamp"][1] <= end
+        ])
+    return window_segments, starts
+
+
+def test_overlap_text_is_kept_once():
+    words = spoken_words()
+    window_segments, starts = window_outputs(words)
+    # The overlaps really do repeat words
+    assert sum(len(segments) for segments in window_segments) > len(words)
+
+    result = stitch_windows(window_segments, starts, DURATION)
+
+    assert result["text"] == "".join(word["text"] for word in words).strip()
+    assert [chunk["text"] for chunk in result["chunks"]] == [word["text"] for word in words]
+
+
+def test_timestamps_are_offset_by_window_start():
+    words = spoken_words()
+    window_segments, starts = window_outputs(words)
+
+    result = stitch_windows(window_segments, starts, DURATION)
+
+    assert [chunk["timestamp"] for chunk in result["chunks"]] == [word["timestamp"] for word in words]
+
+
+def test_open_ended_segment_ends_at_window_or_audio_end():
+    starts = [0.0, WINDOW_SECONDS - OVERLAP_SECONDS]
+    window_segments = [
+        [{"text": " a", "timestamp": (1.0, None)}],
+        [{"text": " b", "timestamp": (10.0, None)}],
+    ]
+
+    result = stitch_windows(window_segments, starts, 40.0)
+
+    assert result["chunks"] == [
+        {"text": " a", "timestamp": (1.0, float(WINDOW_SECONDS))},
+        {"text": " b", "timestamp": (35.0, 40.0)},
+    ]
+
+
+def test_seam_times_match_split_windows():
+    for duration in (10.0, 30.0, 31.0, DURATION, 300.0):
+        starts = [start for start, _ in split_windows(np.zeros(int(duration * SAMPLE_RATE), dtype=np.float32))]
+        assert seam_times(duration) == [start + OVERLAP_SECONDS / 2 for start in starts[1:]]
+
+
+def test_text_away_from_seams_drops_words_near_seams():
+    words = spoken_words()
+    window_segments, starts = window_outputs(words)
+    result = stitch_windows(window_segments, starts, DURATION)
+    # A different word at a seam (as a second run may produce) does not count as a mismatch
+    changed = dict(result, chunks=[dict(chunk, text=" x") if chunk["timestamp"][0] == 27.2 else chunk
+                                   for chunk in result["chunks"]])
+
+    kept = text_away_from_seams(result, DURATION)
+
+    assert kept == text_away_from_seams(changed, DURATION)
+    assert "w0" in kept.split() and "w27" not in kept.split()
+
+
+class FakeEngine(WhisperEngine):
+    """WhisperEngine without the model: "recognizes" the word ids encoded by spoken_audio()."""
+
+    def __init__(self, model_id=MODEL_ID, language="bengali", quantize=False, intra_op_threads=None,
+                 inter_op_threads=1, batch_size=BATCH_SIZE, weights_path=None):
+        self.batch_size = batch_size
+
+    def transcribe_windows(self, windows):
+        segments = []
+        for window in windows:
+            heard = []
+            for second in range(int(np.ceil(len(window) / SAMPLE_RATE))):
+                start, end = second + 0.2, second + 0.8
+                if end * SAMPLE_RATE > len(window):
+                    break
+                word_id = int(round(window[int((second + 0.5) * SAMPLE_RATE)] * 1000))
+                heard.append({"text": f" w{word_id}", "timestamp": (start, end)})
+            segments.append(heard)
+        return segments
+
+
+# Each second of audio holds one word, its id encoded in the sample values
+def spoken_audio(duration):
+    return np.repeat(np.arange(int(duration), dtype=np.float32) / 1000, SAMPLE_RATE)
+
+
+def test_parallel_matches_single_process(monkeypatch):
+    duration = 95.0
+    samples = spoken_audio(duration)
+    monkeypatch.setattr(whisper_engine, "load_audio", lambda audio_path: samples)
+    monkeypatch.setattr(whisper_parallel, "load_audio", lambda audio_path: samples)
+
+    single = FakeEngine().transcribe(["call.wav"])[0]
+    # One window per task, so neighbouring windows are recognized by different workers
+    parallel = ParallelWhisper(workers=2, threads_per_worker=1, batch_size=1, engine_class=FakeEngine,
+                               weights_path="unused")
+    try:
+        result = parallel.transcribe("call.wav")
+    finally:
+        parallel.close()
+
+    assert len(seam_times(duration)) == 3
+    assert result["text"] == single["text"]
+    assert result["chunks"] == single["chunks"]
+    assert single["text"] == " ".join(f"w{second}" for second in range(int(duration)))
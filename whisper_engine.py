@@ -0,0 +1,211 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+from audio_preprocess import normalize_audio
+from instrumentation import metrics, stage
+
+MODEL_ID = "openai/whisper-large-v3"
+SAMPLE_RATE = 16000
+# Whisper sees 30 s at a time; neighbouring windows overlap so no word is cut in half
+WINDOW_SECONDS = 30
+OVERLAP_SECONDS = 5
+BATCH_SIZE = 8
+# Float32 state dicts saved for memory-mapped loading, one file per model
+WEIGHTS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "speech2text", "whisper")
+
+
+def load_audio(audio_path):
+    """Decodes audio_path to 16 kHz mono float32 samples."""
+    normalized = normalize_audio(audio_path, target_rate=SAMPLE_RATE)
+    return np.frombuffer(normalized.content, dtype="<i2").astype(np.float32) / 32768
+
+
+def split_windows(samples, window_seconds=WINDOW_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    """Returns (start_seconds, samples) windows covering the audio with the given overlap."""
+    window = int(window_seconds * SAMPLE_RATE)
+    step = int((window_seconds - overlap_seconds) * SAMPLE_RATE)
+    windows = []
+    start = 0
+    while True:
+        windows.append((start / SAMPLE_RATE, samples[start:start + window]))
+        if start + window >= len(samples):
+            break
+        start += step
+    return windows
+
+
+def stitch_windows(window_segments, window_starts, duration, window_seconds=WINDOW_SECONDS,
+                   overlap_seconds=OVERLAP_SECONDS):
+    """Merges per-window segments into one timeline, dropping duplicates from the overlaps.
+
+    window_segments[i] holds the {"text", "timestamp": (start, end)} segments of window i
+    with times relative to that window. Each window owns the time from the middle of its
+    leading overlap to the middle of its trailing overlap; a segment is kept only by the
+    window that owns its midpoint.
+    """
+    chunks = []
+    for index, (segments, window_start) in enumerate(zip(window_segments, window_starts)):
+        own_start = window_start + overlap_seconds / 2 if index > 0 else 0.0
+        own_end = (window_start + window_seconds - overlap_seconds / 2
+                   if index < len(window_starts) - 1 else float("inf"))
+        for segment in segments:
+            start, end = segment["timestamp"]
+            start = window_start + (start or 0.0)
+            end = window_start + end if end is not None else min(window_start + window_seconds, duration)
+            if own_start <= (start + end) / 2 < own_end:
+                chunks.append({"text": segment["text"], "timestamp": (round(start, 2), round(end, 2))})
+
+    text = "".join(chunk["text"] for chunk in chunks).strip()
+    return {"text": text, "chunks": chunks}
+
+
+def mmap_weights_path(model_id=MODEL_ID, cache_dir=WEIGHTS_CACHE_DIR):
+    return os.path.join(cache_dir, model_id.replace("/", "--") + ".pt")
+
+
+# Save the weights once in a form every process can map instead of copying
+def save_mmap_weights(model_id=MODEL_ID, cache_dir=WEIGHTS_CACHE_DIR):
+    """Writes the model's float32 state dict for torch.load(mmap=True) unless it exists; returns its path."""
+    import torch
+    from transformers import AutoModelForSpeechSeq2Seq
+
+    path = mmap_weights_path(model_id, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True, use_safetensors=True
+        )
+        torch.save(model.state_dict(), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        print(f"Saved memory-mappable weights of {model_id} to {path}")
+    return path
+
+
+def _load_mmapped(model_id, weights_path):
+    # Parameters are views of the mapped file, so processes loading the same file share its pages
+    import torch
+    from transformers import AutoConfig, AutoModelForSpeechSeq2Seq
+
+    with torch.device("meta"):
+        model = AutoModelForSpeechSeq2Seq.from_config(AutoConfig.from_pretrained(model_id), torch_dtype=torch.float32)
+    model.load_state_dict(torch.load(weights_path, mmap=True, weights_only=True), assign=True)
+    model.tie_weights()
+    return model
+
+
+class WhisperEngine:
+    """Whisper-large-v3 loaded once for CPU inference over batched 30 s windows.
+
+    intra_op_threads defaults to every core; inter_op_threads stays at 1 because a
+    single batched forward pass already saturates the cores. quantize=True applies
+    int8 dynamic quantization to the Linear layers, which is where most CPU time goes.
+    weights_path loads a file from save_mmap_weights() memory-mapped instead, so
+    several engine processes share one copy of the weights (not with quantize).
+    """
+
+    def __init__(self, model_id=MODEL_ID, language="bengali", quantize=False,
+                 intra_op_threads=None, inter_op_threads=1, batch_size=BATCH_SIZE, weights_path=None):
+        import torch
+        from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor
+
+        if quantize and weights_path:
+            raise ValueError("Quantized weights are private to each process; use quantize or weights_path")
+
+        torch.set_num_threads(intra_op_threads or os.cpu_count())
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            pass  # can only be set once per process, before any parallel work
+
+        started = time.perf_counter()
+        with stage("load", backend="whisper", model=model_id, quantize=quantize):
+            if weights_path:
+                model = _load_mmapped(model_id, weights_path).eval()
+            else:
+                model = AutoModelForSpeechSeq2Seq.from_pretrained(
+                    model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True, use_safetensors=True
+                ).eval()
+            if quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f"Loaded {model_id} in {time.perf_counter() - started:.1f}s"
+              f"{' (int8 dynamic quantization)' if quantize else ''}")
+
+        self.torch = torch
+        self.model = model
+        self.processor = AutoProcessor.from_pretrained(model_id)
+        self.language = language
+        self.batch_size = batch_size
+
+    def transcribe_windows(self, windows):
+        """Runs the model over a list of sample arrays (each <= 30 s) in batches.
+
+        Returns one list of {"text", "timestamp"} segments per window, with times
+        relative to the start of that window.
+        """
+        segments = []
+        for start in range(0, len(windows), self.batch_size):
+            batch = windows[start:start + self.batch_size]
+            with stage("recognize", backend="whisper", windows=len(batch)):
+                features = self.processor.feature_extractor(
+                    batch, sampling_rate=SAMPLE_RATE, return_tensors="pt"
+                ).input_features
+                with self.torch.inference_mode():
+                    token_ids = self.model.generate(
+                        features, language=self.language, task="transcribe", return_timestamps=True
+                    )
+                decoded = self.processor.batch_decode(token_ids, skip_special_tokens=True, output_offsets=True)
+            for item in decoded:
+                offsets = item.get("offsets") or [{"text": item["text"], "timestamp": (0.0, None)}]
+                segments.append([{"text": o["text"], "timestamp": o["timestamp"]} for o in offsets])
+        return segments
+
+    def transcribe(self, audio_paths):
+        """Transcribes one or more files, batching windows from all of them together.
+
+        Returns a list of {"text", "chunks", "duration", "seconds", "rtf"} in input order.
+        """
+        started = time.perf_counter()
+        files = []
+        all_windows = []
+        for audio_path in audio_paths:
+            samples = load_audio(audio_path)
+            windows = split_windows(samples)
+            files.append((len(all_windows), windows, len(samples) / SAMPLE_RATE))
+            all_windows.extend(window for _, window in windows)
+
+        window_segments = self.transcribe_windows(all_windows)
+        elapsed = time.perf_counter() - started
+
+        results = []
+        total_duration = sum(duration for _, _, duration in files)
+        for first, windows, duration in files:
+            with stage("postprocess", backend="whisper"):
+                result = stitch_windows(
+                    window_segments[first:first + len(windows)], [start for start, _ in windows], duration
+                )
+            # Batched files share the forward passes, so time is attributed by duration
+            seconds = elapsed * duration / total_duration if total_duration else 0.0
+            result.update(duration=duration, seconds=seconds, rtf=seconds / duration if duration else 0.0)
+            results.append(result)
+        print(f"Transcribed {total_duration:.1f}s of audio in {elapsed:.1f}s "
+              f"(real-time factor {elapsed / max(total_duration, 1e-9):.2f})")
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe audio with Whisper-large-v3 on CPU")
+    parser.add_argument("audio", nargs="+", help="audio files to transcribe")
+    parser.add_argument("--quantize", action="store_true", help="int8 dynamic quantization of Linear layers")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    engine = WhisperEngine(quantize=args.quantize, intra_op_threads=args.threads, batch_size=args.batch_size)
+    for audio_path, result in zip(args.audio, engine.transcribe(args.audio)):
+        print(f"{audio_path}: {result['text']}")
+    metrics.print_summary()
@@ -0,0 +1,154 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "GoogleAPIs"))
+from instrumentation import metrics, stage
+
+from whisper_engine import (BATCH_SIZE, MODEL_ID, OVERLAP_SECONDS, SAMPLE_RATE, WINDOW_SECONDS, WhisperEngine,
+                            load_audio, save_mmap_weights, split_windows, stitch_windows)
+
+# Threads per worker; the pool gets cpu_count // THREADS_PER_WORKER workers by default
+THREADS_PER_WORKER = 4
+
+# Set in each worker process by _init_worker
+_engine = None
+
+
+def _init_worker(engine_class, model_id, weights_path, language, threads, batch_size):
+    global _engine
+    _engine = engine_class(model_id, language, intra_op_threads=threads, batch_size=batch_size,
+                           weights_path=weights_path)
+
+
+def _transcribe_spans(samples_path, spans):
+    # The decoded audio is mapped too; each worker only touches the windows it was given
+    samples = np.load(samples_path, mmap_mode="r")
+    return _engine.transcribe_windows([np.array(samples[start:end]) for start, end in spans])
+
+
+class ParallelWhisper:
+    """Transcribes one long recording across a pool of Whisper worker processes.
+
+    The recording is cut into the same overlapping windows as WhisperEngine.transcribe,
+    groups of batch_size windows are fanned out to the workers, and the per-window
+    segments are stitched back together with the same timestamp-aware deduplication.
+    Every worker maps the same weights file, so the model is in memory only once.
+    engine_class is what the workers load; tests pass a stand-in for WhisperEngine.
+    """
+
+    def __init__(self, model_id=MODEL_ID, workers=None, threads_per_worker=None, language="bengali",
+                 batch_size=BATCH_SIZE, engine_class=WhisperEngine, weights_path=None):
+        cpu_count = os.cpu_count() or 1
+        self.workers = workers or max(1, cpu_count // (threads_per_worker or THREADS_PER_WORKER))
+        threads = threads_per_worker or max(1, cpu_count // self.workers)
+        self.batch_size = batch_size
+
+        if weights_path is None:
+            weights_path = save_mmap_weights(model_id)
+        # Forked processes would inherit torch's thread pools; start clean ones
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(engine_class, model_id, weights_path, language, threads, batch_size),
+        )
+        print(f"Started {self.workers} Whisper worker(s) with {threads} thread(s) each")
+
+    def transcribe(self, audio_path):
+        """Returns {"text", "chunks", "duration", "seconds", "rtf"} like WhisperEngine.transcribe."""
+        started = time.perf_counter()
+        samples = load_audio(audio_path)
+        duration = len(samples) / SAMPLE_RATE
+        windows = split_windows(samples)
+        spans = [(int(round(start * SAMPLE_RATE)), int(round(start * SAMPLE_RATE)) + len(window))
+                 for start, window in windows]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            samples_path = os.path.join(temp_dir, "samples.npy")
+            np.save(samples_path, samples)
+            with stage("recognize", backend="whisper", workers=self.workers, windows=len(windows)):
+                groups = [spans[index:index + self.batch_size] for index in range(0, len(spans), self.batch_size)]
+                futures = [self._pool.submit(_transcribe_spans, samples_path, group) for group in groups]
+                window_segments = [segments for future in futures for segments in future.result()]
+
+        with stage("postprocess", backend="whisper"):
+            result = stitch_windows(window_segments, [start for start, _ in windows], duration)
+        seconds = time.perf_counter() - started
+        result.update(duration=duration, seconds=seconds, rtf=seconds / duration if duration else 0.0)
+        print(f"Transcribed {duration:.1f}s of audio in {seconds:.1f}s with {self.workers} worker(s) "
+              f"(real-time factor {result['rtf']:.2f})")
+        return result
+
+    def close(self):
+        self._pool.shutdown()
+
+
+# Compare with single-process output, ignoring the text around window seams
+def seam_times(duration, window_seconds=WINDOW_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    """Times where stitch_windows hands over from one window to the next."""
+    step = window_seconds - overlap_seconds
+    times = []
+    start = 0.0
+    # Same stopping rule as split_windows: the last window reaches the end of the audio
+    while start + window_seconds < duration:
+        start += step
+        times.append(start + overlap_seconds / 2)
+    return times
+
+
+def text_away_from_seams(result, duration, margin=OVERLAP_SECONDS):
+    """Joins the chunks that do not come within margin seconds of a seam."""
+    seams = seam_times(duration)
+    kept = [chunk["text"] for chunk in result["chunks"]
+            if not any(chunk["timestamp"][0] - margin < seam < chunk["timestamp"][1] + margin for seam in seams)]
+    return "".join(kept).strip()
+
+
+def check(audio_path, parallel):
+    """Transcribes audio_path both ways; returns True if they agree away from the seams."""
+    from benchmark import error_counts
+
+    single = WhisperEngine().transcribe([audio_path])[0]
+    result = parallel.transcribe(audio_path)
+    word_edits, words, _, _ = error_counts(single["text"], result["text"])
+    print(f"Single process {single['seconds']:.1f}s, parallel {result['seconds']:.1f}s; "
+          f"full-text WER between them {word_edits / max(words, 1):.3f}")
+
+    expected = text_away_from_seams(single, single["duration"])
+    actual = text_away_from_seams(result, result["duration"])
+    if expected != actual:
+        print("Outputs differ away from the window seams:")
+        print(f"  single:   {expected}")
+        print(f"  parallel: {actual}")
+        return False
+    print("Outputs match away from the window seams")
+    return True
+
+
+if __name__ == "__main__":
+    freeze_support()
+    parser = argparse.ArgumentParser(description="Transcribe a long recording with Whisper across CPU cores")
+    parser.add_argument("audio", nargs="+", help="audio files, each transcribed across the whole pool")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads per worker")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--check", action="store_true",
+                        help="also transcribe in one process and compare the outputs away from the seams")
+    args = parser.parse_args()
+
+    parallel = ParallelWhisper(workers=args.workers, threads_per_worker=args.threads, batch_size=args.batch_size)
+    try:
+        if args.check:
+            sys.exit(0 if all(check(audio_path, parallel) for audio_path in args.audio) else 1)
+        for audio_path in args.audio:
+            print(f"{audio_path}: {parallel.transcribe(audio_path)['text']}")
+    finally:
+        parallel.close()
+        metrics.print_summary()